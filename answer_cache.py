@@ -0,0 +1,128 @@
+import os
+import time
+import uuid
+
+import numpy as np
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.93"))  # Минимальная косинусная близость для попадания | Min cosine similarity for a hit
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))  # Время жизни ответа, с | Answer time to live, s
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2000"))  # Максимум ответов в кэше (0 – выключен) | Max cached answers (0 disables it)
+INGEST_STAMP_COLLECTION = os.getenv("INGEST_STAMP_COLLECTION", "ingest_stamps")  # Коллекция Qdrant с отметками загрузок | Qdrant collection with ingestion stamps
+STAMP_CHECK_INTERVAL = 30.0  # Как часто проверять отметку загрузки, с | How often to check the ingestion stamp, s
+
+
+def stamp_point_id(collection: str) -> str:
+    """
+    Id точки с отметкой загрузки коллекции в INGEST_STAMP_COLLECTION. Отметка хранится
+    в самом Qdrant, поэтому её видят боты в любых контейнерах. |
+    Id of the point holding the collection's ingestion stamp in INGEST_STAMP_COLLECTION.
+    The stamp lives in Qdrant itself, so bots in any container see it.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"ingest-stamp:{collection}"))
+
+
+class SemanticAnswerCache:
+    """
+    Семантический кэш готовых ответов: векторы прошлых вопросов хранятся в матрице,
+    поиск – одно матрично-векторное произведение. Вопрос, близкий к сохранённому
+    (косинус >= threshold), получает сохранённый ответ без вызова LLM.
+    Записи живут ttl секунд, при переполнении вытесняется давно не использованная,
+    при изменении отметки загрузки (set_stamp) кэш очищается.
+
+    |
+
+    Semantic cache of final answers: past question vectors are kept in a matrix and
+    a lookup is a single matrix-vector product. A question close to a stored one
+    (cosine >= threshold) gets the stored answer without calling the LLM.
+    Entries live for ttl seconds, the least recently used one is evicted when full,
+    and the cache is cleared when the ingestion stamp (set_stamp) changes.
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, ttl: float = ANSWER_CACHE_TTL,
+                 max_items: int = ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_items = max_items
+        self._vectors = None  # (max_items, dim), строки нормированы | rows are normalized
+        self._created = np.full(max_items, -np.inf)
+        self._last_used = np.zeros(max_items)
+        self._entries = [None] * max_items  # (ответ, страницы) | (answer, pages)
+        self._stamp = None
+        self._stamp_known = False
+
+        # Счётчики | Counters
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def set_stamp(self, stamp):
+        """
+        Передаёт текущую отметку загрузки; при её изменении кэш очищается. Первая
+        отметка только запоминается. |
+        Passes the current ingestion stamp; the cache is cleared when it changes. The
+        first stamp is only remembered.
+        """
+        if self._stamp_known and stamp == self._stamp:
+            return
+        if self._stamp_known:
+            self.clear()
+            self.invalidations += 1
+        self._stamp, self._stamp_known = stamp, True
+
+    def clear(self):
+        self._created[:] = -np.inf
+        self._entries = [None] * self.max_items
+
+    def _alive(self, now):
+        return self._created > now - self.ttl
+
+    def lookup(self, vector):
+        """
+        Возвращает (ответ, страницы) ближайшего сохранённого вопроса или None. |
+        Returns (answer, pages) of the closest stored question, or None.
+        """
+        if self.max_items <= 0:
+            return None
+        now = time.time()
+        if self._vectors is not None:
+            alive = self._alive(now)
+            if alive.any():
+                query = np.asarray(vector, dtype=np.float32)
+                query = query / (np.linalg.norm(query) or 1.0)
+                scores = self._vectors @ query
+                scores[~alive] = -np.inf
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    self._last_used[best] = now
+                    answer, pages = self._entries[best]
+                    return answer, list(pages)
+        self.misses += 1
+        return None
+
+    def put(self, vector, answer: str, pages):
+        if self.max_items <= 0:
+            return
+        query = np.asarray(vector, dtype=np.float32)
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_items, query.shape[0]), dtype=np.float32)
+        now = time.time()
+        # Свободная или просроченная ячейка, иначе давно не использованная |
+        # A free or expired slot, otherwise the least recently used one
+        dead = np.flatnonzero(~self._alive(now))
+        slot = int(dead[0]) if dead.size else int(np.argmin(self._last_used))
+        self._vectors[slot] = query / (np.linalg.norm(query) or 1.0)
+        self._created[slot] = now
+        self._last_used[slot] = now
+        self._entries[slot] = (answer, tuple(pages))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": int(self._alive(time.time()).sum()),
+            "max_items": self.max_items,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
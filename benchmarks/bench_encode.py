@@ -0,0 +1,80 @@
+"""
+Пропускная способность и задержка POST /encode в зависимости от размера батча
+и числа одновременных клиентов. По умолчанию нужен запущенный embed_server;
+с --stub используется локальная заглушка (проверка самого стенда).
+
+|
+
+POST /encode throughput and latency versus batch size and the number of
+concurrent clients. Needs a running embed_server by default; --stub uses the
+local stand-in instead (checks the harness itself).
+
+    python -m benchmarks.bench_encode --url http://localhost:8080/encode --batch-sizes 1,8,32 --concurrency 1,4,16
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.common import EMBED_PORT, latency_summary, start_app, print_result
+from benchmarks.stubs import embed_stub_app
+from embed_client import ENCODE_HEADERS, encode_payload, decode_embeddings
+
+
+async def measure(client: httpx.AsyncClient, url: str, batch_size: int, concurrency: int, requests_per_client: int):
+    latencies = []
+
+    async def worker(n: int):
+        for i in range(requests_per_client):
+            sentences = [f"Как настроить функцию {n}-{i}-{j}?" for j in range(batch_size)]
+            started = time.perf_counter()
+            response = await client.post(url, headers=ENCODE_HEADERS, content=encode_payload(sentences))
+            response.raise_for_status()
+            decode_embeddings(response.content, response.headers)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "sentences_per_s": len(latencies) * batch_size / elapsed if elapsed > 0 else 0.0,
+        "requests_per_s": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "latency": latency_summary(latencies),
+    }
+
+
+async def run(url: str, batch_sizes, concurrency_levels, requests_per_client: int, stub: bool = False):
+    runner = None
+    if stub:
+        runner = await start_app(embed_stub_app(), EMBED_PORT)
+        url = f"http://127.0.0.1:{EMBED_PORT}/encode"
+    limits = httpx.Limits(max_connections=max(concurrency_levels), max_keepalive_connections=max(concurrency_levels))
+    results = {}
+    try:
+        async with httpx.AsyncClient(timeout=60.0, limits=limits) as client:
+            # Прогрев модели и соединений | Warm up the model and connections
+            await measure(client, url, 1, 1, 3)
+            for batch_size in batch_sizes:
+                for concurrency in concurrency_levels:
+                    results[f"b{batch_size}_c{concurrency}"] = await measure(
+                        client, url, batch_size, concurrency, requests_per_client)
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+    return {"benchmark": "encode", "url": url, "requests_per_client": requests_per_client, "results": results}
+
+
+def int_list(value: str):
+    return [int(v) for v in value.split(",") if v]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест /encode | /encode load test")
+    parser.add_argument("--url", default="http://localhost:8080/encode")
+    parser.add_argument("--batch-sizes", type=int_list, default=[1, 8, 32, 64])
+    parser.add_argument("--concurrency", type=int_list, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=20, help="Запросов на клиента | Requests per client")
+    parser.add_argument("--stub", action="store_true", help="Заглушка вместо embed_server | Stand-in instead of embed_server")
+    args = parser.parse_args()
+    print_result(asyncio.run(run(args.url, args.batch_sizes, args.concurrency, args.requests, args.stub)))
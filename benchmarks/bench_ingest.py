@@ -0,0 +1,69 @@
+"""
+Скорость загрузки load_to_qdrant.ingest против локальных заглушек сервиса
+эмбеддингов и Qdrant с настраиваемой задержкой.
+
+|
+
+load_to_qdrant.ingest rate against local stand-ins for the embedding service
+and Qdrant with configurable latency.
+
+    python -m benchmarks.bench_ingest --records 20000 --batch-size 256 --in-flight 4
+"""
+import argparse
+
+from benchmarks.common import EMBED_PORT, QDRANT_PORT, BackgroundServers, prepare_bot_env, print_result
+from benchmarks.stubs import embed_stub_app, qdrant_stub_app
+from qa_records import QARecord
+
+
+def synthetic_records(records: int):
+    """
+    Генератор записей в том же виде, что и после get_pkl.iter_records. |
+    Generator of records shaped like the output of get_pkl.iter_records.
+    """
+    for i in range(records):
+        yield QARecord(f"Как выполнить операцию {i}?", f"Ответ {i}: " + "описание шага " * 15,
+                       skr=str(i % 300 + 1) if i % 3 == 0 else None)
+
+
+def run(records: int, batch_size: int, max_in_flight: int, embed_latency_ms: float, per_sentence_ms: float,
+        qdrant_latency_ms: float, hybrid: bool = False):
+    prepare_bot_env()
+    import load_to_qdrant  # Импорт после настройки окружения | Imported after the environment is prepared
+
+    apps = [
+        (embed_stub_app(latency_ms=embed_latency_ms, per_sentence_ms=per_sentence_ms), EMBED_PORT),
+        (qdrant_stub_app(latency_ms=qdrant_latency_ms), QDRANT_PORT),
+    ]
+    with BackgroundServers(apps):
+        session = load_to_qdrant.make_session(max_in_flight)
+        sparse_avg_length = None
+        if hybrid:
+            sparse_avg_length = load_to_qdrant.sparse_encoder.average_length(
+                load_to_qdrant.sparse_text(r.question, r.answer) for r in synthetic_records(records))
+        processed, elapsed = load_to_qdrant.ingest(synthetic_records(records), batch_size, max_in_flight, None, session, sparse_avg_length)
+        session.close()
+
+    return {
+        "benchmark": "ingest",
+        "records": processed,
+        "batch_size": batch_size,
+        "in_flight": max_in_flight,
+        "hybrid": hybrid,
+        "elapsed_s": elapsed,
+        "records_per_s": processed / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Скорость загрузки в Qdrant | Qdrant ingestion rate")
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--in-flight", type=int, default=4)
+    parser.add_argument("--embed-latency-ms", type=float, default=5.0)
+    parser.add_argument("--per-sentence-ms", type=float, default=0.2, help="Задержка эмбеддинга на предложение | Per-sentence embedding delay")
+    parser.add_argument("--qdrant-latency-ms", type=float, default=2.0)
+    parser.add_argument("--hybrid", action="store_true")
+    args = parser.parse_args()
+    print_result(run(args.records, args.batch_size, args.in_flight, args.embed_latency_ms, args.per_sentence_ms,
+                     args.qdrant_latency_ms, args.hybrid))
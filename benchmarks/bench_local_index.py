@@ -0,0 +1,96 @@
+"""
+Локальный mmap-индекс (float32 и int8) против поиска в Qdrant на одних и тех же
+синтетических векторах: задержка p50/p99 и полнота top-k относительно точного
+перебора. Без --qdrant-url сравниваются только локальные варианты.
+
+|
+
+The local mmap index (float32 and int8) versus Qdrant search on the same
+synthetic vectors: p50/p99 latency and top-k recall against exact search.
+Without --qdrant-url only the local variants are compared.
+
+    python -m benchmarks.bench_local_index --points 5000 --qdrant-url http://localhost:6333
+"""
+import argparse
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from benchmarks.common import latency_summary, print_result
+from local_index import LocalIndex, SnapshotWriter
+
+BENCH_COLLECTION = "bench_local_index"
+
+
+def synthetic_vectors(points: int, dim: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((points, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def recall(found, truth):
+    return sum(len(set(f) & set(t)) for f, t in zip(found, truth)) / sum(len(t) for t in truth)
+
+
+def measure(search, queries):
+    latencies, found = [], []
+    for query in queries:
+        started = time.perf_counter()
+        ids = search(query)
+        latencies.append(time.perf_counter() - started)
+        found.append(ids)
+    return latencies, found
+
+
+def run(points: int, dim: int, queries: int, limit: int, qdrant_url: str = None):
+    vectors = synthetic_vectors(points, dim)
+    ids = [str(uuid.UUID(int=i + 1)) for i in range(points)]
+    # Запросы – зашумлённые копии точек корпуса | Queries are noisy copies of corpus points
+    rng = np.random.default_rng(1)
+    query_vectors = vectors[rng.choice(points, queries, replace=False)] + 0.05 * rng.standard_normal((queries, dim)).astype(np.float32)
+    truth = [[ids[i] for i in np.argsort(-(vectors @ q))[:limit]] for q in query_vectors]
+    payloads = [{"question": f"Вопрос {i}", "answer": f"Ответ {i}", "skr": None, "skr_2": None} for i in range(points)]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as index_dir:
+        for dtype in ("float32", "int8"):
+            writer = SnapshotWriter(index_dir, dtype)
+            writer.add(ids, vectors, payloads)
+            writer.commit()
+            index = LocalIndex(index_dir)
+            latencies, found = measure(lambda q: [hit.id for hit in index.search(q, limit)], query_vectors)
+            results[f"local_{dtype}"] = {"recall": recall(found, truth), "latency": latency_summary(latencies)}
+
+    if qdrant_url:
+        from qdrant_client import QdrantClient, models
+
+        client = QdrantClient(url=qdrant_url, timeout=60)
+        client.recreate_collection(BENCH_COLLECTION, vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE))
+        try:
+            for start in range(0, points, 1000):
+                client.upsert(BENCH_COLLECTION, points=models.Batch(
+                    ids=ids[start:start + 1000], vectors=vectors[start:start + 1000].tolist()), wait=True)
+            latencies, found = measure(
+                lambda q: [str(p.id) for p in client.query_points(BENCH_COLLECTION, query=q.tolist(), limit=limit,
+                                                                  with_payload=True).points],
+                query_vectors)
+            results["qdrant"] = {"recall": recall(found, truth), "latency": latency_summary(latencies)}
+        finally:
+            client.delete_collection(BENCH_COLLECTION)
+            client.close()
+
+    return {"benchmark": "local_index", "points": points, "dim": dim, "queries": queries, "limit": limit,
+            "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальный индекс против Qdrant | Local index versus Qdrant")
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=3)
+    parser.add_argument("--qdrant-url", help="Реальный Qdrant для сравнения | A real Qdrant to compare with")
+    args = parser.parse_args()
+    print_result(run(args.points, args.dim, args.queries, args.limit, args.qdrant_url))
@@ -0,0 +1,70 @@
+"""
+Пропускная способность потокового разбора get_pkl.iter_records на большом
+синтетическом result.txt (чтение из файла на диске).
+
+|
+
+Throughput of the streaming get_pkl.iter_records parser on a large synthetic
+result.txt (read from a file on disk).
+
+    python -m benchmarks.bench_parse --records 200000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import print_result
+from get_pkl import iter_records
+
+
+def synthetic_text(records: int, seed: int = 0) -> str:
+    """
+    Текст в формате result.txt: вопрос, ответ и 0–3 строки скриншотов на блок. |
+    Text in the result.txt format: a question, an answer and 0–3 screenshot lines per block.
+    """
+    rng = random.Random(seed)
+    blocks = []
+    for i in range(records):
+        lines = [
+            f"Вопрос: Как выполнить операцию номер {i} в клиентском сервисе?",
+            "Ответ: " + " ".join(f"шаг{rng.randint(1, 50)}" for _ in range(rng.randint(10, 60))),
+        ]
+        for suffix in ("", "2", "3")[:rng.randint(0, 3)]:
+            lines.append(f"Скриншот{suffix}: {rng.randint(1, 300)}")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+def run(records: int, repeats: int):
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".txt", delete=False) as f:
+        f.write(synthetic_text(records))
+        path = f.name
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    timings = []
+    try:
+        for _ in range(repeats):
+            started = time.perf_counter()
+            with open(path, "r", encoding="utf-8") as f:
+                parsed = sum(1 for _ in iter_records(f))
+            timings.append(time.perf_counter() - started)
+    finally:
+        os.remove(path)
+    best = min(timings)
+    return {
+        "benchmark": "parse",
+        "records": parsed,
+        "size_mb": size_mb,
+        "best_s": best,
+        "records_per_s": parsed / best if best > 0 else 0.0,
+        "mb_per_s": size_mb / best if best > 0 else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Скорость разбора result.txt | result.txt parsing speed")
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    print_result(run(args.records, args.repeats))
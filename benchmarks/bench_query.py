@@ -0,0 +1,110 @@
+"""
+Полный путь tg_bot.handle_query (эмбеддинг, поиск, LLM, отправка в Telegram)
+против локальных заглушек сервиса эмбеддингов, Qdrant, OpenAI-совместимого API
+и Telegram Bot API с настраиваемой задержкой.
+
+|
+
+The full tg_bot.handle_query path (embedding, search, LLM, sending to Telegram)
+against local stand-ins for the embedding service, Qdrant, an OpenAI-compatible
+API and the Telegram Bot API with configurable latency.
+
+    python -m benchmarks.bench_query --users 20 --requests 5 --llm-latency-ms 300 --stream
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from benchmarks.common import (EMBED_PORT, QDRANT_PORT, LLM_PORT, TELEGRAM_PORT, latency_summary, start_app,
+                               prepare_bot_env, print_result)
+from benchmarks.stubs import embed_stub_app, qdrant_stub_app, openai_stub_app, telegram_stub_app
+
+
+async def run(users: int, requests_per_user: int, embed_latency_ms: float, qdrant_latency_ms: float,
+              llm_latency_ms: float, token_interval_ms: float, telegram_latency_ms: float, stream: bool):
+    telegram_app = telegram_stub_app(latency_ms=telegram_latency_ms)
+    runners = [
+        await start_app(embed_stub_app(latency_ms=embed_latency_ms), EMBED_PORT),
+        # Без страниц: скриншоты требуют настоящего PDF | No pages: screenshots need a real PDF
+        await start_app(qdrant_stub_app(latency_ms=qdrant_latency_ms, with_pages=False), QDRANT_PORT),
+        await start_app(openai_stub_app(latency_ms=llm_latency_ms, token_interval_ms=token_interval_ms), LLM_PORT),
+        await start_app(telegram_app, TELEGRAM_PORT),
+    ]
+    prepare_bot_env()
+
+    # Импорт после настройки окружения | Imported after the environment is prepared
+    import tg_bot
+    from aiogram import types
+    from aiogram.fsm.context import FSMContext
+    from aiogram.fsm.storage.base import StorageKey
+    from aiogram.fsm.storage.memory import MemoryStorage
+
+    # Режим читается при каждом запросе, поэтому его можно менять между прогонами |
+    # The mode is read on every request, so it can change between runs
+    tg_bot.STREAM_RESPONSES = stream
+
+    storage = MemoryStorage()
+    await tg_bot.init_clients()
+    latencies = []
+    failures = 0
+
+    async def user(n: int):
+        nonlocal failures
+        chat_id = 100000 + n
+        state = FSMContext(storage=storage, key=StorageKey(bot_id=tg_bot.bot.id, chat_id=chat_id, user_id=chat_id))
+        for i in range(requests_per_user):
+            question = f"Как настроить функцию {n}-{i}?"
+            message = types.Message(
+                message_id=i + 1,
+                date=datetime.now(),
+                chat=types.Chat(id=chat_id, type="private"),
+                from_user=types.User(id=chat_id, is_bot=False, first_name="Benchmark"),
+                text=question,
+            ).as_(tg_bot.bot)
+            started = time.perf_counter()
+            await tg_bot.handle_query(message, state)
+            latencies.append(time.perf_counter() - started)
+            # handle_query сообщает об ошибках пользователю, успех виден по истории |
+            # handle_query reports errors to the user, success shows up in the history
+            history = (await state.get_data()).get("history", [])
+            if not history or history[-1]["user"] != question:
+                failures += 1
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(user(n) for n in range(users)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await tg_bot.close_clients()
+        await tg_bot.bot.session.close()
+        await storage.close()
+        for runner in runners:
+            await runner.cleanup()
+
+    return {
+        "benchmark": "query",
+        "users": users,
+        "requests_per_user": requests_per_user,
+        "stream": stream,
+        "llm_latency_ms": llm_latency_ms,
+        "failures": failures,
+        "throughput_rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "latency": latency_summary(latencies),
+        "telegram_calls": dict(telegram_app["calls"]),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест handle_query | handle_query load test")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--embed-latency-ms", type=float, default=5.0)
+    parser.add_argument("--qdrant-latency-ms", type=float, default=2.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Задержка до первого токена | Time to first token")
+    parser.add_argument("--token-interval-ms", type=float, default=5.0)
+    parser.add_argument("--telegram-latency-ms", type=float, default=30.0)
+    parser.add_argument("--stream", action="store_true", help="Потоковый режим ответа | Streaming answer mode")
+    args = parser.parse_args()
+    print_result(asyncio.run(run(args.users, args.requests, args.embed_latency_ms, args.qdrant_latency_ms,
+                                 args.llm_latency_ms, args.token_interval_ms, args.telegram_latency_ms, args.stream)))
@@ -0,0 +1,65 @@
+"""
+Нагрузочный тест tg_bot.rag: N одновременных пользователей против локальных
+заглушек сервиса эмбеддингов и Qdrant. Выводит p50/p99 задержки в JSON.
+
+|
+
+Load test for tg_bot.rag: N simultaneous users against local stand-ins for the
+embedding service and Qdrant. Prints p50/p99 latency as JSON.
+
+    python -m benchmarks.bench_rag_concurrency --users 50 --requests 20
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import latency_summary, start_app, prepare_bot_env, print_result
+from benchmarks.stubs import embed_stub_app, qdrant_stub_app
+
+
+async def run(users: int, requests_per_user: int, embed_latency_ms: float, qdrant_latency_ms: float, port_base: int):
+    embed_runner = await start_app(embed_stub_app(latency_ms=embed_latency_ms), port_base)
+    qdrant_runner = await start_app(qdrant_stub_app(latency_ms=qdrant_latency_ms), port_base + 1)
+    prepare_bot_env(f"http://127.0.0.1:{port_base}/encode", f"http://127.0.0.1:{port_base + 1}")
+
+    import tg_bot  # Импорт после настройки окружения | Imported after the environment is prepared
+
+    await tg_bot.init_clients()
+    latencies = []
+
+    async def user(n: int):
+        for i in range(requests_per_user):
+            started = time.perf_counter()
+            await tg_bot.rag(f"Как настроить функцию {n}-{i}?")
+            latencies.append(time.perf_counter() - started)
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(user(n) for n in range(users)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await tg_bot.close_clients()
+        await tg_bot.bot.session.close()
+        await embed_runner.cleanup()
+        await qdrant_runner.cleanup()
+
+    return {
+        "benchmark": "rag_concurrency",
+        "users": users,
+        "requests_per_user": requests_per_user,
+        "embed_latency_ms": embed_latency_ms,
+        "qdrant_latency_ms": qdrant_latency_ms,
+        "throughput_rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "latency": latency_summary(latencies),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест rag() | rag() load test")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--embed-latency-ms", type=float, default=5.0)
+    parser.add_argument("--qdrant-latency-ms", type=float, default=2.0)
+    parser.add_argument("--port-base", type=int, default=18080)
+    args = parser.parse_args()
+    print_result(asyncio.run(run(args.users, args.requests, args.embed_latency_ms, args.qdrant_latency_ms, args.port_base)))
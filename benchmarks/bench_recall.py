@@ -0,0 +1,121 @@
+"""
+Полнота против задержки для настроек поиска Qdrant на реальной коллекции.
+Запросами служат зашумлённые копии векторов случайной выборки точек коллекции
+(сами сохранённые векторы находились бы первыми и завышали полноту), эталон –
+точный перебор (exact=True). Для каждого hnsw_ef и режима пересчёта (rescore)
+считаются recall@k и p50/p99 задержки – по ним выбираются SEARCH_HNSW_EF и
+SEARCH_RESCORE для бота и профиль коллекции для load_to_qdrant.py.
+
+|
+
+Recall versus latency for Qdrant search settings on a real collection.
+Queries are noisy copies of the vectors of a random sample of collection points
+(the stored vectors themselves would be found first and inflate recall), ground
+truth is brute force (exact=True). For every hnsw_ef and rescoring mode, recall@k and
+p50/p99 latency are measured – use them to pick SEARCH_HNSW_EF and
+SEARCH_RESCORE for the bot and the collection profile for load_to_qdrant.py.
+
+    python -m benchmarks.bench_recall --queries 200 --ef 16,32,64,128,256
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from benchmarks.common import latency_summary, print_result
+
+
+def sample_vectors(client: QdrantClient, collection: str, count: int, vector_name: str = None, seed: int = 0):
+    """
+    Читает векторы точек коллекции и возвращает случайную выборку из count штук. |
+    Reads collection point vectors and returns a random sample of count of them.
+    """
+    vectors = []
+    offset = None
+    while True:
+        points, offset = client.scroll(collection, limit=1000, offset=offset, with_payload=False, with_vectors=True)
+        for point in points:
+            vector = point.vector[vector_name] if vector_name else point.vector
+            vectors.append(vector)
+        if offset is None:
+            break
+    random.Random(seed).shuffle(vectors)
+    return vectors[:count]
+
+
+def perturb(vectors, noise: float, seed: int = 0):
+    """
+    Нормированные зашумлённые копии: косинус с исходным ≈ 1/√(1+noise²). |
+    Normalized noisy copies: cosine with the original ≈ 1/√(1+noise²).
+    """
+    rng = np.random.default_rng(seed)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix += rng.standard_normal(matrix.shape).astype(np.float32) * (noise / np.sqrt(matrix.shape[1]))
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix.tolist()
+
+
+def search_ids(client, collection, vector, limit, params, vector_name):
+    response = client.query_points(collection, query=vector, using=vector_name, limit=limit,
+                                   search_params=params, with_payload=False)
+    return [point.id for point in response.points]
+
+
+def run(url: str, collection: str, queries: int, limit: int, ef_values, oversampling: float, vector_name: str = None,
+        noise: float = 0.5):
+    client = QdrantClient(url=url, timeout=60)
+    vectors = perturb(sample_vectors(client, collection, queries, vector_name), noise)
+    exact = models.SearchParams(exact=True)
+    truth = [set(search_ids(client, collection, v, limit, exact, vector_name)) for v in vectors]
+
+    results = {}
+    for rescore in (True, False):
+        for ef in ef_values:
+            params = models.SearchParams(
+                hnsw_ef=ef,
+                quantization=models.QuantizationSearchParams(rescore=rescore, oversampling=oversampling),
+            )
+            latencies = []
+            found = 0
+            for vector, expected in zip(vectors, truth):
+                started = time.perf_counter()
+                ids = search_ids(client, collection, vector, limit, params, vector_name)
+                latencies.append(time.perf_counter() - started)
+                found += len(expected.intersection(ids))
+            total = sum(len(expected) for expected in truth)
+            results[f"ef{ef}_{'rescore' if rescore else 'norescore'}"] = {
+                "hnsw_ef": ef,
+                "rescore": rescore,
+                "recall": found / total if total else 0.0,
+                "latency": latency_summary(latencies),
+            }
+    client.close()
+
+    return {
+        "benchmark": "recall",
+        "collection": collection,
+        "queries": len(vectors),
+        "limit": limit,
+        "oversampling": oversampling,
+        "noise": noise,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Полнота и задержка поиска Qdrant | Qdrant search recall and latency")
+    parser.add_argument("--url", default="http://localhost:6333")
+    parser.add_argument("--collection", default="Client_bd")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=3, help="k для recall@k (как SEARCH_LIMIT бота) | k for recall@k (as the bot's SEARCH_LIMIT)")
+    parser.add_argument("--ef", default="16,32,64,128,256", help="Значения hnsw_ef через запятую | Comma-separated hnsw_ef values")
+    parser.add_argument("--oversampling", type=float, default=2.0)
+    parser.add_argument("--vector-name", help="Имя плотного вектора гибридной коллекции (dense) | Dense vector name of a hybrid collection (dense)")
+    parser.add_argument("--noise", type=float, default=0.5, help="Шум запросов: 0.5 – косинус с точкой ≈ 0.89 | Query noise: 0.5 – cosine with the point ≈ 0.89")
+    args = parser.parse_args()
+    ef_values = [int(v) for v in args.ef.split(",") if v]
+    print_result(run(args.url, args.collection, args.queries, args.limit, ef_values, args.oversampling, args.vector_name,
+                     args.noise))
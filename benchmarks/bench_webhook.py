@@ -0,0 +1,225 @@
+"""
+Нагрузочный тест режима webhook: webhook.py с разным числом воркеров против
+заглушек сервиса эмбеддингов, Qdrant, LLM и Telegram. Генератор поддельных
+обновлений шлёт сообщения многих чатов параллельно (сообщения одного чата – по
+порядку, как Telegram). Готовность и порядок проверяются по общему хранилищу
+FSM (sqlite): последний вопрос каждого чата должен оказаться в его истории,
+а вопросы в истории – идти по возрастанию.
+
+|
+
+Webhook mode load test: webhook.py with different worker counts against stand-ins
+for the embedding service, Qdrant, the LLM and Telegram. A fake update generator
+sends messages of many chats concurrently (messages of one chat in order, like
+Telegram). Completion and ordering are checked in the shared FSM storage (sqlite):
+the last question of every chat must reach its history, and the questions in the
+history must be increasing.
+
+webhook.py делит LLM_MAX_IN_FLIGHT (--llm-in-flight) между воркерами, поэтому
+прогоны с разным числом воркеров сравниваются при одной общей конкуренции LLM. |
+webhook.py splits LLM_MAX_IN_FLIGHT (--llm-in-flight) across workers, so runs with
+different worker counts are compared at the same total LLM concurrency.
+
+    python -m benchmarks.bench_webhook --workers 1,2,4 --chats 200 --messages 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from aiohttp import ClientError, ClientSession
+
+from benchmarks.common import (EMBED_PORT, QDRANT_PORT, LLM_PORT, TELEGRAM_PORT, BackgroundServers, prepare_bot_env,
+                               print_result)
+from benchmarks.stubs import embed_stub_app, qdrant_stub_app, openai_stub_app, telegram_stub_app
+
+ROUTER_PORT = int(os.getenv("BENCH_WEBHOOK_PORT", "18090"))
+WORKER_PORT = int(os.getenv("BENCH_WEBHOOK_WORKER_PORT", "18100"))
+SECRET = "benchmark-secret"
+FIRST_CHAT_ID = 200000
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def question(chat_id: int, i: int) -> str:
+    return f"Вопрос {chat_id}-{i}"
+
+
+def fake_updates(chat_id: int, messages: int, first_update_id: int):
+    """
+    Поддельные обновления Telegram с текстовыми сообщениями одного чата. |
+    Fake Telegram updates with text messages of one chat.
+    """
+    for i in range(messages):
+        yield {
+            "update_id": first_update_id + i,
+            "message": {
+                "message_id": i + 1,
+                "date": int(datetime.now().timestamp()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "Benchmark"},
+                "text": question(chat_id, i),
+            },
+        }
+
+
+def read_histories(path: str):
+    # Ключ: fsm:<bot_id>:<chat_id>:<user_id>:<destiny> | Key: fsm:<bot_id>:<chat_id>:<user_id>:<destiny>
+    try:
+        conn = sqlite3.connect(path, timeout=30.0)
+        try:
+            rows = conn.execute("SELECT key, data FROM fsm").fetchall()
+        finally:
+            conn.close()
+    except sqlite3.OperationalError:
+        return {}
+    return {int(key.split(":")[2]): json.loads(data).get("history", []) for key, data in rows}
+
+
+def history_questions(history):
+    # Склеенные сообщения хранятся через перевод строки | Merged messages are stored newline-separated
+    return [int(line.rsplit("-", 1)[1]) for turn in history for line in turn["user"].split("\n")]
+
+
+async def wait_ready(session: ClientSession, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            async with session.get(f"http://127.0.0.1:{ROUTER_PORT}/healthz") as response:
+                if response.status == 200:
+                    return
+        except ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError("webhook.py не запустился | webhook.py did not start")
+
+
+async def run_once(workers: int, chats: int, messages: int, connections: int, timeout: float, env: dict,
+                   telegram_calls: dict):
+    state_path = os.path.join(tempfile.mkdtemp(prefix="bench_webhook_"), "fsm.sqlite3")
+    process = subprocess.Popen(
+        [sys.executable, "webhook.py", "--workers", str(workers), "--host", "127.0.0.1",
+         "--port", str(ROUTER_PORT), "--worker-port", str(WORKER_PORT)],
+        cwd=PROJECT_DIR,
+        env={**env, "FSM_STORAGE": "sqlite", "FSM_SQLITE_PATH": state_path},
+    )
+    calls_before = dict(telegram_calls)
+    rejected = 0
+    try:
+        async with ClientSession() as session:
+            await wait_ready(session, 60.0)
+            url = f"http://127.0.0.1:{ROUTER_PORT}/webhook"
+            slots = asyncio.Semaphore(connections)
+
+            async def chat(n: int):
+                # Telegram доставляет обновления чата по одному | Telegram delivers a chat's updates one at a time
+                nonlocal rejected
+                chat_id = FIRST_CHAT_ID + n
+                for update in fake_updates(chat_id, messages, n * messages):
+                    async with slots:
+                        async with session.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as response:
+                            if response.status != 200:
+                                rejected += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(chat(n) for n in range(chats)))
+            delivered = time.perf_counter() - started
+
+            # Ждём, пока последний вопрос каждого чата попадёт в историю | Wait until every chat's last question reaches its history
+            expected = {FIRST_CHAT_ID + n for n in range(chats)}
+            deadline = started + timeout
+            while True:
+                histories = await asyncio.to_thread(read_histories, state_path)
+                done = {chat_id for chat_id in expected
+                        if histories.get(chat_id) and history_questions(histories[chat_id])[-1] == messages - 1}
+                if done == expected or time.perf_counter() > deadline:
+                    break
+                await asyncio.sleep(0.1)
+            elapsed = time.perf_counter() - started
+
+            async with session.get(f"http://127.0.0.1:{ROUTER_PORT}/stats") as response:
+                router_stats = await response.json()
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    out_of_order = sum(
+        1 for chat_id in done
+        if history_questions(histories[chat_id]) != sorted(set(history_questions(histories[chat_id])))
+    )
+    return {
+        "workers": workers,
+        "updates": chats * messages,
+        "completed_chats": len(done),
+        "out_of_order_chats": out_of_order,
+        "rejected_updates": rejected,
+        "delivery_updates_per_s": chats * messages / delivered if delivered > 0 else 0.0,
+        "throughput_updates_per_s": chats * messages / elapsed if elapsed > 0 else 0.0,
+        "forwarded_per_worker": router_stats["forwarded"],
+        "telegram_calls": {name: count - calls_before.get(name, 0) for name, count in telegram_calls.items()},
+    }
+
+
+def run(worker_counts, chats: int, messages: int, connections: int, llm_latency_ms: float,
+        token_interval_ms: float, telegram_latency_ms: float, llm_in_flight: int, timeout: float):
+    prepare_bot_env()
+    env = {
+        **os.environ,
+        "WEBHOOK_SECRET": SECRET,
+        "LLM_MAX_IN_FLIGHT": str(llm_in_flight),
+        # Очередь не должна отвечать «занято»: измеряем обработку | The queue must not reply "busy": processing is measured
+        "QUEUE_MAX_PENDING": str(chats * messages),
+        "QUEUE_MAX_PER_CHAT": str(messages),
+        "ANSWER_CACHE_SIZE": "0",
+        "METRICS_ENABLED": "0",
+    }
+    env.pop("WEBHOOK_URL", None)
+
+    telegram_app = telegram_stub_app(latency_ms=telegram_latency_ms)
+    results = []
+    with BackgroundServers([
+        (embed_stub_app(), EMBED_PORT),
+        # Без страниц: скриншоты требуют настоящего PDF | No pages: screenshots need a real PDF
+        (qdrant_stub_app(with_pages=False), QDRANT_PORT),
+        (openai_stub_app(latency_ms=llm_latency_ms, token_interval_ms=token_interval_ms), LLM_PORT),
+        (telegram_app, TELEGRAM_PORT),
+    ]):
+        for workers in worker_counts:
+            results.append(asyncio.run(run_once(workers, chats, messages, connections, timeout, env,
+                                                telegram_app["calls"])))
+
+    base = results[0]["throughput_updates_per_s"]
+    for result in results:
+        result["speedup"] = result["throughput_updates_per_s"] / base if base > 0 else 0.0
+    return {
+        "benchmark": "webhook",
+        "chats": chats,
+        "messages_per_chat": messages,
+        "llm_latency_ms": llm_latency_ms,
+        # webhook.py делит лимит между воркерами: все прогоны при одной общей конкуренции LLM |
+        # webhook.py splits the limit across workers: every run has the same total LLM concurrency
+        "llm_max_in_flight_total": llm_in_flight,
+        "runs": {f"workers_{r['workers']}": r for r in results},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест webhook.py | webhook.py load test")
+    parser.add_argument("--workers", default="1,2,4", help="Число воркеров через запятую | Comma-separated worker counts")
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=3, help="Сообщений на чат | Messages per chat")
+    parser.add_argument("--connections", type=int, default=40, help="Параллельных доставок, как max_connections | Concurrent deliveries, like max_connections")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--token-interval-ms", type=float, default=2.0)
+    parser.add_argument("--telegram-latency-ms", type=float, default=30.0)
+    parser.add_argument("--llm-in-flight", type=int, default=32, help="Общий LLM_MAX_IN_FLIGHT на все воркеры | Total LLM_MAX_IN_FLIGHT across workers")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+    print_result(run([int(w) for w in args.workers.split(",")], args.chats, args.messages, args.connections,
+                     args.llm_latency_ms, args.token_interval_ms, args.telegram_latency_ms, args.llm_in_flight,
+                     args.timeout))
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import os
+import statistics
+import threading
+
+from aiohttp import web
+
+# Порты локальных заглушек | Local stand-in ports
+EMBED_PORT = int(os.getenv("BENCH_EMBED_PORT", "18080"))
+QDRANT_PORT = int(os.getenv("BENCH_QDRANT_PORT", "18081"))
+LLM_PORT = int(os.getenv("BENCH_LLM_PORT", "18082"))
+TELEGRAM_PORT = int(os.getenv("BENCH_TELEGRAM_PORT", "18083"))
+
+
+def latency_summary(samples):
+    """
+    Сводка задержек в миллисекундах: p50/p90/p99, среднее, максимум. |
+    Latency summary in milliseconds: p50/p90/p99, mean, max.
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(q):
+        return 1000.0 * ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "p50_ms": percentile(0.50),
+        "p90_ms": percentile(0.90),
+        "p99_ms": percentile(0.99),
+        "mean_ms": 1000.0 * statistics.fmean(ordered),
+        "max_ms": 1000.0 * ordered[-1],
+    }
+
+
+async def start_app(app: web.Application, port: int, host: str = "127.0.0.1"):
+    """
+    Запускает aiohttp-приложение в текущем event loop; возвращает runner для остановки. |
+    Starts an aiohttp app in the current event loop; returns the runner for cleanup.
+    """
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+class BackgroundServers:
+    """
+    Запускает заглушки в отдельном потоке со своим event loop, чтобы их могли
+    вызывать и синхронный (requests), и асинхронный код бенчмарка. |
+    Runs stand-ins in a separate thread with its own event loop so both sync
+    (requests) and async benchmark code can call them.
+
+        with BackgroundServers([(embed_stub_app(), EMBED_PORT)]):
+            ...
+    """
+
+    def __init__(self, apps):
+        self.apps = apps
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._runners = []
+
+    def __enter__(self):
+        self._thread.start()
+        for app, port in self.apps:
+            runner = asyncio.run_coroutine_threadsafe(start_app(app, port), self._loop).result()
+            self._runners.append(runner)
+        return self
+
+    def __exit__(self, *exc):
+        for runner in self._runners:
+            asyncio.run_coroutine_threadsafe(runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def prepare_bot_env(embed_url: str = None, qdrant_url: str = None):
+    """
+    Направляет tg_bot и load_to_qdrant на локальные заглушки. Вызывать до их импорта. |
+    Points tg_bot and load_to_qdrant at local stand-ins. Call before importing them.
+    """
+    os.environ["FASTAPI_EMBED_URL"] = embed_url or f"http://127.0.0.1:{EMBED_PORT}/encode"
+    os.environ["QDRANT_URL"] = qdrant_url or f"http://127.0.0.1:{QDRANT_PORT}"
+    os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{LLM_PORT}/v1/"
+    os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{TELEGRAM_PORT}"
+    os.environ.setdefault("CLS_BOT_TOKEN", "123456789:BENCHMARK-FAKE-TOKEN")
+    os.environ.setdefault("HYP_HB_API", "benchmark")
+
+
+def print_result(result: dict):
+    print(json.dumps(result, ensure_ascii=False, indent=2))
@@ -0,0 +1,159 @@
+"""
+Запуск набора бенчмарков с выводом в JSON (с хэшем коммита) и режимом проверки
+регрессий относительно сохранённого результата.
+
+|
+
+Runs the benchmark suite, writes JSON (with the commit hash) and optionally
+checks for regressions against a saved result.
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --baseline bench.json --threshold 0.15
+    python -m benchmarks.run --only parse,ingest
+    python -m benchmarks.run --only encode --encode-url http://localhost:8080/encode
+
+Код выхода 1, если хотя бы одна метрика хуже базовой больше чем на threshold
+или в прогоне есть ошибки (failures > 0). |
+Exit code 1 if any metric is worse than the baseline by more than threshold
+or the run has errors (failures > 0).
+
+Бенчмарк encode меряет настоящий embed_server и выполняется только с --encode-url. |
+The encode benchmark measures a real embed_server and only runs with --encode-url.
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+
+from benchmarks.common import EMBED_PORT, prepare_bot_env, print_result
+
+# bench_encode импортирует embed_client, который читает FASTAPI_EMBED_URL при импорте: окружение настраивается раньше |
+# bench_encode imports embed_client, which reads FASTAPI_EMBED_URL at import: the environment is prepared first
+prepare_bot_env()
+
+from benchmarks import (bench_parse, bench_encode, bench_ingest, bench_query, bench_rag_concurrency,  # noqa: E402
+                        bench_local_index, bench_webhook, bench_dedup)
+
+DEFAULT_THRESHOLD = 0.10  # Допустимое ухудшение метрики (доля) | Allowed metric degradation (fraction)
+HIGHER_IS_BETTER = ("_per_s", "_rps")  # Пропускная способность | Throughput
+LOWER_IS_BETTER = ("p50_ms", "p99_ms")  # Задержки (только внутри "latency") | Latencies (only inside "latency")
+FAILURE_KEYS = ("failures", "rejected_updates", "out_of_order_chats")  # Любое ненулевое значение – регрессия | Any non-zero value is a regression
+
+# Набор с параметрами по умолчанию: небольшой, чтобы прогон занимал около минуты |
+# The suite with default parameters: small enough for a run of about a minute
+SUITE = {
+    "parse": lambda args: bench_parse.run(records=100000, repeats=3),
+    # Настоящий embed_server по --encode-url, не заглушка | A real embed_server at --encode-url, not the stand-in
+    "encode": lambda args: asyncio.run(bench_encode.run(args.encode_url, [1, 16, 64], [1, 8], 10)),
+    "ingest": lambda args: bench_ingest.run(10000, 256, 4, 5.0, 0.2, 2.0),
+    "rag_concurrency": lambda args: asyncio.run(bench_rag_concurrency.run(50, 10, 5.0, 2.0, EMBED_PORT)),
+    "query": lambda args: asyncio.run(bench_query.run(20, 3, 5.0, 2.0, 300.0, 5.0, 30.0, stream=False)),
+    "query_stream": lambda args: asyncio.run(bench_query.run(20, 3, 5.0, 2.0, 300.0, 5.0, 30.0, stream=True)),
+    "local_index": lambda args: bench_local_index.run(5000, 384, 300, 3),
+    "dedup": lambda args: bench_dedup.run(20000, 384, ["exact", "lsh"]),
+    "webhook": lambda args: bench_webhook.run([1, 2], 100, 2, 40, 300.0, 2.0, 30.0, 32, 120.0),
+}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(value, prefix=""):
+    """
+    Превращает вложенный результат в {"suite.latency.p50_ms": число, ...}. |
+    Flattens a nested result into {"suite.latency.p50_ms": number, ...}.
+    """
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(flatten(item, f"{prefix}.{key}" if prefix else key))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: float(value)}
+    return {}
+
+
+def direction(key: str):
+    # +1 – больше лучше, -1 – меньше лучше, 0 – не сравниваем | +1 higher is better, -1 lower is better, 0 not compared
+    if key.endswith(HIGHER_IS_BETTER):
+        return 1
+    if ".latency." in key and key.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def compare(current: dict, baseline: dict, threshold: float):
+    """
+    Возвращает список регрессий: метрики, ухудшившиеся больше чем на threshold,
+    и ненулевые счётчики ошибок текущего прогона. |
+    Returns the list of regressions: metrics that got worse by more than threshold
+    and non-zero error counters of the current run.
+    """
+    current_flat = flatten(current["results"])
+    baseline_flat = flatten(baseline["results"])
+    regressions = [
+        {"metric": key, "baseline": baseline_flat.get(key, 0.0), "current": value, "change": None}
+        for key, value in current_flat.items()
+        if key.rsplit(".", 1)[-1] in FAILURE_KEYS and value > 0
+    ]
+    for key, base in baseline_flat.items():
+        sign = direction(key)
+        if sign == 0 or key not in current_flat or base <= 0:
+            continue
+        change = (current_flat[key] - base) / base * sign
+        if change < -threshold:
+            regressions.append({"metric": key, "baseline": base, "current": current_flat[key], "change": change})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Набор бенчмарков | Benchmark suite")
+    parser.add_argument("--only", help=f"Через запятую из: {', '.join(SUITE)} | Comma-separated subset")
+    parser.add_argument("--output", help="Сохранить результат в JSON | Save the result as JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения | Previous run JSON to compare with")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Допустимое ухудшение, доля (0.10 = 10%%) | Allowed degradation, fraction (0.10 = 10%%)")
+    parser.add_argument("--encode-url", help="POST /encode запущенного embed_server | POST /encode of a running embed_server")
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(SUITE)
+    unknown = [name for name in names if name not in SUITE]
+    if unknown:
+        parser.error(f"Неизвестные бенчмарки | Unknown benchmarks: {unknown}")
+    if "encode" in names and not args.encode_url:
+        if args.only:
+            parser.error("Для encode нужен --encode-url | encode needs --encode-url")
+        print("encode пропущен: нет --encode-url | encode skipped: no --encode-url", file=sys.stderr)
+        names.remove("encode")
+
+    report = {"commit": git_commit(), "timestamp": time.time(), "results": {}}
+    for name in names:
+        print(f"Бенчмарк | Benchmark: {name}", file=sys.stderr)
+        report["results"][name] = SUITE[name](args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    print_result(report)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for r in regressions:
+            change = "ошибки | errors" if r["change"] is None else f"{r['change']:+.1%}"
+            print(f"Регрессия | Regression: {r['metric']}: {r['baseline']:.3f} -> {r['current']:.3f} ({change})",
+                  file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"Регрессий нет (порог {args.threshold:.0%}) | No regressions (threshold {args.threshold:.0%})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
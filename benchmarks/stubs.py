@@ -0,0 +1,229 @@
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+from aiohttp import web
+
+
+def _sleep_ms(latency_ms: float):
+    return asyncio.sleep(latency_ms / 1000.0) if latency_ms > 0 else asyncio.sleep(0)
+
+
+def embed_stub_app(dim: int = 384, latency_ms: float = 5.0, per_sentence_ms: float = 0.0) -> web.Application:
+    """
+    Заглушка embed_server: POST /encode отдаёт случайные нормированные векторы
+    в бинарном формате (как embed_server с Accept: application/octet-stream). |
+    embed_server stand-in: POST /encode returns random normalized vectors in
+    the binary format (as embed_server with Accept: application/octet-stream).
+    """
+    rng = np.random.default_rng(0)
+
+    async def encode(request: web.Request):
+        body = await request.json()
+        count = len(body["sentences"])
+        await _sleep_ms(latency_ms + per_sentence_ms * count)
+        vectors = rng.standard_normal((count, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return web.Response(
+            body=vectors.tobytes(),
+            content_type="application/octet-stream",
+            headers={"X-Embedding-Shape": f"{count},{dim}", "X-Embedding-Dtype": "float32"},
+        )
+
+    app = web.Application()
+    app.router.add_post("/encode", encode)
+    return app
+
+
+def fake_payload(i: int, with_pages: bool = True) -> dict:
+    return {
+        "question": f"Вопрос номер {i}?",
+        "answer": f"Ответ номер {i}: " + "текст инструкции " * 20,
+        "skr": str(i % 50 + 1) if with_pages and i % 3 == 0 else None,
+        "skr_2": None,
+    }
+
+
+def qdrant_stub_app(latency_ms: float = 2.0, points: int = 1000, with_pages: bool = True) -> web.Application:
+    """
+    Заглушка REST API Qdrant: создание коллекции, upsert/count/scroll для загрузки
+    и поиск (search и query), возвращающий случайные точки. Коллекция существует
+    сразу – с неименованным плотным вектором, как после загрузки без --hybrid. |
+    Qdrant REST API stand-in: collection creation, upsert/count/scroll for ingestion
+    and a search (search and query) returning random points. The collection exists
+    from the start with an unnamed dense vector, as after an ingest without --hybrid.
+    """
+    stored = {}
+    params = {"vectors": {"size": 384, "distance": "Cosine"}, "shard_number": 1, "replication_factor": 1,
+              "write_consistency_factor": 1, "on_disk_payload": True}
+
+    def ok(result):
+        return web.json_response({"result": result, "status": "ok", "time": latency_ms / 1000.0})
+
+    async def root(request: web.Request):
+        return web.json_response({"title": "qdrant - vector search engine", "version": "1.13.0"})
+
+    async def create_collection(request: web.Request):
+        body = await request.json()
+        await _sleep_ms(latency_ms)
+        params.update({key: body[key] for key in ("vectors", "sparse_vectors") if key in body})
+        if "sparse_vectors" not in body:
+            params.pop("sparse_vectors", None)
+        return ok(True)
+
+    async def update_collection(request: web.Request):
+        await _sleep_ms(latency_ms)
+        return ok(True)
+
+    async def collection_exists(request: web.Request):
+        return ok({"exists": request.match_info["name"] == "Client_bd"})
+
+    async def collection_info(request: web.Request):
+        # Поля, обязательные для CollectionInfo qdrant-client | Fields required by qdrant-client's CollectionInfo
+        return ok({
+            "status": "green",
+            "optimizer_status": "ok",
+            "points_count": len(stored) or points,
+            "indexed_vectors_count": 0,
+            "segments_count": 1,
+            "config": {
+                "params": params,
+                "hnsw_config": {"m": 16, "ef_construct": 100, "full_scan_threshold": 10000, "max_indexing_threads": 0,
+                                "on_disk": False},
+                "optimizer_config": {"deleted_threshold": 0.2, "vacuum_min_vector_number": 1000,
+                                     "default_segment_number": 0, "max_segment_size": None, "memmap_threshold": None,
+                                     "indexing_threshold": 20000, "flush_interval_sec": 5,
+                                     "max_optimization_threads": None},
+                "wal_config": {"wal_capacity_mb": 32, "wal_segments_ahead": 0},
+                "quantization_config": None,
+            },
+            "payload_schema": {},
+        })
+
+    async def upsert(request: web.Request):
+        body = await request.json()
+        await _sleep_ms(latency_ms)
+        for point in body["points"]:
+            stored[str(point["id"])] = point.get("payload")
+        return ok({"operation_id": len(stored), "status": "acknowledged"})
+
+    async def count(request: web.Request):
+        return ok({"count": len(stored)})
+
+    async def scroll(request: web.Request):
+        return ok({"points": [], "next_page_offset": None})
+
+    def random_points(limit: int):
+        ids = random.sample(range(points), min(limit, points))
+        return [
+            {"id": i, "version": 0, "score": 1.0 - n * 0.01, "payload": fake_payload(i, with_pages)}
+            for n, i in enumerate(ids)
+        ]
+
+    async def search(request: web.Request):
+        body = await request.json()
+        await _sleep_ms(latency_ms)
+        return ok(random_points(body.get("limit", 10)))
+
+    async def query(request: web.Request):
+        body = await request.json()
+        await _sleep_ms(latency_ms)
+        return ok({"points": random_points(body.get("limit", 10))})
+
+    app = web.Application(client_max_size=256 * 1024 * 1024)
+    app.router.add_get("/", root)
+    app.router.add_get("/collections/{name}", collection_info)
+    app.router.add_get("/collections/{name}/exists", collection_exists)
+    app.router.add_put("/collections/{name}", create_collection)
+    app.router.add_patch("/collections/{name}", update_collection)
+    app.router.add_put("/collections/{name}/points", upsert)
+    app.router.add_post("/collections/{name}/points/count", count)
+    app.router.add_post("/collections/{name}/points/scroll", scroll)
+    app.router.add_post("/collections/{name}/points/search", search)
+    app.router.add_post("/collections/{name}/points/query", query)
+    return app
+
+
+def openai_stub_app(latency_ms: float = 500.0, answer_words: int = 150, token_interval_ms: float = 10.0) -> web.Application:
+    """
+    Заглушка OpenAI-совместимого API: POST /v1/completions, в том числе потоковый
+    (SSE) режим. latency_ms – задержка до первого токена. |
+    OpenAI-compatible API stand-in: POST /v1/completions, including the streaming
+    (SSE) mode. latency_ms is the delay before the first token.
+    """
+    words = [f"слово{i} " for i in range(answer_words)]
+
+    def completion(text, finish_reason=None, usage=None):
+        body = {
+            "id": "cmpl-benchmark",
+            "object": "text_completion",
+            "created": int(time.time()),
+            "model": "benchmark",
+            "choices": [{"text": text, "index": 0, "logprobs": None, "finish_reason": finish_reason}],
+        }
+        if usage is not None:
+            body["usage"] = usage
+        return body
+
+    async def completions(request: web.Request):
+        body = await request.json()
+        prompt_tokens = len(body.get("prompt", "")) // 3
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": answer_words, "total_tokens": prompt_tokens + answer_words}
+        await _sleep_ms(latency_ms)
+        if not body.get("stream"):
+            await _sleep_ms(token_interval_ms * answer_words)
+            return web.json_response(completion("Ответ:\n" + "".join(words), "stop", usage))
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for word in ["Ответ:\n"] + words:
+            await response.write(f"data: {json.dumps(completion(word), ensure_ascii=False)}\n\n".encode("utf-8"))
+            await _sleep_ms(token_interval_ms)
+        await response.write(f"data: {json.dumps(completion('', 'stop', usage))}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/completions", completions)
+    return app
+
+
+def telegram_stub_app(latency_ms: float = 30.0) -> web.Application:
+    """
+    Заглушка Telegram Bot API (/bot<token>/<method>): sendMessage, editMessageText,
+    sendPhoto, sendChatAction, sendDocument. Считает вызовы по методам. |
+    Telegram Bot API stand-in (/bot<token>/<method>): sendMessage, editMessageText,
+    sendPhoto, sendChatAction, sendDocument. Counts calls per method.
+    """
+    counter = {"message_id": 0}
+    calls = {}
+
+    async def method(request: web.Request):
+        name = request.match_info["method"]
+        calls[name] = calls.get(name, 0) + 1
+        fields = await request.post()
+        await _sleep_ms(latency_ms)
+        if name == "sendChatAction":
+            return web.json_response({"ok": True, "result": True})
+        counter["message_id"] += 1
+        message = {
+            "message_id": int(fields.get("message_id") or counter["message_id"]),
+            "date": int(time.time()),
+            "chat": {"id": int(fields.get("chat_id", 0)), "type": "private"},
+        }
+        if name == "sendPhoto":
+            message["photo"] = [{"file_id": f"photo-{counter['message_id']}", "file_unique_id": f"u{counter['message_id']}",
+                                 "width": 800, "height": 1100}]
+        elif name == "sendDocument":
+            message["document"] = {"file_id": f"doc-{counter['message_id']}", "file_unique_id": f"d{counter['message_id']}"}
+        else:
+            message["text"] = fields.get("text", "")
+        return web.json_response({"ok": True, "result": message})
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app["calls"] = calls
+    app.router.add_post("/bot{token}/{method}", method)
+    return app
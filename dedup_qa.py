@@ -0,0 +1,308 @@
+"""
+Поиск и слияние почти одинаковых пар вопрос-ответ перед загрузкой в Qdrant.
+
+get_qua.py генерирует вопросы постранично по перекрывающемуся тексту, поэтому
+в result.jsonl много почти одинаковых вопросов. Этап между get_pkl.py и
+load_to_qdrant.py:
+  1. эмбеддинги всех вопросов батчами через сервис эмбеддингов;
+  2. пары с косинусной близостью не ниже порога – блочными матричными
+     произведениями (exact) или через LSH по случайным гиперплоскостям (lsh)
+     для больших корпусов; память O(N·d + блок²), а не O(N²);
+  3. кластеры (union-find) сливаются в одну запись: остаётся ответ с самым
+     полным текстом, страницы скриншотов объединяются;
+  4. отчёт о слиянии – JSONL, одна строка на кластер.
+
+|
+
+Finding and merging near-duplicate question-answer pairs before loading into Qdrant.
+
+get_qua.py generates questions page by page over overlapping text, so result.jsonl
+holds many near-identical questions. A stage between get_pkl.py and load_to_qdrant.py:
+  1. embeddings of all questions in batches via the embedding service;
+  2. pairs with cosine similarity at or above the threshold – blocked matrix
+     products (exact) or random-hyperplane LSH (lsh) for large corpora;
+     memory is O(N·d + block²), not O(N²);
+  3. clusters (union-find) are merged into one record: the answer with the
+     fullest text is kept, screenshot pages are united;
+  4. a merge report – JSONL, one line per cluster.
+
+    python dedup_qa.py --input result.jsonl --output result.dedup.jsonl --report dedup_report.jsonl
+    python load_to_qdrant.py --input result.dedup.jsonl
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import requests
+
+from embed_client import FASTAPI_EMBED_URL, ENCODE_HEADERS, encode_payload, decode_embeddings
+from qa_records import PAGE_FIELDS, QARecord, read_jsonl, write_jsonl
+
+DEFAULT_THRESHOLD = 0.92  # Косинусная близость вопросов-дубликатов | Cosine similarity of duplicate questions
+EMBED_BATCH_SIZE = 256  # Вопросов на один вызов эмбеддингов | Questions per embedding call
+BLOCK_SIZE = 2048  # Строк в блоке произведения (блок 2048×2048 float32 – 16 МБ) | Rows per product block (a 2048×2048 float32 block is 16 MB)
+EXACT_MAX_RECORDS = 20000  # До этого размера method=auto сравнивает все пары | Up to this size method=auto compares all pairs
+LSH_TABLES = 32  # Хэш-таблиц LSH: больше – выше полнота, дольше | LSH hash tables: more – higher recall, slower
+LSH_BITS = 16  # Гиперплоскостей на таблицу: больше – меньше кандидатов | Hyperplanes per table: more – fewer candidates
+METHODS = ("auto", "exact", "lsh")
+
+
+class UnionFind:
+    """
+    Непересекающиеся множества со сжатием путей. Корень – наименьший индекс
+    множества, поэтому кластер стоит на месте своей первой записи. |
+    Disjoint sets with path compression. The root is the smallest index of the
+    set, so a cluster stays at the position of its first record.
+    """
+
+    __slots__ = ("parent",)
+
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, i: int) -> int:
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, a: int, b: int) -> bool:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return False
+        if root_a < root_b:
+            self.parent[root_b] = root_a
+        else:
+            self.parent[root_a] = root_b
+        return True
+
+    def labels(self):
+        return [self.find(i) for i in range(len(self.parent))]
+
+
+def embed_questions(questions, batch_size: int = EMBED_BATCH_SIZE, session=None):
+    """
+    Нормированные эмбеддинги вопросов (N×d float32), батчами по batch_size. |
+    Normalized question embeddings (N×d float32), in batches of batch_size.
+    """
+    session = session or requests
+    vectors = None
+    for start in range(0, len(questions), batch_size):
+        r = session.post(FASTAPI_EMBED_URL, headers=ENCODE_HEADERS,
+                         data=encode_payload(questions[start:start + batch_size]))
+        r.raise_for_status()
+        batch = decode_embeddings(r.content, r.headers)
+        if vectors is None:
+            vectors = np.empty((len(questions), batch.shape[1]), dtype=np.float32)
+        vectors[start:start + len(batch)] = batch
+    if vectors is None:
+        return np.empty((0, 0), dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors
+
+
+def _union_similar(vectors, index, threshold: float, uf: UnionFind, block_size: int) -> int:
+    """
+    Сравнивает все пары строк index блоками block_size×block_size и объединяет
+    пары не ниже порога. Возвращает число сравнений. |
+    Compares all pairs of the index rows in block_size×block_size blocks and unites
+    pairs at or above the threshold. Returns the number of comparisons.
+    """
+    comparisons = 0
+    for i in range(0, len(index), block_size):
+        rows = index[i:i + block_size]
+        left = vectors[rows]
+        # Только верхний треугольник: блоки j >= i | Upper triangle only: blocks j >= i
+        for j in range(i, len(index), block_size):
+            cols = index[j:j + block_size]
+            sims = left @ vectors[cols].T
+            comparisons += sims.size
+            r, c = np.nonzero(sims >= threshold)
+            if i == j:
+                keep = r < c
+                r, c = r[keep], c[keep]
+            for a, b in zip(rows[r].tolist(), cols[c].tolist()):
+                uf.union(a, b)
+    return comparisons
+
+
+def _lsh_codes(vectors, tables: int, bits: int, block_size: int, seed: int):
+    # Знак проекции на случайную гиперплоскость – один бит; bits бит – код таблицы |
+    # The sign of a projection on a random hyperplane is one bit; bits bits make a table code
+    rng = np.random.default_rng(seed)
+    planes = rng.standard_normal((vectors.shape[1], tables * bits)).astype(np.float32)
+    weights = 1 << np.arange(bits, dtype=np.int64)
+    codes = np.empty((len(vectors), tables), dtype=np.int64)
+    for start in range(0, len(vectors), block_size):
+        signs = (vectors[start:start + block_size] @ planes) > 0
+        codes[start:start + block_size] = signs.reshape(-1, tables, bits).astype(np.int64) @ weights
+    return codes
+
+
+def _union_lsh(vectors, threshold: float, uf: UnionFind, block_size: int, tables: int, bits: int, seed: int) -> int:
+    """
+    Кандидаты – записи с одинаковым кодом хотя бы в одной таблице; каждый кандидат
+    проверяется точной косинусной близостью. |
+    Candidates are records sharing a code in at least one table; every candidate is
+    verified with the exact cosine similarity.
+    """
+    codes = _lsh_codes(vectors, tables, bits, block_size, seed)
+    comparisons = 0
+    for t in range(tables):
+        order = np.argsort(codes[:, t], kind="stable")
+        bounds = np.flatnonzero(np.diff(codes[order, t])) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(order)]))
+        for start, end in zip(starts[ends - starts > 1].tolist(), ends[ends - starts > 1].tolist()):
+            bucket = order[start:end]
+            # Корзина уже целиком в одном кластере | The bucket is already in one cluster
+            if len({uf.find(i) for i in bucket.tolist()}) == 1:
+                continue
+            comparisons += _union_similar(vectors, bucket, threshold, uf, block_size)
+    return comparisons
+
+
+def find_duplicates(vectors, threshold: float = DEFAULT_THRESHOLD, method: str = "auto", block_size: int = BLOCK_SIZE,
+                    tables: int = LSH_TABLES, bits: int = LSH_BITS, seed: int = 0):
+    """
+    Кластеры почти одинаковых векторов. Возвращает (метка кластера для каждой
+    строки – индекс первой строки кластера, статистика). |
+    Clusters of near-identical vectors. Returns (the cluster label of every row –
+    the index of the cluster's first row, stats).
+    """
+    if method not in METHODS:
+        raise ValueError(f"Неизвестный метод | Unknown method: {method}")
+    if method == "auto":
+        method = "exact" if len(vectors) <= EXACT_MAX_RECORDS else "lsh"
+    uf = UnionFind(len(vectors))
+    if method == "exact":
+        comparisons = _union_similar(vectors, np.arange(len(vectors)), threshold, uf, block_size)
+    else:
+        comparisons = _union_lsh(vectors, threshold, uf, block_size, tables, bits, seed)
+    return uf.labels(), {"method": method, "comparisons": comparisons}
+
+
+def merge_clusters(records, labels, vectors):
+    """
+    Сливает каждый кластер в одну запись на месте его первой записи:
+      - вопрос и ответ – записи с самым длинным ответом;
+      - страницы – объединение страниц кластера (сначала страницы оставленной
+        записи): первые три в полях skr…skr_3, все – в поле pages, если их больше.
+    Возвращает (записи, отчёт).
+
+    |
+
+    Merges every cluster into one record at the position of its first record:
+      - question and answer – of the record with the longest answer;
+      - pages – the union of the cluster's pages (the kept record's pages first):
+        the first three in the skr…skr_3 fields, all of them in the pages field
+        when there are more.
+    Returns (records, report).
+    """
+    clusters = {}
+    for i, label in enumerate(labels):
+        clusters.setdefault(label, []).append(i)
+
+    merged = []
+    report = []
+    for members in clusters.values():
+        if len(members) == 1:
+            merged.append(records[members[0]])
+            continue
+        keep = max(members, key=lambda i: (len(records[i].answer), -i))
+        pages = []
+        for i in [keep] + [m for m in members if m != keep]:
+            for page in records[i].all_pages():
+                if page not in pages:
+                    pages.append(page)
+        kept = records[keep]
+        merged.append(QARecord(kept.question, kept.answer, **dict(zip(PAGE_FIELDS, pages)),
+                               pages=pages if len(pages) > len(PAGE_FIELDS) else None))
+
+        similarity = vectors[members] @ vectors[keep]
+        report.append({
+            "kept": kept.question,
+            "merged": [
+                {"question": records[m].question, "similarity": round(float(s), 4)}
+                for m, s in zip(members, similarity.tolist()) if m != keep
+            ],
+            "pages": pages,
+        })
+    return merged, report
+
+
+def questions_hash(questions) -> str:
+    digest = hashlib.sha1()
+    for question in questions:
+        digest.update(question.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def load_vectors(records, cache_path: str = None, batch_size: int = EMBED_BATCH_SIZE):
+    """
+    Эмбеддинги вопросов; с cache_path сохраняются в .npy и переиспользуются при
+    повторном запуске с другим порогом. Рядом хранится хэш списка вопросов
+    (<cache_path>.sha1): при любом изменении result.jsonl эмбеддинги пересчитываются. |
+    Question embeddings; with cache_path they are saved to .npy and reused when
+    re-running with another threshold. A hash of the question list is kept next to it
+    (<cache_path>.sha1): any change of result.jsonl recomputes the embeddings.
+    """
+    if cache_path and not cache_path.endswith(".npy"):
+        cache_path += ".npy"  # np.save добавляет расширение сам | np.save appends the extension itself
+    questions = [r.question for r in records]
+    digest = questions_hash(questions)
+    hash_path = f"{cache_path}.sha1"
+    if cache_path and os.path.exists(cache_path):
+        stored = None
+        if os.path.exists(hash_path):
+            with open(hash_path, "r", encoding="utf-8") as f:
+                stored = f.read().strip()
+        if stored == digest:
+            return np.load(cache_path, mmap_mode="r")
+        print(f"{cache_path}: вопросы изменились, эмбеддинги пересчитываются | "
+              f"{cache_path}: questions changed, recomputing embeddings")
+    vectors = embed_questions(questions, batch_size)
+    if cache_path:
+        np.save(cache_path, vectors)
+        with open(hash_path, "w", encoding="utf-8") as f:
+            f.write(digest)
+    return vectors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Слияние почти одинаковых вопросов | Merging near-duplicate questions")
+    parser.add_argument("--input", default="./result.jsonl", help="JSONL-файл из get_pkl.py | JSONL file from get_pkl.py")
+    parser.add_argument("--output", default="./result.dedup.jsonl")
+    parser.add_argument("--report", default="./dedup_report.jsonl", help="Отчёт о слиянии | Merge report")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--method", choices=METHODS, default="auto",
+                        help=f"auto: exact до {EXACT_MAX_RECORDS} записей, иначе lsh | auto: exact up to {EXACT_MAX_RECORDS} records, lsh otherwise")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE)
+    parser.add_argument("--lsh-tables", type=int, default=LSH_TABLES)
+    parser.add_argument("--lsh-bits", type=int, default=LSH_BITS)
+    parser.add_argument("--vectors-cache", help="Файл .npy для эмбеддингов вопросов | .npy file for question embeddings")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    records = list(read_jsonl(args.input))
+    vectors = load_vectors(records, args.vectors_cache)
+    embedded = time.perf_counter()
+    labels, stats = find_duplicates(vectors, args.threshold, args.method, args.block_size, args.lsh_tables, args.lsh_bits)
+    searched = time.perf_counter()
+    merged, report = merge_clusters(records, labels, vectors)
+
+    write_jsonl(merged, args.output)
+    with open(args.report, "w", encoding="utf-8") as f:
+        for entry in report:
+            f.write(json.dumps(entry, ensure_ascii=False))
+            f.write("\n")
+
+    print(f"Записей | Records: {len(records)} -> {len(merged)} "
+          f"(кластеров | clusters: {len(report)}, удалено | removed: {len(records) - len(merged)})")
+    print(f"Эмбеддинги | Embeddings: {embedded - started:.1f} s, "
+          f"поиск | search ({stats['method']}, {stats['comparisons']} сравнений | comparisons): {searched - embedded:.1f} s")
@@ -0,0 +1,48 @@
+import io
+import json
+import os
+
+import numpy as np
+
+FASTAPI_EMBED_URL = os.getenv("FASTAPI_EMBED_URL", "http://127.0.0.1:8080/encode")  # Адрес сервиса эмбеддингов | Embeddings service URL
+EMBED_DTYPE = os.getenv("EMBED_DTYPE", "float32")  # Тип передаваемых векторов: float32 или float16 | Wire dtype: float32 or float16
+
+NPY_MEDIA_TYPE = "application/x-npy"
+RAW_MEDIA_TYPE = "application/octet-stream"
+
+# Заголовки запроса к /encode: просим сырой бинарный буфер вместо JSON |
+# Request headers for /encode: ask for a raw binary buffer instead of JSON
+ENCODE_HEADERS = {"Content-Type": "application/json", "Accept": RAW_MEDIA_TYPE}
+
+
+def encode_payload(sentences):
+    """
+    Тело запроса к /encode. |
+    Request body for /encode.
+    """
+    return json.dumps({"sentences": sentences, "dtype": EMBED_DTYPE})
+
+
+def decode_embeddings(content: bytes, headers) -> np.ndarray:
+    """
+    Декодирует ответ /encode в матрицу float32 формы (n, dim) без создания
+    Python-объекта на каждое число. Поддерживает сырой буфер, .npy и JSON.
+
+    |
+
+    Decodes an /encode response into a float32 matrix of shape (n, dim) without
+    creating a Python object per float. Supports raw buffer, .npy and JSON.
+    """
+    content_type = headers.get("content-type", "")
+    if content_type.startswith(RAW_MEDIA_TYPE):
+        shape = tuple(int(n) for n in headers["x-embedding-shape"].split(","))
+        dtype = np.dtype(headers.get("x-embedding-dtype", "float32"))
+        embeddings = np.frombuffer(content, dtype=dtype).reshape(shape)
+    elif content_type.startswith(NPY_MEDIA_TYPE):
+        embeddings = np.load(io.BytesIO(content), allow_pickle=False)
+    else:
+        # Старый JSON-формат (сервер без поддержки бинарного ответа) | Legacy JSON format (server without binary support)
+        embeddings = np.asarray(json.loads(content)["embeddings"], dtype=np.float32)
+    if embeddings.dtype != np.float32:
+        embeddings = embeddings.astype(np.float32)
+    return embeddings
@@ -0,0 +1,82 @@
+import os
+
+from sentence_transformers import SentenceTransformer
+
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")  # torch | onnx | onnx-int8
+EMBED_INTRA_OP_THREADS = int(os.getenv("EMBED_INTRA_OP_THREADS", "0"))  # Потоков внутри операции (0 – по умолчанию) | Intra-op threads (0 – default)
+EMBED_INTER_OP_THREADS = int(os.getenv("EMBED_INTER_OP_THREADS", "0"))  # Потоков между операциями (0 – по умолчанию) | Inter-op threads (0 – default)
+EMBED_ONNX_DIR = os.getenv("EMBED_ONNX_DIR", "./onnx_models")  # Каталог для экспортированных int8-моделей | Directory for exported int8 models
+EMBED_QUANTIZATION = os.getenv("EMBED_QUANTIZATION", "avx2")  # Профиль квантования: avx2 | avx512 | avx512_vnni | arm64 | Quantization profile
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def _onnx_model_kwargs(intra_op_threads: int, inter_op_threads: int, file_name: str = None):
+    import onnxruntime as ort
+
+    session_options = ort.SessionOptions()
+    if intra_op_threads > 0:
+        session_options.intra_op_num_threads = intra_op_threads
+    if inter_op_threads > 0:
+        session_options.inter_op_num_threads = inter_op_threads
+    kwargs = {"provider": "CPUExecutionProvider", "session_options": session_options}
+    if file_name:
+        kwargs["file_name"] = file_name
+    return kwargs
+
+
+def _quantized_model_path(model_name: str, onnx_dir: str, quantization: str):
+    """
+    Экспортирует динамически квантованную int8 ONNX-модель один раз и возвращает
+    (каталог модели, имя файла внутри него). |
+    Exports a dynamically quantized int8 ONNX model once and returns
+    (model directory, file name inside it).
+    """
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    local_dir = os.path.join(onnx_dir, model_name.replace("/", "__"))
+    file_name = f"onnx/model_qint8_{quantization}.onnx"
+    if not os.path.exists(os.path.join(local_dir, file_name)):
+        fp32 = SentenceTransformer(model_name, backend="onnx", device="cpu")
+        fp32.save(local_dir)
+        export_dynamic_quantized_onnx_model(fp32, quantization, local_dir)
+    return local_dir, file_name
+
+
+def load_model(model_name: str, backend: str = EMBED_BACKEND,
+               intra_op_threads: int = EMBED_INTRA_OP_THREADS, inter_op_threads: int = EMBED_INTER_OP_THREADS,
+               onnx_dir: str = EMBED_ONNX_DIR, quantization: str = EMBED_QUANTIZATION) -> SentenceTransformer:
+    """
+    Загружает модель эмбеддингов с выбранным бэкендом инференса на CPU:
+      - torch – исходный PyTorch (fp32);
+      - onnx – экспорт в ONNX Runtime (fp32);
+      - onnx-int8 – ONNX с динамическим квантованием весов в int8.
+    Количество потоков задаётся явно для каждого бэкенда.
+
+    |
+
+    Loads the embedding model with the selected CPU inference backend:
+      - torch – the original PyTorch model (fp32);
+      - onnx – an ONNX Runtime export (fp32);
+      - onnx-int8 – ONNX with weights dynamically quantized to int8.
+    Thread counts are set explicitly for every backend.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {BACKENDS}")
+
+    if backend == "torch":
+        import torch
+
+        if intra_op_threads > 0:
+            torch.set_num_threads(intra_op_threads)
+        if inter_op_threads > 0:
+            torch.set_num_interop_threads(inter_op_threads)
+        return SentenceTransformer(model_name, device="cpu")
+
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx", device="cpu",
+                                   model_kwargs=_onnx_model_kwargs(intra_op_threads, inter_op_threads))
+
+    local_dir, file_name = _quantized_model_path(model_name, onnx_dir, quantization)
+    return SentenceTransformer(local_dir, backend="onnx", device="cpu",
+                               model_kwargs=_onnx_model_kwargs(intra_op_threads, inter_op_threads, file_name))
@@ -0,0 +1,225 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Нормализует текст для ключа кэша: Unicode NFC, схлопывание пробелов, обрезка краёв.
+    Токенизатор модели делит по пробелам, поэтому такие тексты дают одинаковый вектор.
+
+    |
+
+    Normalizes text for the cache key: Unicode NFC, collapsed whitespace, stripped ends.
+    The model tokenizer splits on whitespace, so such texts produce the same vector.
+    """
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model_name: str, text: str) -> str:
+    """
+    Ключ кэша: hash(имя модели + нормализованный текст). |
+    Cache key: hash(model name + normalized text).
+    """
+    return hashlib.sha1(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class DiskStore:
+    """
+    Постоянное хранилище векторов: матрица float32 в memory-mapped файле
+    (vectors.f32) и журнал индекса (index.tsv, строки "ключ<TAB>номер строки").
+    Вектор записывается раньше строки индекса, поэтому после падения в индексе
+    нет ссылок на незаписанные строки.
+
+    |
+
+    Persistent vector store: a float32 matrix in a memory-mapped file
+    (vectors.f32) plus an index log (index.tsv, lines "key<TAB>row").
+    The vector is written before its index line, so after a crash the index
+    never points at unwritten rows.
+
+    Каталог принадлежит одному процессу (flock на файле lock): второй процесс
+    получит ошибку, а не перезапишет чужие строки. |
+    The directory belongs to one process (flock on the lock file): a second process
+    gets an error instead of overwriting another process's rows.
+    """
+
+    def __init__(self, path: str, dim: int, initial_capacity: int = 1024):
+        self.path = path
+        self.dim = dim
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = open(os.path.join(path, "lock"), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise RuntimeError(
+                f"Кэш {path} уже открыт другим процессом | Cache {path} is already open in another process"
+            ) from None
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._index_path = os.path.join(path, "index.tsv")
+        meta_path = os.path.join(path, "meta.json")
+
+        # При смене размерности старое хранилище непригодно – начинаем заново |
+        # A dimensionality change makes the old store unusable – start over
+        meta = {"dim": dim}
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                if json.load(f) != meta:
+                    for p in (self._vectors_path, self._index_path):
+                        if os.path.exists(p):
+                            os.remove(p)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        self._index = {}
+        if os.path.exists(self._index_path):
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) == 2:
+                        self._index[parts[0]] = int(parts[1])
+        self._size = max(self._index.values(), default=-1) + 1
+
+        existing_rows = 0
+        if os.path.exists(self._vectors_path):
+            existing_rows = os.path.getsize(self._vectors_path) // (4 * dim)
+        self._capacity = max(existing_rows, initial_capacity, self._size)
+        self._open(self._capacity)
+        self._index_file = open(self._index_path, "a", encoding="utf-8")
+
+    def _open(self, capacity):
+        # Растягиваем файл до нужной ёмкости и отображаем его в память | Grow the file to capacity and map it
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._capacity = capacity
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, key):
+        row = self._index.get(key)
+        if row is None:
+            return None
+        return np.array(self._vectors[row])
+
+    def put_many(self, keys, vectors):
+        new = [(k, v) for k, v in zip(keys, vectors) if k not in self._index]
+        if not new:
+            return
+        if self._size + len(new) > self._capacity:
+            self._vectors.flush()
+            del self._vectors
+            self._open(max(self._capacity * 2, self._size + len(new)))
+        rows = range(self._size, self._size + len(new))
+        for row, (_, vector) in zip(rows, new):
+            self._vectors[row] = vector
+        self._vectors.flush()
+        for row, (key, _) in zip(rows, new):
+            self._index[key] = row
+            self._index_file.write(f"{key}\t{row}\n")
+        self._index_file.flush()
+        self._size += len(new)
+
+    def close(self):
+        self._vectors.flush()
+        self._index_file.close()
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+
+
+class EmbeddingCache:
+    """
+    Кэш эмбеддингов по содержимому: ограниченный LRU в памяти и необязательный
+    постоянный уровень на диске (DiskStore). Промах в памяти проверяется на диске,
+    найденный там вектор поднимается в LRU.
+
+    |
+
+    Content-addressed embedding cache: a bounded in-memory LRU plus an optional
+    persistent on-disk tier (DiskStore). An in-memory miss is looked up on disk,
+    and a vector found there is promoted into the LRU.
+    """
+
+    def __init__(self, model_name: str, dim: int, max_items: int, disk_path: str = None):
+        self.model_name = model_name
+        self.dim = dim
+        self.max_items = max_items
+        self._lru = OrderedDict()
+        self._disk = DiskStore(disk_path, dim) if disk_path else None
+
+        # Счётчики | Counters
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        vector = self._lru.get(key)
+        if vector is not None:
+            self._lru.move_to_end(key)
+            return vector
+        if self._disk is not None:
+            vector = self._disk.get(key)
+            if vector is not None:
+                self.disk_hits += 1
+                self._remember(key, vector)
+        return vector
+
+    def _remember(self, key, vector):
+        if self.max_items <= 0:
+            return
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_items:
+            self._lru.popitem(last=False)
+
+    def lookup(self, texts):
+        """
+        Возвращает матрицу (n, dim) с найденными векторами, ключи текстов и
+        индексы промахов, которые нужно отправить в модель. |
+        Returns a (n, dim) matrix filled with found vectors, the text keys and
+        the indices of misses that must go to the model.
+        """
+        keys = [cache_key(self.model_name, t) for t in texts]
+        result = np.empty((len(texts), self.dim), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(keys):
+            vector = self._get(key)
+            if vector is None:
+                missing.append(i)
+            else:
+                result[i] = vector
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return result, keys, missing
+
+    def store(self, keys, vectors):
+        for key, vector in zip(keys, vectors):
+            self._remember(key, np.array(vector, dtype=np.float32))
+        if self._disk is not None:
+            self._disk.put_many(keys, vectors)
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "max_items": self.max_items,
+            "memory_items": len(self._lru),
+            "disk_items": len(self._disk) if self._disk is not None else 0,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
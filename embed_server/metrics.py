@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+
+EMBED_METRICS_ENABLED = os.getenv("EMBED_METRICS_ENABLED", "0") == "1"  # Метрики Prometheus на /metrics | Prometheus metrics on /metrics
+EMBED_SLOW_BATCH_MS = float(os.getenv("EMBED_SLOW_BATCH_MS", "500"))  # Порог журнала медленных батчей, мс | Slow batch log threshold, ms
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+slow_batch_log = logging.getLogger("embed_server.slow_batch")
+
+_batch_seconds = None
+_batch_sentences = None
+_queue_wait_seconds = None
+_requests_total = None
+_cache_lookups_total = None
+
+
+def _init_metrics():
+    global _batch_seconds, _batch_sentences, _queue_wait_seconds, _requests_total, _cache_lookups_total
+    from prometheus_client import Counter, Histogram
+
+    _batch_seconds = Histogram("embed_batch_seconds", "model.encode time per micro-batch", buckets=LATENCY_BUCKETS)
+    _batch_sentences = Histogram("embed_batch_sentences", "Sentences per micro-batch", buckets=BATCH_SIZE_BUCKETS)
+    _queue_wait_seconds = Histogram("embed_queue_wait_seconds", "Time a request waits in the batching queue",
+                                    buckets=LATENCY_BUCKETS)
+    _requests_total = Counter("embed_requests_total", "Encode requests by outcome", ["outcome"])
+    _cache_lookups_total = Counter("embed_cache_lookups_total", "Embedding cache lookups by result", ["result"])
+
+
+if EMBED_METRICS_ENABLED:
+    _init_metrics()
+
+
+def observe_batch(sentences: int, queue_waits, encode_seconds: float):
+    """
+    Метрики одного микробатча; медленный батч пишется в журнал одной JSON-строкой. |
+    Metrics of one micro-batch; a slow batch is logged as a single JSON line.
+    """
+    if not EMBED_METRICS_ENABLED:
+        return
+    _batch_seconds.observe(encode_seconds)
+    _batch_sentences.observe(sentences)
+    for wait in queue_waits:
+        _queue_wait_seconds.observe(wait)
+    if encode_seconds * 1000.0 >= EMBED_SLOW_BATCH_MS:
+        slow_batch_log.warning(json.dumps({
+            "sentences": sentences,
+            "requests": len(queue_waits),
+            "encode_ms": round(encode_seconds * 1000.0, 1),
+            "max_queue_wait_ms": round(max(queue_waits, default=0.0) * 1000.0, 1),
+        }))
+
+
+def observe_request(outcome: str):
+    if EMBED_METRICS_ENABLED:
+        _requests_total.labels(outcome).inc()
+
+
+def observe_cache(hits: int, misses: int):
+    if EMBED_METRICS_ENABLED:
+        _cache_lookups_total.labels("hit").inc(hits)
+        _cache_lookups_total.labels("miss").inc(misses)
+
+
+def render_latest():
+    """
+    Текст метрик в формате Prometheus. При нескольких процессах (run_workers.py)
+    с PROMETHEUS_MULTIPROC_DIR метрики всех воркеров собираются вместе. |
+    Metrics text in the Prometheus format. With several processes (run_workers.py)
+    and PROMETHEUS_MULTIPROC_DIR, metrics of all workers are aggregated.
+    """
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
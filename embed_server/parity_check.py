@@ -0,0 +1,59 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from backends import BACKENDS, load_model
+
+SAMPLE_SENTENCES = [
+    "Как сменить пароль в личном кабинете?",
+    "Где посмотреть историю заказов клиента?",
+    "Что делать, если при входе появляется ошибка 403?",
+    "Как выгрузить отчёт в Excel?",
+    "Как добавить нового пользователя и назначить ему роль?",
+    "Почему не приходит письмо с подтверждением регистрации?",
+    "How do I reset the API token?",
+    "Где находится кнопка «Сохранить изменения» в настройках профиля?",
+]
+
+
+def encode_timed(model, sentences, batch_size: int, repeats: int):
+    embeddings = model.encode(sentences, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        model.encode(sentences, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+    per_batch_ms = 1000.0 * (time.perf_counter() - started) / repeats
+    return np.asarray(embeddings, dtype=np.float32), per_batch_ms
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Сравнение бэкендов с эталоном torch fp32 по косинусной близости | Compare backends against the torch fp32 reference by cosine similarity"
+    )
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--backends", default=",".join(BACKENDS[1:]))
+    parser.add_argument("--sentences", help="Файл с предложениями, по одному в строке | File with one sentence per line")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    sentences = SAMPLE_SENTENCES
+    if args.sentences:
+        with open(args.sentences, "r", encoding="utf-8") as f:
+            sentences = [line.strip() for line in f if line.strip()]
+
+    reference, reference_ms = encode_timed(load_model(args.model, "torch"), sentences, args.batch_size, args.repeats)
+    report = {"model": args.model, "sentences": len(sentences), "torch": {"batch_ms": reference_ms}}
+    for backend in args.backends.split(","):
+        embeddings, batch_ms = encode_timed(load_model(args.model, backend), sentences, args.batch_size, args.repeats)
+        # Векторы нормированы, косинус – скалярное произведение строк | Vectors are normalized, cosine is the row dot product
+        cosine = np.sum(embeddings * reference, axis=1)
+        report[backend] = {
+            "batch_ms": batch_ms,
+            "speedup": reference_ms / batch_ms if batch_ms else 0.0,
+            "cosine_mean": float(cosine.mean()),
+            "cosine_min": float(cosine.min()),
+            "cosine_p5": float(np.percentile(cosine, 5)),
+        }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
@@ -0,0 +1,66 @@
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+
+
+def core_slices(worker_count: int, cores=None):
+    """
+    Делит доступные ядра на worker_count непересекающихся групп. |
+    Splits the available cores into worker_count disjoint groups.
+    """
+    cores = sorted(cores if cores is not None else os.sched_getaffinity(0))
+    per_worker = max(1, len(cores) // worker_count)
+    return [cores[i * per_worker:(i + 1) * per_worker] or cores for i in range(worker_count)]
+
+
+def _serve(sock: socket.socket, cores, log_level: str, index: int):
+    # Привязываем процесс к своим ядрам до загрузки модели | Pin the process to its cores before loading the model
+    os.sched_setaffinity(0, cores)
+    # У каждого процесса свой дисковый кэш: файлы DiskStore не рассчитаны на общих писателей |
+    # Every process gets its own disk cache: DiskStore files do not support shared writers
+    if os.getenv("EMBED_CACHE_DIR"):
+        os.environ["EMBED_CACHE_DIR"] = os.path.join(os.environ["EMBED_CACHE_DIR"], f"worker-{index}")
+    os.environ.setdefault("EMBED_INTRA_OP_THREADS", str(len(cores)))
+    os.environ.setdefault("EMBED_INTER_OP_THREADS", "1")
+
+    import uvicorn
+
+    config = uvicorn.Config("server:app", log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Несколько процессов сервера эмбеддингов, закреплённых за ядрами | Several embedding server processes pinned to cores"
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    # Общий слушающий сокет: ядро ОС распределяет соединения между процессами |
+    # Shared listening socket: the OS kernel distributes connections between processes
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.set_inheritable(True)
+
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=_serve, args=(sock, cores, args.log_level, index))
+        for index, cores in enumerate(core_slices(args.workers))
+    ]
+    for process in processes:
+        process.start()
+
+    def stop(signum, frame):
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for process in processes:
+        process.join()
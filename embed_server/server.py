@@ -1,26 +1,320 @@
-from fastapi import FastAPI
+import asyncio
+import io
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+
+import numpy as np
+from backends import EMBED_BACKEND, EMBED_QUANTIZATION, load_model
+from embed_cache import EmbeddingCache
+import metrics
+
+MODEL_NAME = os.getenv("EMBED_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")  # Модель эмбеддингов | Embedding model
+
+# Параметры микробатчинга | Micro-batching settings
+MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "64"))  # Максимум предложений в одном батче | Max sentences per batch
+MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))  # Максимальное ожидание добора батча, мс | Max wait to fill a batch, ms
+MAX_QUEUE_SIZE = int(os.getenv("EMBED_MAX_QUEUE_SIZE", "1024"))  # Максимум запросов в очереди | Max queued requests
 
-from sentence_transformers import SentenceTransformer
+# Параметры кэша эмбеддингов | Embedding cache settings
+CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "10000"))  # Размер LRU в памяти (0 – выключен) | In-memory LRU size (0 disables it)
+CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "")  # Каталог постоянного кэша на диске (пусто – выключен) | On-disk cache directory (empty disables it)
+
+# Бинарные форматы ответа | Binary response formats
+NPY_MEDIA_TYPE = "application/x-npy"  # Файл .npy (заголовок numpy + сырые данные) | .npy file (numpy header + raw data)
+RAW_MEDIA_TYPE = "application/octet-stream"  # Сырой буфер, форма и тип в заголовках | Raw buffer, shape and dtype in headers
+SUPPORTED_DTYPES = ("float32", "float16")
 
 # Объект схемы для тела запроса | Schema object for request body
 class TextRequest(BaseModel):
     sentences: List[str]
+    dtype: Optional[str] = None  # float32 (по умолчанию) или float16 | float32 (default) or float16
+
+
+class _PendingRequest:
+    """
+    Запрос в очереди: предложения, future для результата и время постановки. |
+    Queued request: sentences, future for the result and enqueue time.
+    """
+    __slots__ = ("sentences", "future", "enqueued_at")
+
+    def __init__(self, sentences, future):
+        self.sentences = sentences
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Собирает одновременные запросы в общую очередь и выполняет их одним вызовом
+    model.encode, когда набран max_batch_size предложений или истекло max_wait_ms.
+    Каждый вызывающий получает свой срез результата.
+
+    |
+
+    Collects concurrent requests into a shared queue and runs them as a single
+    model.encode call once max_batch_size sentences are collected or max_wait_ms
+    has elapsed. Each caller gets back its own slice of the result.
+    """
+
+    def __init__(self, encode_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, max_queue_size=MAX_QUEUE_SIZE):
+        self._encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_size = max_queue_size
+        self._queue = None
+        self._worker = None
+
+        # Метрики | Metrics
+        self.requests = 0
+        self.rejected = 0
+        self.batches = 0
+        self.sentences = 0
+        self.batch_fill_sum = 0.0
+        self.queue_delay_sum = 0.0
+        self.queue_delay_max = 0.0
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        # Отклоняем всё, что осталось в очереди | Fail everything left in the queue
+        while self._queue is not None and not self._queue.empty():
+            item = self._queue.get_nowait()
+            if not item.future.done():
+                item.future.set_exception(RuntimeError("Embedding server is shutting down"))
+
+    async def encode(self, sentences):
+        """
+        Ставит предложения в очередь и ждёт их эмбеддинги. |
+        Enqueues sentences and waits for their embeddings.
+
+        Бросает asyncio.QueueFull, если очередь переполнена. |
+        Raises asyncio.QueueFull when the queue is full.
+        """
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(_PendingRequest(sentences, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            metrics.observe_request("rejected")
+            raise
+        self.requests += 1
+        metrics.observe_request("accepted")
+        return await future
+
+    async def _collect_batch(self):
+        # Ждём первый запрос без ограничения по времени | Wait for the first request without a deadline
+        first = await self._queue.get()
+        batch = [first]
+        total = len(first.sentences)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+
+        # Добираем батч до лимита размера или времени | Fill the batch until the size or time limit
+        while total < self.max_batch_size:
+            if self._queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                getter = asyncio.ensure_future(self._queue.get())
+                done, _ = await asyncio.wait({getter}, timeout=timeout)
+                if not done:
+                    # Элемент не теряется: он остаётся в очереди до завершения get() |
+                    # No item is lost: it stays in the queue until get() completes
+                    getter.cancel()
+                    break
+                item = getter.result()
+            else:
+                item = self._queue.get_nowait()
+            batch.append(item)
+            total += len(item.sentences)
+        return batch, total
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch, total = await self._collect_batch()
+            # Запросы, чьи клиенты уже отключились, не кодируем | Skip requests whose callers are gone
+            batch = [item for item in batch if not item.future.done()]
+            if not batch:
+                continue
+            flat = [s for item in batch for s in item.sentences]
+
+            started = time.perf_counter()
+            queue_waits = [started - item.enqueued_at for item in batch]
+            for delay in queue_waits:
+                self.queue_delay_sum += delay
+                self.queue_delay_max = max(self.queue_delay_max, delay)
+            self.batches += 1
+            self.sentences += len(flat)
+            self.batch_fill_sum += min(len(flat) / self.max_batch_size, 1.0)
+
+            try:
+                embeddings = await loop.run_in_executor(None, self._encode_fn, flat)
+            except Exception as e:
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                continue
+            metrics.observe_batch(len(flat), queue_waits, time.perf_counter() - started)
+
+            # Раздаём каждому вызывающему его срез | Hand each caller its own slice
+            offset = 0
+            for item in batch:
+                n = len(item.sentences)
+                if not item.future.done():
+                    item.future.set_result(embeddings[offset:offset + n])
+                offset += n
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_queue_size": self.max_queue_size,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "sentences": self.sentences,
+            "avg_batch_size": self.sentences / self.batches if self.batches else 0.0,
+            "avg_batch_fill": self.batch_fill_sum / self.batches if self.batches else 0.0,
+            "avg_queue_delay_ms": 1000.0 * self.queue_delay_sum / self.requests if self.requests else 0.0,
+            "max_queue_delay_ms": 1000.0 * self.queue_delay_max,
+        }
 
-# Инициализируем приложение FastAPI | Initialize FastAPI app
-app = FastAPI()
 
 # Загружаем модель для эмбеддингов | Load model for embeddings
-model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+model = load_model(MODEL_NAME, EMBED_BACKEND)
+EMBEDDING_DIM = model.get_sentence_embedding_dimension()
+
+
+def encode_batch(sentences):
+    """
+    Синхронный вызов модели для одного батча (выполняется в пуле потоков). |
+    Synchronous model call for one batch (runs in the thread pool).
+    """
+    embeddings = model.encode(sentences, batch_size=MAX_BATCH_SIZE, convert_to_numpy=True)
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+batcher = MicroBatcher(encode_batch)
+# Бэкенд и профиль квантования входят в ключ кэша: векторы int8-модели отличаются от fp32 и между профилями |
+# The backend and quantization profile are part of the cache key: int8 vectors differ from fp32 and between profiles
+CACHE_MODEL_KEY = f"{MODEL_NAME}@{EMBED_BACKEND}" + (f":{EMBED_QUANTIZATION}" if EMBED_BACKEND == "onnx-int8" else "")
+cache = EmbeddingCache(CACHE_MODEL_KEY, EMBEDDING_DIM, CACHE_SIZE, CACHE_DIR or None)
+
+
+async def encode_cached(sentences):
+    """
+    Берёт найденные векторы из кэша, а в модель отправляет только промахи
+    (повторы внутри запроса кодируются один раз). |
+    Takes found vectors from the cache and sends only misses to the model
+    (duplicates within a request are encoded once).
+    """
+    embeddings, keys, missing = cache.lookup(sentences)
+    metrics.observe_cache(len(sentences) - len(missing), len(missing))
+    if not missing:
+        return embeddings
+    unique = {}
+    for i in missing:
+        unique.setdefault(keys[i], []).append(i)
+    miss_keys = list(unique)
+    miss_texts = [sentences[unique[k][0]] for k in miss_keys]
+    encoded = await batcher.encode(miss_texts)
+    for key, vector in zip(miss_keys, encoded):
+        embeddings[unique[key]] = vector
+    cache.store(miss_keys, encoded)
+    return embeddings
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Запускаем и останавливаем фоновый обработчик батчей | Start and stop the background batch worker
+    await batcher.start()
+    yield
+    await batcher.stop()
+    cache.close()
+
+# Инициализируем приложение FastAPI | Initialize FastAPI app
+app = FastAPI(lifespan=lifespan)
+
+def encode_response(embeddings, accept: str):
+    """
+    Сериализует эмбеддинги в формат, запрошенный заголовком Accept:
+      - application/x-npy – файл .npy;
+      - application/octet-stream – сырой буфер, форма в X-Embedding-Shape, тип в X-Embedding-Dtype;
+      - иначе – JSON со списками чисел (как раньше).
+
+    |
+
+    Serializes embeddings into the format requested by the Accept header:
+      - application/x-npy – an .npy file;
+      - application/octet-stream – raw buffer, shape in X-Embedding-Shape, dtype in X-Embedding-Dtype;
+      - otherwise – JSON with float lists (as before).
+    """
+    if NPY_MEDIA_TYPE in accept:
+        buffer = io.BytesIO()
+        np.save(buffer, embeddings, allow_pickle=False)
+        return Response(content=buffer.getvalue(), media_type=NPY_MEDIA_TYPE)
+    if RAW_MEDIA_TYPE in accept:
+        headers = {
+            "X-Embedding-Shape": ",".join(str(n) for n in embeddings.shape),
+            "X-Embedding-Dtype": embeddings.dtype.name,
+        }
+        return Response(content=np.ascontiguousarray(embeddings).tobytes(), media_type=RAW_MEDIA_TYPE, headers=headers)
+    return {"embeddings": embeddings.tolist()}
 
 @app.post("/encode")
-def encode_text(req: TextRequest):
+async def encode_text(req: TextRequest, request: Request):
     """
     Получаем эмбеддинги для списка предложений (sentences).
-    Возвращаем массив числовых векторов. |
+    Возвращаем массив числовых векторов в JSON или бинарном формате (см. encode_response). |
     Obtain embeddings for a list of sentences.
-    Return an array of numeric vectors.
+    Return an array of numeric vectors as JSON or in a binary format (see encode_response).
     """
-    embeddings = model.encode(req.sentences)
-    return {"embeddings": embeddings.tolist()}
+    dtype = req.dtype or "float32"
+    if dtype not in SUPPORTED_DTYPES:
+        raise HTTPException(status_code=422, detail=f"Unsupported dtype {dtype!r}, expected one of {SUPPORTED_DTYPES}")
+    if req.sentences:
+        try:
+            embeddings = await encode_cached(req.sentences)
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=503, detail="Embedding queue is full, retry later")
+    else:
+        embeddings = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    if dtype != "float32":
+        embeddings = embeddings.astype(dtype)
+    return encode_response(embeddings, request.headers.get("accept", ""))
+
+@app.get("/stats")
+def get_stats():
+    """
+    Метрики микробатчинга (заполненность батчей, задержка в очереди) и кэша (попадания/промахи). |
+    Micro-batching metrics (batch fill, queueing delay) and cache metrics (hits/misses).
+    """
+    return {"model": MODEL_NAME, "backend": EMBED_BACKEND, "batching": batcher.stats(), "cache": cache.stats()}
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Метрики Prometheus (EMBED_METRICS_ENABLED=1): время батча, размер батча, ожидание в очереди, кэш. |
+    Prometheus metrics (EMBED_METRICS_ENABLED=1): batch time, batch size, queue wait, cache.
+    """
+    if not metrics.EMBED_METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled, set EMBED_METRICS_ENABLED=1")
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
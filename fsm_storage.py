@@ -0,0 +1,109 @@
+import asyncio
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")  # memory | sqlite | redis
+FSM_SQLITE_PATH = os.getenv("FSM_SQLITE_PATH", "./fsm_state.sqlite3")  # Файл состояния для sqlite | State file for sqlite
+FSM_REDIS_URL = os.getenv("FSM_REDIS_URL", "redis://localhost:6379/0")  # Redis или совместимый сервер | Redis or a compatible server
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", "0"))  # Время жизни состояния чата в Redis, с (0 – бессрочно) | Chat state lifetime in Redis, s (0 – forever)
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище FSM в файле SQLite (WAL) для одного сервера: состояние переживает
+    перезапуск и доступно всем процессам-воркерам. Запросы выполняются в отдельном
+    потоке, чтобы не блокировать event loop. |
+    SQLite file (WAL) FSM storage for a single node: state survives restarts and is
+    shared by all worker processes. Queries run in a dedicated thread so they do not
+    block the event loop.
+    """
+
+    def __init__(self, path: str = FSM_SQLITE_PATH):
+        self.path = path
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        # Один поток – одно соединение, блокировки не нужны | One thread – one connection, no locks needed
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS fsm (key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL DEFAULT '{}')")
+            self._conn = conn
+        return self._conn
+
+    def _run(self, query: str, params=()):
+        def execute():
+            return self._connect().execute(query, params).fetchone()
+
+        return asyncio.get_running_loop().run_in_executor(self._executor, execute)
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._run(
+            "INSERT INTO fsm (key, state) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET state = excluded.state",
+            (self.key_builder.build(key), value),
+        )
+
+    async def get_state(self, key: StorageKey):
+        row = await self._run("SELECT state FROM fsm WHERE key = ?", (self.key_builder.build(key),))
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data) -> None:
+        await self._run(
+            "INSERT INTO fsm (key, data) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+            (self.key_builder.build(key), json.dumps(data, ensure_ascii=False)),
+        )
+
+    async def get_data(self, key: StorageKey):
+        row = await self._run("SELECT data FROM fsm WHERE key = ?", (self.key_builder.build(key),))
+        return json.loads(row[0]) if row else {}
+
+    async def close(self) -> None:
+        # Повторный вызов ничего не делает | A repeated call does nothing
+        if self._executor is None:
+            return
+
+        def close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+        executor, self._executor = self._executor, None
+        await asyncio.get_running_loop().run_in_executor(executor, close)
+        executor.shutdown(wait=False)
+
+
+def make_storage(kind: str = FSM_STORAGE):
+    """
+    Хранилище FSM (история диалога) по FSM_STORAGE:
+      - memory – в памяти процесса (один процесс, теряется при перезапуске);
+      - sqlite – файл FSM_SQLITE_PATH, общий для воркеров одного сервера;
+      - redis – сервер FSM_REDIS_URL, общий для воркеров на разных серверах.
+
+    |
+
+    FSM storage (conversation history) selected by FSM_STORAGE:
+      - memory – in process memory (one process, lost on restart);
+      - sqlite – the FSM_SQLITE_PATH file, shared by workers on one node;
+      - redis – the FSM_REDIS_URL server, shared by workers on different nodes.
+    """
+    if kind == "memory":
+        return MemoryStorage()
+    if kind == "sqlite":
+        return SQLiteStorage(FSM_SQLITE_PATH)
+    if kind == "redis":
+        # Требует пакет redis | Requires the redis package
+        from aiogram.fsm.storage.redis import RedisStorage
+
+        ttl = FSM_STATE_TTL or None
+        return RedisStorage.from_url(FSM_REDIS_URL, state_ttl=ttl, data_ttl=ttl)
+    raise ValueError(f"Неизвестное хранилище FSM | Unknown FSM storage: {kind}")
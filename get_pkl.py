@@ -1,4 +1,14 @@
-import pickle
+import argparse
+
+from qa_records import QARecord, write_jsonl
+
+# Префиксы строк скриншотов и соответствующие поля записи |
+# Screenshot line prefixes and the matching record fields
+SCREENSHOT_PREFIXES = (
+    ("скриншот:", "Скриншот: ", "skr"),
+    ("скриншот2:", "Скриншот2: ", "skr_2"),
+    ("скриншот3:", "Скриншот3: ", "skr_3"),
+)
 
 def remove_prefix(text, prefix):
     """
@@ -9,81 +19,76 @@ def remove_prefix(text, prefix):
         return text[len(prefix):].strip()
     return text.strip()
 
-def parse_text(text):
+def parse_block(lines):
+    """
+    Собирает запись из строк одного блока или возвращает None, если строк меньше двух. |
+    Builds a record from the lines of one block, or returns None if it has fewer than two lines.
+    """
+    if len(lines) < 2:
+        return None
+
+    # Удаляем префиксы "Вопрос:" и "Ответ:" для первой и второй строки соответственно |
+    # Remove prefixes "Вопрос:" and "Ответ:" for the first and second lines, respectively
+    record = QARecord(remove_prefix(lines[0], "Вопрос: "), remove_prefix(lines[1], "Ответ: "))
+
+    # Обрабатываем дополнительные строки для скриншотов | Process additional lines for screenshots
+    for line in lines[2:]:
+        line_lower = line.lower()
+        for marker, prefix, field in SCREENSHOT_PREFIXES:
+            if line_lower.startswith(marker):
+                setattr(record, field, remove_prefix(line, prefix))
+                break
+    return record
+
+def iter_records(lines):
     """
-    Функция принимает текст, где каждая пара вопрос-ответ (с опциональными скриншотами)
-    разделена двойным переводом строки (\n\n). Внутри каждого блока:
+    Генератор записей из потока строк (например, открытого файла): каждая пара
+    вопрос-ответ (с опциональными скриншотами) отделена пустой строкой. Внутри блока:
       - Первая строка – вопрос (возможно, начинается с "Вопрос:").
       - Вторая строка – ответ (возможно, начинается с "Ответ:").
-      - Дополнительные строки могут содержать скриншоты, например "Скриншот:", "Скриншот2:", "Скриншот3:".
-      
-    При добавлении в словарь из каждой строки удаляются указанные префиксы.
+      - Дополнительные строки могут содержать скриншоты: "Скриншот:", "Скриншот2:", "Скриншот3:".
+    В памяти держится только текущий блок, поэтому размер файла не ограничен.
 
     |
 
-    The function takes text where each question-answer pair (with optional screenshots)
-    is separated by a double newline (\n\n). Within each block:
+    Generator of records from a stream of lines (e.g. an open file): each
+    question-answer pair (with optional screenshots) is separated by a blank line.
+    Within a block:
       - The first line is a question (possibly starting with "Вопрос:").
       - The second line is an answer (possibly starting with "Ответ:").
-      - Additional lines may contain screenshots, e.g., "Скриншот:", "Скриншот2:", "Скриншот3:".
-      
-    When adding entries to the dictionary, specified prefixes are removed from each line.
-
-    Возвращает список словарей, например: |
-    Returns a list of dictionaries, for example:
-      [
-          {"вопрос": "Какой ваш вопрос?", "ответ": "Вот ответ", "скриншот": "3", "скриншот2": "4"},
-          ...
-      ]
+      - Additional lines may contain screenshots: "Скриншот:", "Скриншот2:", "Скриншот3:".
+    Only the current block is kept in memory, so the file size is not limited.
     """
-    # Разбиваем текст на блоки по двойному переводу строки | Split text into blocks by double newline
-    blocks = text.strip().split("\n\n")
-    result = []
-    
-    for block in blocks:
-        # Разбиваем блок на строки | Split block into lines
-        lines = block.strip().split("\n")
-        # Если в блоке меньше двух строк, пропускаем его | Skip block if it has fewer than two lines
-        if len(lines) < 2:
+    block = []
+    for line in lines:
+        line = line.strip()
+        if line:
+            block.append(line)
             continue
-        
-        # Удаляем префиксы "Вопрос:" и "Ответ:" для первой и второй строки соответственно |
-        # Remove prefixes "Вопрос:" and "Ответ:" for the first and second lines, respectively
-        question = remove_prefix(lines[0].strip(), "Вопрос: ")
-        answer = remove_prefix(lines[1].strip(), "Ответ: ")
-        entry = {"вопрос": question, "ответ": answer}
-        
-        # Обрабатываем дополнительные строки для скриншотов | Process additional lines for screenshots
-        for line in lines[2:]:
-            line_stripped = line.strip()
-            line_lower = line_stripped.lower()
-            if line_lower.startswith("скриншот:"):
-                value = remove_prefix(line_stripped, "Скриншот: ")
-                entry["скриншот"] = value
-            elif line_lower.startswith("скриншот2:"):
-                value = remove_prefix(line_stripped, "Скриншот2: ")
-                entry["скриншот2"] = value
-            elif line_lower.startswith("скриншот3:"):
-                value = remove_prefix(line_stripped, "Скриншот3: ")
-                entry["скриншот3"] = value
-            # Можно добавить дополнительные проверки для других вариантов скриншотов, если необходимо. |
-            # Additional checks for other screenshot variants can be added if necessary.
-        
-        result.append(entry)
-    
-    return result
+        record = parse_block(block)
+        if record is not None:
+            yield record
+        block = []
+    record = parse_block(block)
+    if record is not None:
+        yield record
+
+def parse_text(text):
+    """
+    Разбирает текст целиком и возвращает список записей QARecord. |
+    Parses a whole text and returns a list of QARecord records.
+    """
+    return list(iter_records(text.splitlines()))
 
 if __name__ == "__main__":
-    # Чтение текста из файла "./result.txt" с кодировкой "utf-8" |
-    # Reading text from the file "./result.txt" with encoding "utf-8"
-    with open("./result.txt", "r", encoding="utf-8") as file:
-        text = file.read()
-    
-    # Парсинг текста | Parsing the text
-    parsed_data = parse_text(text)
-    
-    # Сохранение списка словарей в pkl файл | Saving the list of dictionaries to a pkl file
-    with open("result.pkl", "wb") as file:
-        pickle.dump(parsed_data, file)
-    
-    print("Данные успешно сохранены в файл data.pkl | Data successfully saved to file data.pkl")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Преобразование result.txt в result.jsonl | Convert result.txt to result.jsonl")
+    parser.add_argument("--input", default="./result.txt")
+    parser.add_argument("--output", default="./result.jsonl")
+    parser.add_argument("--append", action="store_true", help="Дописать в существующий файл | Append to an existing file")
+    args = parser.parse_args()
+
+    # Читаем result.txt построчно и сразу пишем записи | Read result.txt line by line and write records right away
+    with open(args.input, "r", encoding="utf-8") as file:
+        count = write_jsonl(iter_records(file), args.output, append=args.append)
+
+    print(f"Сохранено записей: {count}, файл {args.output} | Records saved: {count}, file {args.output}")
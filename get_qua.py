@@ -1,8 +1,14 @@
-import fitz  
-from openai import AsyncOpenAI  
-import asyncio  
-import traceback  
-import os  
+import fitz
+from openai import AsyncOpenAI
+import openai
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import traceback
+import os
 from dotenv import load_dotenv  # Для загрузки переменных среды | For loading environment variables
 
 load_dotenv()
@@ -17,8 +23,87 @@ client = AsyncOpenAI(
 
 MODEL = 'Qwen/Qwen2.5-72B-Instruct'  # Название используемой LLM модели | Name of the LLM model
 
+MAX_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))  # Одновременных запросов к LLM | Concurrent LLM requests
+REQUESTS_PER_MINUTE = int(os.getenv("LLM_RPM", "60"))  # Лимит запросов в минуту | Requests per minute limit
+TOKENS_PER_MINUTE = int(os.getenv("LLM_TPM", "100000"))  # Лимит токенов в минуту | Tokens per minute limit
+MAX_RETRIES = 5  # Повторов при временных ошибках | Retries on transient errors
+COMPLETION_TOKENS_ESTIMATE = 1000  # Оценка длины ответа для лимита токенов | Completion length estimate for the token limit
+PAGE_WINDOW = int(os.getenv("PAGE_WINDOW", "1"))  # Страниц в одном промпте | Pages per prompt
+CHECKPOINT_PATH = "./get_qua_checkpoint.jsonl"  # Готовые окна страниц | Completed page windows
+
+# Временные ошибки, после которых запрос повторяется | Transient errors that trigger a retry
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+class RateLimiter:
+    """
+    Два «ведра токенов»: запросы в минуту и токены в минуту. Перед запросом
+    резервируется оценка токенов, после ответа она уточняется по response.usage.
+
+    |
+
+    Two token buckets: requests per minute and tokens per minute. An estimate of
+    tokens is reserved before a request and corrected from response.usage afterwards.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    async def acquire(self, tokens: int):
+        # Запрос больше всего ведра ждёт полного ведра | A request larger than the bucket waits for a full bucket
+        tokens = min(tokens, self.tpm)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait_requests = (1 - self._requests) * 60.0 / self.rpm if self._requests < 1 else 0.0
+                wait_tokens = (tokens - self._tokens) * 60.0 / self.tpm if self._tokens < tokens else 0.0
+                await asyncio.sleep(max(wait_requests, wait_tokens))
+
+    def correct(self, reserved: int, actual: int):
+        self._tokens -= actual - reserved
+
+
+class UsageTotals:
+    """
+    Суммарное потребление токенов по response.usage. | Total token usage from response.usage.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, usage):
+        self.requests += 1
+        if usage is not None:
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.completion_tokens += usage.completion_tokens or 0
+
+
 # Асинхронная функция для получения ответа от модели LLM | Asynchronous function to get response from LLM model
-async def get_chatgpt_response(prompt) -> str:
+async def get_chatgpt_response(prompt, limiter: RateLimiter = None, totals: UsageTotals = None) -> str:
 
     # Системное сообщение для задания роли помощника | System message to set assistant's role
     messages = [{"role": "system", "content": 'You are a Russian help assistant. Answer in Russian language only.'}]
@@ -26,65 +111,189 @@ async def get_chatgpt_response(prompt) -> str:
     # Добавляем пользовательский промпт | Adding user prompt
     messages.append({"role": "user", "content": prompt})
 
-    # Отправляем запрос и возвращаем ответ модели | Sending request and returning the model's response
-    try:
-        response = await client.chat.completions.create(
-            model=MODEL,
-            messages=messages,
-            temperature=0,
-        )
-        print(response.usage)
-        return response.choices[0].message.content
-    except:
-        print(traceback.format_exc())
-        return ""
+    # Грубая оценка токенов: ~3 символа кириллицы на токен | Rough token estimate: ~3 Cyrillic characters per token
+    estimate = len(prompt) // 3 + COMPLETION_TOKENS_ESTIMATE
+
+    # Отправляем запрос и возвращаем ответ модели; временные ошибки повторяем с экспоненциальной паузой |
+    # Sending request and returning the model's response; transient errors are retried with exponential backoff
+    for attempt in range(MAX_RETRIES + 1):
+        if limiter is not None:
+            await limiter.acquire(estimate)
+        try:
+            response = await client.chat.completions.create(
+                model=MODEL,
+                messages=messages,
+                temperature=0,
+            )
+        except RETRYABLE_ERRORS:
+            if attempt == MAX_RETRIES:
+                print(traceback.format_exc())
+                return ""
+            if totals is not None:
+                totals.retries += 1
+            await asyncio.sleep(min(60.0, 2 ** attempt) * (0.5 + random.random()))
+            continue
+        except Exception:
+            print(traceback.format_exc())
+            return ""
+        if limiter is not None and response.usage is not None:
+            limiter.correct(estimate, response.usage.total_tokens)
+        if totals is not None:
+            totals.add(response.usage)
+        return response.choices[0].message.content or ""
+    return ""
+
+
+# Текст одной страницы с пометками начала и конца | Text of one page with start and end markers
+def page_text(docs, page_num: int) -> str:
+    page = docs.load_page(page_num)  # Загружаем текущую страницу | Load current page
+    parts = [f'Начало страницы {page_num + 1}', page.get_text(), "\n"]  # Получаем текст со страницы | Get text from the page
+    # Если на странице есть изображения, добавляем соответствующее сообщение | If images exist, add a corresponding message
+    if page.get_images(full=True):
+        parts.append(f'На странице {page_num + 1} есть вспомогательные скриншоты')
+    parts.append(f'Конец страницы {page_num + 1}')
+    return "".join(parts)
+
+
+# Формируем промпт для LLM модели | Formulate prompt for LLM model
+def build_prompt(text: str) -> str:
+    # Create questions and answers in Russian from the provided text, suitable for use in RAG search.
+    # Output format: Question: question Answer: answer, Question: question Answer: answer, Question: question Answer: answer.
+    # If the text contains 'На странице 2 есть вспомогательные скриншоты', include in the output for this page: Question: question Answer: answer Screenshot: page number.
+    return ("""
+                    Сделай вопросы и ответы на русском языке из предложенного текста, чтобы можно было это использовать для поиска в RAG.
+                    Выводи текстом Вопрос: вопрос Ответ: ответ, Вопрос: вопрос Ответ: ответ, Вопрос: вопрос Ответ: ответ.
+                    Если в тексте попадется 'На странице 2 есть вспомогательные скриншоты', то вывод по этой странице Вопрос: вопрос Ответ: ответ Скриншот: номер страницы.
+                    Текст:
+                    """ + text
+            )
+
+
+def pdf_signature(path: str) -> dict:
+    """
+    Подпись PDF для заголовка контрольной точки: путь, размер и sha1 содержимого. |
+    PDF signature for the checkpoint header: path, size and content sha1.
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return {"pdf": os.path.abspath(path), "size": os.path.getsize(path), "sha1": digest.hexdigest()}
+
+
+def load_checkpoint(path: str, signature: dict):
+    """
+    Читает готовые окна страниц: {(первая, последняя страница): ответ LLM}.
+    Первая строка – заголовок с подписью PDF; если файла нет или он записан для
+    другого PDF, возвращает None (контрольная точка начинается заново). |
+    Reads completed page windows: {(first, last page): LLM response}.
+    The first line is a header with the PDF signature; if the file is missing or was
+    written for another PDF, returns None (the checkpoint starts over).
+    """
+    if not os.path.exists(path):
+        return None
+    done = {}
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            header = json.loads(f.readline())
+        except json.JSONDecodeError:
+            header = None
+        if not isinstance(header, dict) or header.get("signature") != signature:
+            print(f"Контрольная точка {path} от другого PDF, начинаем заново | Checkpoint {path} belongs to another PDF, starting over")
+            return None
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Недописанная строка после падения | Partial line after a crash
+            done[(entry["first_page"], entry["last_page"])] = entry["text"]
+    return done
+
 
 # Основная асинхронная функция | Main asynchronous function
-async def main():
-    pdf_path = os.path.abspath("./file.pdf")  # Путь до PDF-файла | Path to the PDF file
-    docs = fitz.open(pdf_path)  # Открываем PDF-файл | Opening PDF file
-    result_txt = ""
-    result_llama_pdf_str = ""
-
-    # Проходим по всем страницам PDF-файла | Iterate through all PDF pages
-    for page_num in range(len(docs)):
-        result_txt += f'Начало страницы {page_num + 1}'
-        page = docs.load_page(page_num)  # Загружаем текущую страницу | Load current page
-        text = page.get_text()  # Получаем текст со страницы | Get text from the page
-        result_txt += text + "\n"
-        images = page.get_images(full=True)  # Проверяем наличие изображений на странице | Check for images on the page
-
-        # Если на странице есть изображения, добавляем соответствующее сообщение | If images exist, add a corresponding message
-        if images:
-            result_txt += f'На странице {page_num + 1} есть вспомогательные скриншоты'
-        result_txt += f'Конец страницы {page_num + 1}'
-
-        # Формируем промпт для LLM модели | Formulate prompt for LLM model
-        # if any([page_num % 2, page_num == len(docs) - 1]):   # Если нужно сделать вопрос по тексту из двух страниц - раскомменте это и сдвиньте нижний блок
-        prompt = ("""
-                    Сделай вопросы и ответы на русском языке из предложенного текста, чтобы можно было это использовать для поиска в RAG. 
-                    Выводи текстом Вопрос: вопрос Ответ: ответ, Вопрос: вопрос Ответ: ответ, Вопрос: вопрос Ответ: ответ.   
-                    Если в тексте попадется 'На странице 2 есть вспомогательные скриншоты', то вывод по этой странице Вопрос: вопрос Ответ: ответ Скриншот: номер страницы.     
-                    Текст: 
-                    """ + result_txt
-                  )
-        """
-        prompt = (Create questions and answers in Russian from the provided text, suitable for use in RAG search.
-                    Output format: Question: question Answer: answer, Question: question Answer: answer, Question: question Answer: answer.
-                    If the text contains 'На странице 2 есть вспомогательные скриншоты', include in the output for this page: Question: question Answer: answer Screenshot: page number.
-                    Text:)
-                    """
-
-        # Получаем и сохраняем ответ от LLM модели | Get and save response from LLM model
-        result_llama_pdf_str += await get_chatgpt_response(prompt)
-        result_txt = ""
+async def main(pdf_path="./file.pdf", output_path="./result_2.txt", window=PAGE_WINDOW,
+               concurrency=MAX_CONCURRENCY, rpm=REQUESTS_PER_MINUTE, tpm=TOKENS_PER_MINUTE,
+               checkpoint_path=CHECKPOINT_PATH):
+    """
+    Обрабатывает окна по window страниц параллельно (не больше concurrency запросов,
+    с лимитами rpm/tpm). Готовые окна сохраняются в checkpoint_path, повторный запуск
+    с тем же PDF их пропускает. Результат собирается в порядке страниц.
+
+    |
+
+    Processes windows of `window` pages concurrently (at most `concurrency` requests,
+    within rpm/tpm limits). Completed windows are saved to checkpoint_path and skipped
+    on a rerun with the same PDF. The result is assembled in page order.
+    """
+    docs = fitz.open(os.path.abspath(pdf_path))  # Открываем PDF-файл | Opening PDF file
+    page_count = len(docs)
+
+    # Окна страниц: window=2 заменяет прежнюю группировку по две страницы | Page windows: window=2 replaces the former two-page grouping
+    windows = [(first, min(first + window, page_count) - 1) for first in range(0, page_count, window)]
+
+    signature = pdf_signature(pdf_path)
+    done = load_checkpoint(checkpoint_path, signature)
+    results = {}
+    for key in windows:
+        if done and (key[0] + 1, key[1] + 1) in done:
+            results[key] = done[(key[0] + 1, key[1] + 1)]
+    todo = [key for key in windows if key not in results]
+    if results:
+        print(f"Пропускаем {len(results)} готовых окон из контрольной точки | Skipping {len(results)} completed windows from the checkpoint")
+
+    limiter = RateLimiter(rpm, tpm)
+    totals = UsageTotals()
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+
+    with open(checkpoint_path, "w" if done is None else "a", encoding="utf-8") as checkpoint:
+        if done is None:
+            checkpoint.write(json.dumps({"signature": signature}, ensure_ascii=False) + "\n")
+            checkpoint.flush()
+
+        async def process(key):
+            first, last = key
+            text = "".join(page_text(docs, n) for n in range(first, last + 1))
+            async with semaphore:
+                response = await get_chatgpt_response(build_prompt(text), limiter, totals)
+            results[key] = response
+            # Пустой ответ означает ошибку – такое окно повторится при следующем запуске |
+            # An empty response means an error – such a window is retried on the next run
+            if response:
+                checkpoint.write(json.dumps({"first_page": first + 1, "last_page": last + 1, "text": response}, ensure_ascii=False) + "\n")
+                checkpoint.flush()
+
+        await asyncio.gather(*(process(key) for key in todo))
+
+    elapsed = time.perf_counter() - started
+    # Собираем ответы в порядке страниц; окна разделяем пустой строкой для get_pkl.parse_text |
+    # Assemble responses in page order; windows are separated by a blank line for get_pkl.parse_text
+    result_llama_pdf_str = "\n\n".join(results[key].strip() for key in windows if results[key])
 
     # Записываем результат в файл | Write the result to a file
-    with open('./result_2.txt', 'w', encoding='utf-8') as f:
+    with open(output_path, 'w', encoding='utf-8') as f:
         f.write(result_llama_pdf_str)
 
+    pages_done = sum(last - first + 1 for first, last in todo)
+    rate = pages_done / elapsed if elapsed > 0 else 0.0
+    print(f"Страниц обработано: {pages_done} за {elapsed:.1f} с ({rate:.2f} стр/с) | Pages processed: {pages_done} in {elapsed:.1f} s ({rate:.2f} pages/s)")
+    print(f"Запросов: {totals.requests}, повторов: {totals.retries}, токенов промпта: {totals.prompt_tokens}, токенов ответа: {totals.completion_tokens} | "
+          f"Requests: {totals.requests}, retries: {totals.retries}, prompt tokens: {totals.prompt_tokens}, completion tokens: {totals.completion_tokens}")
     print("Done")
 
 # Запуск основной функции | Run the main function
 if __name__ == '__main__':
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Генерация пар вопрос-ответ из PDF | Generate question-answer pairs from a PDF")
+    parser.add_argument("--pdf", default="./file.pdf")
+    parser.add_argument("--output", default="./result_2.txt")
+    parser.add_argument("--window", type=int, default=PAGE_WINDOW, help="Страниц в одном промпте | Pages per prompt")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--rpm", type=int, default=REQUESTS_PER_MINUTE)
+    parser.add_argument("--tpm", type=int, default=TOKENS_PER_MINUTE)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--restart", action="store_true", help="Игнорировать контрольную точку | Ignore the checkpoint")
+    args = parser.parse_args()
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    asyncio.run(main(args.pdf, args.output, args.window, args.concurrency, args.rpm, args.tpm, args.checkpoint))
@@ -1,114 +1,586 @@
-import requests 
-import json 
-import pickle 
+import requests
+import json
+import argparse
+import os
+import time
+import hashlib
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, ALL_COMPLETED, wait
+from itertools import islice
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from embed_client import FASTAPI_EMBED_URL, ENCODE_HEADERS, encode_payload, decode_embeddings
+from page_cache import prerender_pages, referenced_pages
+from answer_cache import INGEST_STAMP_COLLECTION, stamp_point_id
+import sparse_encoder
+from qa_records import read_jsonl
+from local_index import export_collection
 
 COLLECTION_NAME = "Client_bd"  # Название базы данных | Database name
-QDRANT_URL = "http://localhost:6333"  # Адрес Qdrant | Qdrant URL
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")  # Адрес Qdrant | Qdrant URL
+
+BATCH_SIZE = 256  # Записей в одном батче (один вызов эмбеддингов + один upsert) | Records per batch (one embedding call + one upsert)
+MAX_IN_FLIGHT = 4  # Максимум одновременно обрабатываемых батчей | Max batches in flight
+CHECKPOINT_PATH = "./load_checkpoint.json"  # Файл с прогрессом загрузки | Ingestion progress file
+CONSISTENCY_TIMEOUT = 120  # Сколько секунд ждать применения всех точек | Seconds to wait until all points are applied
+SCROLL_LIMIT = 1000  # Точек на страницу при чтении коллекции | Points per page when reading the collection
+
+# Пространство имён для детерминированных UUID точек | Namespace for deterministic point UUIDs
+POINT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "qdrant_rag/qa_point")
+
+# Профиль настройки коллекции (None – значение по умолчанию сервера) |
+# Collection tuning profile (None – server default)
+DEFAULT_COLLECTION_PROFILE = {
+    "quantization": None,  # "int8" – скалярное квантование векторов | scalar vector quantization
+    "quantile": 0.99,  # Доля значений для диапазона int8 (отсекает выбросы) | Fraction of values for the int8 range (clips outliers)
+    "quantized_always_ram": True,  # Квантованные векторы всегда в RAM | Keep quantized vectors in RAM
+    "hnsw_m": None,  # Связей на узел графа HNSW | Edges per HNSW node
+    "hnsw_ef_construct": None,  # Размер списка кандидатов при построении | Candidate list size during build
+    "on_disk_vectors": None,  # Исходные векторы на диске (mmap) | Original vectors on disk (mmap)
+    "on_disk_payload": None,  # Payload (полные тексты ответов) на диске | Payload (full answer texts) on disk
+    "payload_indexes": {},  # Поле -> тип индекса, например {"skr": "keyword"} | Field -> index type, e.g. {"skr": "keyword"}
+}
+
+# Функция создания пула HTTP-соединений | Function to create a pooled HTTP session
+def make_session(pool_size=MAX_IN_FLIGHT):
+    """
+    Сессия requests с пулом соединений и повторами при временных ошибках. |
+    requests session with a connection pool and retries on transient errors.
+    """
+    retry = Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "PUT", "POST", "DELETE"}),  # Все вызовы здесь идемпотентны | All calls here are idempotent
+    )
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size + 2, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# Функция чтения профиля коллекции | Function to read the collection profile
+def load_collection_profile(path=None, **overrides):
+    """
+    Профиль коллекции: значения по умолчанию, затем JSON-файл, затем флаги CLI (не None). |
+    Collection profile: defaults, then a JSON file, then CLI flags (when not None).
+    """
+    profile = dict(DEFAULT_COLLECTION_PROFILE)
+    if path:
+        with open(path, encoding="utf-8") as f:
+            profile.update(json.load(f))
+    profile.update({key: value for key, value in overrides.items() if value is not None})
+    unknown = set(profile) - set(DEFAULT_COLLECTION_PROFILE)
+    if unknown:
+        raise ValueError(f"Неизвестные параметры профиля | Unknown profile keys: {sorted(unknown)}")
+    return profile
+
+def collection_config(profile, hybrid=False):
+    """
+    Тело запроса создания коллекции из профиля: квантование int8, параметры HNSW,
+    хранение векторов и payload на диске. |
+    Collection creation body from the profile: int8 quantization, HNSW parameters,
+    on-disk vectors and payload.
+    """
+    dense_params = {
+        "size": 384,  # Размерность вектора модели | Vector size of your model
+        "distance": "Cosine"  # Метрика для расчета расстояний | Distance metric
+    }
+    if profile["on_disk_vectors"] is not None:
+        dense_params["on_disk"] = profile["on_disk_vectors"]
+    config = {"vectors": dense_params}
+    if hybrid:
+        # Именованные плотный и разреженный (BM25, IDF считает Qdrant) векторы | Named dense and sparse (BM25, IDF computed by Qdrant) vectors
+        config = {
+            "vectors": {sparse_encoder.DENSE_VECTOR_NAME: dense_params},
+            "sparse_vectors": {sparse_encoder.SPARSE_VECTOR_NAME: {"modifier": "idf"}}
+        }
+    hnsw = {key: profile[name] for key, name in (("m", "hnsw_m"), ("ef_construct", "hnsw_ef_construct"))
+            if profile[name] is not None}
+    if hnsw:
+        config["hnsw_config"] = hnsw
+    if profile["quantization"] == "int8":
+        config["quantization_config"] = {
+            "scalar": {"type": "int8", "quantile": profile["quantile"], "always_ram": profile["quantized_always_ram"]}
+        }
+    elif profile["quantization"] is not None:
+        raise ValueError(f"Неподдерживаемое квантование | Unsupported quantization: {profile['quantization']!r}")
+    if profile["on_disk_payload"] is not None:
+        config["on_disk_payload"] = profile["on_disk_payload"]
+    return config
 
 # Функция создания коллекции в Qdrant | Function to create a collection in Qdrant
-def create_collection():
-    # Здесь задаём метрику и размерность | Here we define metric and dimensionality
+def create_collection(session=requests, hybrid=False, profile=None):
     # delete_response = requests.delete(f"{QDRANT_URL}/collections/{COLLECTION_NAME}")  # Если нужно удалить базу расскомментируйте | Uncomment to delete the collection if needed
-    create_collection_payload = {
-        "vectors": {
-            "size": 384,  # Размерность вектора модели | Vector size of your model
-            "distance": "Cosine"  # Метрика для расчета расстояний | Distance metric
-        }
-    }
-    r = requests.put(
-        f"{QDRANT_URL}/collections/{COLLECTION_NAME}",
-        headers={"Content-Type": "application/json"},
-        data=json.dumps(create_collection_payload)
-    )
-    if r.status_code == 200:
-        print(f"Коллекция {COLLECTION_NAME} успешно создана (или уже существовала). | Collection {COLLECTION_NAME} created successfully (or already existed).")
+    # Для обновления данных пересоздавать коллекцию не нужно – используйте --sync | No need to rebuild the collection to update data – use --sync
+    profile = profile or DEFAULT_COLLECTION_PROFILE
+    config = collection_config(profile, hybrid)
+    existing = session.get(f"{QDRANT_URL}/collections/{COLLECTION_NAME}")
+    exists = existing.status_code == 200
+    if exists:
+        # Именованные векторы (dense/sparse) у гибридной коллекции, неименованный – у обычной |
+        # A hybrid collection has named vectors (dense/sparse), a plain one has an unnamed vector
+        params = existing.json()["result"]["config"]["params"]
+        named = "size" not in params["vectors"]
+        if named != hybrid:
+            raise ValueError(
+                f"Коллекция {COLLECTION_NAME} создана {'с' if named else 'без'} --hybrid: запустите загрузку так же "
+                f"или пересоздайте коллекцию | Collection {COLLECTION_NAME} was created {'with' if named else 'without'} "
+                f"--hybrid: run the ingest the same way or recreate the collection"
+            )
+        # Существующую коллекцию донастраиваем: квантование и HNSW перестраиваются в фоне |
+        # An existing collection is retuned: quantization and HNSW are rebuilt in the background
+        update = {key: config[key] for key in ("hnsw_config", "quantization_config") if key in config}
+        if profile["on_disk_vectors"] is not None:
+            on_disk = {"on_disk": profile["on_disk_vectors"]}
+            update["vectors"] = {sparse_encoder.DENSE_VECTOR_NAME: on_disk} if hybrid else {"": on_disk}
+        if "on_disk_payload" in config:
+            update["params"] = {"on_disk_payload": config["on_disk_payload"]}
+        r = session.patch(f"{QDRANT_URL}/collections/{COLLECTION_NAME}", json=update) if update else None
+    else:
+        r = session.put(
+            f"{QDRANT_URL}/collections/{COLLECTION_NAME}",
+            headers={"Content-Type": "application/json"},
+            data=json.dumps(config)
+        )
+    if r is None or r.status_code == 200:
+        state = "обновлена | updated" if exists else "создана | created"
+        print(f"Коллекция {COLLECTION_NAME}: {state}")
     else:
         print("Ошибка при создании коллекции: | Error creating collection:", r.text)
+    create_payload_indexes(profile["payload_indexes"], session)
 
-FASTAPI_EMBED_URL = "http://127.0.0.1:8080/encode"  # Адрес сервиса для получения эмбеддингов | Embeddings service URL
+# Функция создания индексов payload | Function to create payload indexes
+def create_payload_indexes(indexes, session=requests):
+    """
+    Индексы payload для фильтрации (например, по странице skr); повторное создание безопасно. |
+    Payload indexes for filtering (e.g. by the skr page); creating them again is safe.
+    """
+    for field_name, field_schema in indexes.items():
+        r = session.put(
+            f"{QDRANT_URL}/collections/{COLLECTION_NAME}/index",
+            params={"wait": "true"},
+            json={"field_name": field_name, "field_schema": field_schema},
+        )
+        if r.status_code != 200:
+            print(f"Ошибка при создании индекса {field_name}: | Error creating index {field_name}:", r.text)
 
 # Функция для получения эмбеддингов | Function to get embeddings
-def get_embeddings(sentences):
+def get_embeddings(sentences, session=requests):
     """
     Обращаемся к нашему FastAPI сервису,
-    передаём список строк, получаем массив эмбеддингов.
+    передаём список строк, получаем матрицу эмбеддингов (numpy, float32).
 
     |
 
     Send requests to our FastAPI service,
-    pass a list of sentences, get an array of embeddings.
+    pass a list of sentences, get a matrix of embeddings (numpy, float32).
     """
-    payload = {"sentences": sentences}
-    r = requests.post(
+    r = session.post(
         FASTAPI_EMBED_URL,
-        headers={"Content-Type": "application/json"},
-        data=json.dumps(payload)
+        headers=ENCODE_HEADERS,
+        data=encode_payload(sentences)
     )
     if r.status_code == 200:
-        return r.json()["embeddings"]
+        return decode_embeddings(r.content, r.headers)
     else:
         print("Ошибка при получении эмбеддингов: | Error retrieving embeddings:", r.text)
         return None
 
-# Функция для вставки данных в Qdrant | Function to insert data into Qdrant
-def insert_points_in_qdrant(vector, qw, ans, id, skr, skr_2):
+# Стабильный идентификатор точки | Stable point identifier
+def point_id(qw, skr, skr_2=None):
+    """
+    Детерминированный UUID из текста вопроса и страниц-источников: правка
+    других записей в result.txt не сдвигает идентификаторы. skr_2 входит в ключ
+    только когда задан, поэтому id записей без него не меняются. |
+    Deterministic UUID from the question text and source pages: editing
+    other records in result.txt does not shift identifiers. skr_2 joins the key
+    only when set, so ids of records without it stay the same.
+    """
+    key = f"{qw.strip()}\0{skr or ''}"
+    if skr_2:
+        key += f"\0{skr_2}"
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, key))
+
+# Хэш содержимого записи | Record content hash
+def content_hash(qw, ans, skr, skr_2, pages=None):
+    return hashlib.sha1(json.dumps([qw, ans, skr, skr_2, pages or []], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+# Текст для разреженного (BM25) вектора: вопрос и ответ | Text for the sparse (BM25) vector: question and answer
+def sparse_text(qw, ans):
+    return f"{qw}\n{ans}"
+
+# Функция формирования точки Qdrant | Function to build a Qdrant point
+def build_point(vector, qw, ans, skr, skr_2, sparse=None, pages=None):
     """
-    vectors - список вектор вопроса | List of question vectors
+    vector - вектор вопроса (numpy) | Question vector (numpy)
     qw - вопрос | Question
     ans - ответ | Answer
     skr, skr_2 - скриншоты (необязательно, могут отсутствовать) | Screenshots (optional, can be omitted)
+    pages - все страницы скриншотов (QARecord.all_pages) | All screenshot pages (QARecord.all_pages)
+    sparse - разреженный BM25-вектор для гибридной коллекции | Sparse BM25 vector for a hybrid collection
     """
-
-    insert_payload = {
-        "points": [
-            {
-                "id": id,
-                "vector": vector,
-                "payload": {
-                    "question": qw,
-                    "answer": ans,
-                    "skr": skr,
-                    "skr_2": skr_2
-                }
-            }
-        ]
+    point_vector = vector.tolist()
+    if sparse is not None:
+        point_vector = {sparse_encoder.DENSE_VECTOR_NAME: point_vector, sparse_encoder.SPARSE_VECTOR_NAME: sparse}
+    return {
+        "id": point_id(qw, skr, skr_2),
+        "vector": point_vector,
+        "payload": {
+            "question": qw,
+            "answer": ans,
+            "skr": skr,
+            "skr_2": skr_2,
+            "pages": pages or [],
+            "content_hash": content_hash(qw, ans, skr, skr_2, pages)
+        }
     }
 
-    r = requests.put(
-        f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points?wait=true",
+# Функция для вставки батча точек в Qdrant | Function to insert a batch of points into Qdrant
+def upsert_points(points, session=requests, wait_result=False):
+    """
+    Вставляет батч точек одним запросом. По умолчанию wait=false: Qdrant
+    подтверждает приём, не дожидаясь индексации (см. wait_for_points). |
+    Inserts a batch of points in one request. wait=false by default: Qdrant
+    acknowledges receipt without waiting for indexing (see wait_for_points).
+    """
+    r = session.put(
+        f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points?wait={'true' if wait_result else 'false'}",
         headers={"Content-Type": "application/json"},
-        data=json.dumps(insert_payload)
+        data=json.dumps({"points": points})
     )
-    if r.status_code == 200:
-        print("Данные успешно вставлены в Qdrant. | Data successfully inserted into Qdrant.")
-    else:
-        print("Ошибка при вставке данных: | Error inserting data:", r.text)
+    if r.status_code != 200:
+        raise RuntimeError(f"Ошибка при вставке данных: | Error inserting data: {r.text}")
+
+# Функция удаления точек | Function to delete points
+def delete_points(ids, session=requests, chunk_size=SCROLL_LIMIT):
+    for i in range(0, len(ids), chunk_size):
+        r = session.post(
+            # wait=true: финальный подсчёт не должен видеть ещё не удалённые точки |
+            # wait=true: the final count must not see points that are not deleted yet
+            f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points/delete?wait=true",
+            headers={"Content-Type": "application/json"},
+            data=json.dumps({"points": ids[i:i + chunk_size]})
+        )
+        if r.status_code != 200:
+            raise RuntimeError(f"Ошибка при удалении точек: | Error deleting points: {r.text}")
+
+# Чтение хэшей содержимого всех точек коллекции | Read content hashes of all points in the collection
+def fetch_content_hashes(session=requests):
+    """
+    Постранично читает коллекцию (только payload content_hash, без векторов). |
+    Pages through the collection (content_hash payload only, no vectors).
+
+    Возвращает {id точки: хэш или None}. | Returns {point id: hash or None}.
+    """
+    hashes = {}
+    offset = None
+    while True:
+        body = {"limit": SCROLL_LIMIT, "with_payload": ["content_hash"], "with_vector": False}
+        if offset is not None:
+            body["offset"] = offset
+        r = session.post(
+            f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points/scroll",
+            headers={"Content-Type": "application/json"},
+            data=json.dumps(body)
+        )
+        r.raise_for_status()
+        result = r.json()["result"]
+        for point in result["points"]:
+            hashes[str(point["id"])] = (point.get("payload") or {}).get("content_hash")
+        offset = result.get("next_page_offset")
+        if offset is None:
+            return hashes
+
+# Функция подсчёта точек в коллекции | Function to count points in the collection
+def count_points(session=requests):
+    r = session.post(
+        f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points/count",
+        headers={"Content-Type": "application/json"},
+        data=json.dumps({"exact": True})
+    )
+    r.raise_for_status()
+    return r.json()["result"]["count"]
+
+# Финальная проверка согласованности | Final consistency check
+def wait_for_points(expected, session=requests, timeout=CONSISTENCY_TIMEOUT, exact=False):
+    """
+    Ждёт, пока все отправленные с wait=false точки станут видимы в коллекции.
+    exact=True (после --sync) – ждёт ровно expected точек, а не хотя бы expected:
+    в коллекции не должно остаться устаревших. |
+    Waits until all points sent with wait=false become visible in the collection.
+    exact=True (after --sync) waits for exactly expected points rather than at least
+    expected: no stale points may remain in the collection.
+    """
+    deadline = time.monotonic() + timeout
+    count = count_points(session)
+    while (count != expected if exact else count < expected) and time.monotonic() < deadline:
+        time.sleep(1)
+        count = count_points(session)
+    return count
+
+# Функция записи отметки загрузки | Function to write the ingestion stamp
+def write_ingest_stamp(points, session=requests):
+    """
+    Записывает отметку загрузки COLLECTION_NAME точкой в INGEST_STAMP_COLLECTION;
+    боты сбрасывают кэш ответов при её изменении. |
+    Writes the COLLECTION_NAME ingestion stamp as a point in INGEST_STAMP_COLLECTION;
+    bots clear their answer cache when it changes.
+    """
+    url = f"{QDRANT_URL}/collections/{INGEST_STAMP_COLLECTION}"
+    if session.get(url).status_code != 200:
+        session.put(url, json={"vectors": {"size": 1, "distance": "Dot"}})
+    point = {
+        "id": stamp_point_id(COLLECTION_NAME),
+        "vector": [1.0],
+        "payload": {"collection": COLLECTION_NAME, "points": points, "updated_at": time.time()},
+    }
+    r = session.put(f"{url}/points", params={"wait": "true"}, json={"points": [point]})
+    if r.status_code != 200:
+        print("Ошибка при записи отметки загрузки: | Error writing the ingestion stamp:", r.text)
+
+
+def input_signature(path):
+    """
+    Подпись входного файла для контрольной точки: путь, размер и sha1 содержимого. |
+    Input file signature for the checkpoint: path, size and content sha1.
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return {"input": os.path.abspath(path), "size": os.path.getsize(path), "sha1": digest.hexdigest()}
+
+
+def load_checkpoint(path, signature=None):
+    """
+    Номер первой незагруженной записи. Контрольная точка другого входного файла
+    игнорируется, загрузка начинается с начала. |
+    Index of the first record not loaded yet. A checkpoint of another input file is
+    ignored, and the ingestion starts from the beginning.
+    """
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("signature") != signature:
+            print(f"Контрольная точка {path} от другого входного файла, начинаем сначала | "
+                  f"Checkpoint {path} belongs to another input file, starting from the beginning")
+            return 0
+        return checkpoint.get("next_index", 0)
+    return 0
+
+
+def save_checkpoint(path, next_index, signature=None):
+    # Пишем во временный файл и атомарно заменяем | Write to a temp file and replace atomically
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"next_index": next_index, "signature": signature}, f)
+    os.replace(tmp_path, path)
+
+# Обработка одного батча: эмбеддинги + upsert | Process one batch: embeddings + upsert
+def process_batch(session, start, records, sparse_avg_length=None):
+    embeddings = get_embeddings([r.question for r in records], session)
+    if embeddings is None:
+        raise RuntimeError(f"Не удалось получить эмбеддинги для записей {start}..{start + len(records) - 1} | Failed to embed records {start}..{start + len(records) - 1}")
+    points = [
+        build_point(
+            vector, r.question, r.answer, r.skr, r.skr_2,
+            sparse_encoder.document_vector(sparse_text(r.question, r.answer), sparse_avg_length) if sparse_avg_length else None,
+            r.all_pages(),
+        )
+        for vector, r in zip(embeddings, records)
+    ]
+    upsert_points(points, session)
+    return start, len(records)
+
+# Потоковая загрузка с ограничением числа батчей в работе | Streaming ingestion with bounded batches in flight
+def ingest(records, batch_size=BATCH_SIZE, max_in_flight=MAX_IN_FLIGHT, checkpoint_path=CHECKPOINT_PATH, session=None,
+           sparse_avg_length=None, signature=None):
+    """
+    Читает записи из итератора батчами, для каждого делает один вызов эмбеддингов и один upsert,
+    держа в работе не больше max_in_flight батчей. После каждого батча сохраняется
+    непрерывно завершённый префикс, поэтому упавший запуск продолжается с места остановки.
+    Идентификаторы точек выводятся из содержимого, повторная загрузка батча идемпотентна.
+    В памяти одновременно не больше max_in_flight + 1 батчей, сколько бы ни было записей.
+
+    |
+
+    Reads records from an iterator in batches, makes one embedding call and one upsert per batch,
+    keeping at most max_in_flight batches in flight. After each batch the contiguous
+    completed prefix is checkpointed, so a crashed run resumes where it stopped.
+    Point ids are derived from content, so re-uploading a batch is idempotent.
+    At most max_in_flight + 1 batches are held in memory, however many records there are.
+
+    sparse_avg_length – средняя длина документа корпуса для BM25; если задана,
+    точки получают и разреженный вектор (гибридная коллекция). |
+    sparse_avg_length – corpus average document length for BM25; when set,
+    points also get a sparse vector (hybrid collection).
+
+    signature – подпись входного файла (input_signature), сохраняется в контрольной точке. |
+    signature – input file signature (input_signature), stored in the checkpoint.
+    """
+    session = session or make_session(max_in_flight)
+    start_index = load_checkpoint(checkpoint_path, signature) if checkpoint_path else 0
+    if start_index:
+        print(f"Продолжаем с записи {start_index} | Resuming from record {start_index}")
+
+    done = {}  # начало батча -> размер | batch start -> size
+    watermark = start_index
+    processed = 0
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        in_flight = set()
+
+        def drain(return_when):
+            nonlocal watermark, processed
+            finished, _ = wait(in_flight, return_when=return_when)
+            for future in finished:
+                in_flight.discard(future)
+                batch_start, size = future.result()
+                done[batch_start] = size
+                processed += size
+            # Двигаем контрольную точку по непрерывному префиксу | Advance the checkpoint over the contiguous prefix
+            while watermark in done:
+                watermark += done.pop(watermark)
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, watermark, signature)
+
+        records = islice(records, start_index, None)  # Пропускаем загруженное | Skip what is already loaded
+        batch_start = start_index
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            if len(in_flight) >= max_in_flight:
+                drain(FIRST_COMPLETED)
+            in_flight.add(pool.submit(process_batch, session, batch_start, batch, sparse_avg_length))
+            batch_start += len(batch)
+        if in_flight:
+            drain(ALL_COMPLETED)
+
+    elapsed = time.perf_counter() - started
+    return processed, elapsed
+
+# Инкрементальная синхронизация | Incremental synchronization
+def sync(records, batch_size=BATCH_SIZE, max_in_flight=MAX_IN_FLIGHT, session=None, sparse_avg_length=None):
+    """
+    Сравнивает записи с содержимым коллекции по id и content_hash: новые и
+    изменённые записи эмбеддятся и загружаются, устаревшие точки удаляются.
+    Стоимость пропорциональна размеру разницы, а не всего корпуса.
+    Записи читаются лениво, для всего корпуса хранятся только идентификаторы точек.
+
+    |
+
+    Diffs records against the collection by id and content_hash: new and changed
+    records are embedded and upserted, stale points are deleted. The cost is
+    proportional to the size of the diff, not the whole corpus.
+    Records are read lazily; only point ids are kept for the whole corpus.
+    """
+    session = session or make_session(max_in_flight)
+    existing = fetch_content_hashes(session)
+    desired = set()
+    unchanged = set()
+
+    def changed_records():
+        for r in records:
+            pid = point_id(r.question, r.skr, r.skr_2)
+            desired.add(pid)
+            if existing.get(pid) == content_hash(r.question, r.answer, r.skr, r.skr_2, r.all_pages()):
+                unchanged.add(pid)
+            else:
+                yield r
+
+    processed, elapsed = ingest(changed_records(), batch_size, max_in_flight, checkpoint_path=None, session=session,
+                                sparse_avg_length=sparse_avg_length)
+    stale = [pid for pid in existing if pid not in desired]
+    delete_points(stale, session)
+    return {
+        "unchanged": len(unchanged),
+        "upserted": processed,
+        "deleted": len(stale),
+        "expected": len(desired),
+        "elapsed": elapsed,
+    }
 
 # Тестовый пример | Test example
 if __name__ == "__main__":
-    create_collection()  # Создание коллекции при необходимости | Create collection if needed
-    # Загружаем вопрос-ответ данные из файла | Load question-answer data from file
-    with open('./result.pkl', 'rb') as f:
-        qa_db = pickle.load(f)
-
-    n = 0  # Счетчик поинтов | Points counter
-    for m in qa_db:
-        m_keys = list(m.keys())
-        qw = m[m_keys[0]]
-        ans = m[m_keys[1]]
-        skr = None
-        skr_2 = None
-        if len(m_keys) > 2:
-            skr = m[m_keys[2]]
-            if len(m_keys) > 3:
-                skr_2 = m[m_keys[3]]
-
-        # Получаем эмбеддинги через FastAPI сервис | Get embeddings via FastAPI service
-        embeddings = get_embeddings([qw])
-
-        # Записываем эмбеддинги в Qdrant | Insert embeddings into Qdrant
-        if embeddings:
-            insert_points_in_qdrant(embeddings[0], qw, ans, n, skr, skr_2)
-            n += 1
+    parser = argparse.ArgumentParser(description="Загрузка вопрос-ответ данных в Qdrant | Load question-answer data into Qdrant")
+    parser.add_argument("--input", default="./result.jsonl", help="JSONL-файл из get_pkl.py | JSONL file from get_pkl.py")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--in-flight", type=int, default=MAX_IN_FLIGHT)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--restart", action="store_true", help="Игнорировать контрольную точку | Ignore the checkpoint")
+    parser.add_argument("--sync", action="store_true", help="Загрузить только новые/изменённые записи и удалить устаревшие | Upsert only new/changed records and delete stale ones")
+    parser.add_argument("--hybrid", action="store_true", help="Добавить разреженный BM25-вектор (гибридный поиск) | Add a sparse BM25 vector (hybrid search)")
+    parser.add_argument("--profile", help="JSON-профиль коллекции (квантование, HNSW, on_disk, индексы) | Collection profile JSON (quantization, HNSW, on_disk, indexes)")
+    parser.add_argument("--quantization", choices=["int8"], help="Скалярное квантование векторов | Scalar vector quantization")
+    parser.add_argument("--hnsw-m", type=int)
+    parser.add_argument("--hnsw-ef-construct", type=int)
+    parser.add_argument("--on-disk-vectors", action="store_const", const=True, help="Хранить исходные векторы на диске | Keep original vectors on disk")
+    parser.add_argument("--on-disk-payload", action="store_const", const=True, help="Хранить payload на диске | Keep payload on disk")
+    parser.add_argument("--index-skr", action="store_const", const={"skr": "keyword", "skr_2": "keyword"},
+                        help="Индексы payload по skr/skr_2 | Payload indexes on skr/skr_2")
+    parser.add_argument("--local-index", help="Выгрузить коллекцию в снимок локального индекса (каталог) | Export the collection into a local index snapshot (directory)")
+    parser.add_argument("--pdf", help="PDF для предварительного рендеринга страниц из skr/skr_2 | PDF to pre-render the skr/skr_2 pages from")
+    args = parser.parse_args()
+
+    session = make_session(args.in_flight)
+    profile = load_collection_profile(
+        args.profile,
+        quantization=args.quantization,
+        hnsw_m=args.hnsw_m,
+        hnsw_ef_construct=args.hnsw_ef_construct,
+        on_disk_vectors=args.on_disk_vectors,
+        on_disk_payload=args.on_disk_payload,
+        payload_indexes=args.index_skr,
+    )
+    create_collection(session, args.hybrid, profile)  # Создание или донастройка коллекции | Create or retune the collection
+    # Записи читаются из файла лениво, на каждый проход заново | Records are read from the file lazily, anew for every pass
+    def records():
+        return read_jsonl(args.input)
+
+    # Средняя длина документа для BM25 считается по всему корпусу | BM25 average document length is computed over the whole corpus
+    sparse_avg_length = None
+    if args.hybrid:
+        sparse_avg_length = sparse_encoder.average_length(sparse_text(r.question, r.answer) for r in records())
+
+    if args.sync:
+        report = sync(records(), args.batch_size, args.in_flight, session, sparse_avg_length)
+        processed, elapsed, expected = report["upserted"], report["elapsed"], report["expected"]
+        print(f"Без изменений: {report['unchanged']}, загружено: {report['upserted']}, удалено: {report['deleted']} | "
+              f"Unchanged: {report['unchanged']}, upserted: {report['upserted']}, deleted: {report['deleted']}")
+    else:
+        if args.restart and os.path.exists(args.checkpoint):
+            os.remove(args.checkpoint)
+        processed, elapsed = ingest(records(), args.batch_size, args.in_flight, args.checkpoint, session, sparse_avg_length,
+                                    input_signature(args.input))
+        # Одинаковые записи дают одну точку | Identical records map to a single point
+        expected = len({point_id(r.question, r.skr, r.skr_2) for r in records()})
+
+    # Проверяем, что все точки применены | Check that all points were applied
+    count = wait_for_points(expected, session, exact=args.sync)
+    if count < expected or (args.sync and count != expected):
+        print(f"Внимание: в коллекции {count} точек из {expected} | Warning: collection has {count} of {expected} points")
+    elif os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    # Отметка загрузки сбрасывает семантический кэш ответов бота | The ingestion stamp clears the bot's semantic answer cache
+    write_ingest_stamp(count, session)
+
+    # Снимок для RETRIEVAL_BACKEND=local; боты подхватят его без перезапуска | Snapshot for RETRIEVAL_BACKEND=local; bots pick it up without a restart
+    if args.local_index:
+        vector_name = sparse_encoder.DENSE_VECTOR_NAME if args.hybrid else None
+        manifest = export_collection(QDRANT_URL, COLLECTION_NAME, args.local_index, vector_name=vector_name, session=session)
+        print(f"Локальный индекс: {manifest['snapshot']} | Local index: {manifest['snapshot']}")
+
+    # Заранее рендерим скриншоты страниц, на которые ссылаются ответы | Pre-render screenshots of pages referenced by answers
+    if args.pdf:
+        pages = referenced_pages(r.all_pages() for r in records())
+        cache_dir, rendered = prerender_pages(os.path.abspath(args.pdf), pages)
+        print(f"Отрендерено страниц: {rendered}, каталог: {cache_dir} | Pages rendered: {rendered}, directory: {cache_dir}")
 
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"Загружено {processed} записей за {elapsed:.1f} с ({rate:.1f} записей/с) | Loaded {processed} records in {elapsed:.1f} s ({rate:.1f} records/s)")
     print("Запись завершена | Writing completed")
@@ -0,0 +1,313 @@
+import argparse
+import json
+import mmap
+import os
+import shutil
+import time
+
+import numpy as np
+
+from embed_client import FASTAPI_EMBED_URL, ENCODE_HEADERS, encode_payload, decode_embeddings
+
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "./local_index")  # Каталог снимков локального индекса | Local index snapshot directory
+LOCAL_INDEX_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", "float32")  # float32 или int8 | float32 or int8
+MANIFEST_NAME = "manifest.json"  # Указатель на текущий снимок | Pointer to the current snapshot
+RELOAD_CHECK_INTERVAL = 10.0  # Как часто проверять манифест, с | How often to check the manifest, s
+KEEP_SNAPSHOTS = 2  # Сколько снимков хранить (старый нужен процессам, ещё не перезагрузившимся) | Snapshots to keep (the old one serves processes that have not reloaded yet)
+INT8_SCORE_CHUNK = 65536  # Строк int8-матрицы за один шаг скоринга | int8 matrix rows per scoring step
+PAYLOAD_FIELDS = ("question", "answer", "skr", "skr_2", "pages")  # Поля payload, нужные rag() | Payload fields rag() needs
+EXPORT_BATCH_SIZE = 256
+
+DTYPES = ("float32", "int8")
+
+
+class LocalHit:
+    """
+    Результат поиска с теми же полями, что и точка Qdrant (id, score, payload),
+    поэтому rag() обрабатывает оба бэкенда одинаково. |
+    A search result with the same fields as a Qdrant point (id, score, payload),
+    so rag() handles both backends the same way.
+    """
+
+    __slots__ = ("id", "score", "payload")
+
+    def __init__(self, id, score: float, payload: dict):
+        self.id = id
+        self.score = score
+        self.payload = payload
+
+
+class SnapshotWriter:
+    """
+    Пишет новый снимок индекса по частям: векторы дописываются в файл матрицы,
+    payload – в JSONL со смещениями строк. commit() атомарно переключает манифест,
+    и работающие боты подхватывают снимок без перезапуска.
+
+    |
+
+    Writes a new index snapshot incrementally: vectors are appended to the matrix
+    file, payloads to JSONL with line offsets. commit() switches the manifest
+    atomically, and running bots pick up the snapshot without a restart.
+    """
+
+    def __init__(self, index_dir: str = LOCAL_INDEX_DIR, dtype: str = LOCAL_INDEX_DTYPE):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown local index dtype {dtype!r}, expected one of {DTYPES}")
+        self.index_dir = index_dir
+        self.dtype = dtype
+        self.name = f"snapshot-{time.time_ns()}"  # Имена упорядочены по времени | Names sort by time
+        self.path = os.path.join(index_dir, self.name)
+        os.makedirs(self.path)
+        self.dim = None
+        self.count = 0
+        self._vectors = open(os.path.join(self.path, f"vectors.{dtype}"), "wb")
+        self._scales = open(os.path.join(self.path, "scales.f32"), "wb") if dtype == "int8" else None
+        self._payloads = open(os.path.join(self.path, "payload.jsonl"), "wb")
+        self._offsets = [0]
+
+    def add(self, ids, vectors, payloads):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValueError(f"Expected a 2-D vector batch, got shape {vectors.shape}")
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            # Строки матрицы снимка одной длины | Rows of the snapshot matrix have one length
+            raise ValueError(f"Vector dimension {vectors.shape[1]} does not match the snapshot dimension {self.dim}")
+        # Храним нормированные векторы: скалярное произведение = косинус | Store normalized vectors: dot product = cosine
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms > 0, norms, 1.0)
+        if self.dtype == "int8":
+            # Симметричное квантование с масштабом на строку | Symmetric quantization with a per-row scale
+            scales = np.abs(vectors).max(axis=1, keepdims=True) / 127.0
+            scales[scales == 0] = 1.0
+            self._vectors.write(np.round(vectors / scales).astype(np.int8).tobytes())
+            self._scales.write(scales.astype(np.float32).tobytes())
+        else:
+            self._vectors.write(vectors.tobytes())
+        for point_id, payload in zip(ids, payloads):
+            line = json.dumps({"id": point_id, **{k: payload.get(k) for k in PAYLOAD_FIELDS}}, ensure_ascii=False)
+            self._payloads.write(line.encode("utf-8") + b"\n")
+            self._offsets.append(self._payloads.tell())
+        self.count += len(vectors)
+
+    def commit(self):
+        for f in (self._vectors, self._scales, self._payloads):
+            if f is not None:
+                f.close()
+        np.asarray(self._offsets, dtype=np.uint64).tofile(os.path.join(self.path, "offsets.u64"))
+        manifest = {"snapshot": self.name, "dtype": self.dtype, "dim": self.dim or 0, "count": self.count,
+                    "created_at": time.time()}
+        tmp_path = os.path.join(self.index_dir, MANIFEST_NAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(self.index_dir, MANIFEST_NAME))
+        self._prune()
+        return manifest
+
+    def _prune(self):
+        snapshots = sorted(d for d in os.listdir(self.index_dir)
+                           if d.startswith("snapshot-") and os.path.isdir(os.path.join(self.index_dir, d)))
+        for name in snapshots[:-KEEP_SNAPSHOTS]:
+            if name != self.name:
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+
+
+class LocalIndex:
+    """
+    Локальный векторный индекс в памяти процесса для небольших корпусов: матрица
+    отображается в память (mmap), поиск – одно матрично-векторное произведение и
+    np.argpartition для top-k, payload читается только для найденных строк.
+    Новый снимок (изменение манифеста) подхватывается автоматически.
+
+    |
+
+    In-process vector index for small corpora: the matrix is memory-mapped, a search
+    is one matrix-vector product plus np.argpartition for top-k, and payloads are
+    read only for the rows found. A new snapshot (manifest change) is picked up
+    automatically.
+    """
+
+    def __init__(self, index_dir: str = LOCAL_INDEX_DIR, check_interval: float = RELOAD_CHECK_INTERVAL):
+        self.index_dir = index_dir
+        self.check_interval = check_interval
+        self.manifest = None
+        self._manifest_mtime = None
+        self._checked_at = 0.0
+        self._vectors = None
+        self._scales = None
+        self._offsets = None
+        self._payload_file = None
+        self._payloads = None
+        self.reloads = 0
+        self.maybe_reload(force=True)
+        if self.manifest is None:
+            print(f"Локальный индекс: нет {self._manifest_path()}, индекс пуст до появления снимка | "
+                  f"Local index: no {self._manifest_path()}, the index is empty until a snapshot appears")
+
+    def _manifest_path(self):
+        return os.path.join(self.index_dir, MANIFEST_NAME)
+
+    def maybe_reload(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self._manifest_path()).st_mtime
+        except OSError:
+            return
+        if mtime != self._manifest_mtime:
+            self._load()
+            self._manifest_mtime = mtime
+
+    def _load(self):
+        with open(self._manifest_path(), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        path = os.path.join(self.index_dir, manifest["snapshot"])
+        count, dim, dtype = manifest["count"], manifest["dim"], manifest["dtype"]
+        vectors = scales = payloads = None
+        payload_file = open(os.path.join(path, "payload.jsonl"), "rb")
+        if count:
+            vectors = np.memmap(os.path.join(path, f"vectors.{dtype}"), dtype=dtype, mode="r", shape=(count, dim))
+            if dtype == "int8":
+                scales = np.fromfile(os.path.join(path, "scales.f32"), dtype=np.float32)
+            payloads = mmap.mmap(payload_file.fileno(), 0, access=mmap.ACCESS_READ)
+        offsets = np.fromfile(os.path.join(path, "offsets.u64"), dtype=np.uint64)
+
+        # Подменяем ссылки разом; старый снимок освобождается сборщиком мусора |
+        # Swap references at once; the old snapshot is released by the garbage collector
+        old_file = self._payload_file
+        self.manifest, self._vectors, self._scales, self._offsets = manifest, vectors, scales, offsets
+        self._payloads, self._payload_file = payloads, payload_file
+        self.reloads += 1
+        if old_file is not None:
+            old_file.close()
+        print(f"Локальный индекс: снимок {manifest['snapshot']}, {count} векторов | "
+              f"Local index: snapshot {manifest['snapshot']}, {count} vectors")
+
+    def _scores(self, query):
+        if self._scales is None:
+            return np.asarray(self._vectors @ query)
+        # int8: скоринг блоками, чтобы не превращать всю матрицу в float32 |
+        # int8: score in chunks so the whole matrix is never converted to float32
+        scores = np.empty(len(self._vectors), dtype=np.float32)
+        for start in range(0, len(self._vectors), INT8_SCORE_CHUNK):
+            block = self._vectors[start:start + INT8_SCORE_CHUNK].astype(np.float32)
+            scores[start:start + len(block)] = block @ query
+        return scores * self._scales
+
+    def _payload(self, row: int):
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        return json.loads(self._payloads[start:end])
+
+    def search(self, vector, limit: int):
+        """
+        Возвращает до limit ближайших точек (LocalHit) по косинусной близости. |
+        Returns up to limit nearest points (LocalHit) by cosine similarity.
+        """
+        self.maybe_reload()
+        if self._vectors is None or limit <= 0:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = self._scores(query)
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        hits = []
+        for row in top:
+            payload = self._payload(int(row))
+            hits.append(LocalHit(payload.pop("id"), float(scores[row]), payload))
+        return hits
+
+    def stats(self):
+        return {
+            "snapshot": self.manifest["snapshot"] if self.manifest else None,
+            "dtype": self.manifest["dtype"] if self.manifest else None,
+            "count": self.manifest["count"] if self.manifest else 0,
+            "reloads": self.reloads,
+        }
+
+
+def export_collection(qdrant_url: str, collection: str, index_dir: str = LOCAL_INDEX_DIR,
+                      dtype: str = LOCAL_INDEX_DTYPE, vector_name: str = None, session=None):
+    """
+    Выгружает коллекцию Qdrant (векторы и payload) в новый снимок локального индекса. |
+    Exports a Qdrant collection (vectors and payloads) into a new local index snapshot.
+    """
+    import requests
+
+    session = session or requests
+    writer = SnapshotWriter(index_dir, dtype)
+    offset = None
+    while True:
+        body = {"limit": 1000, "with_payload": list(PAYLOAD_FIELDS), "with_vector": True}
+        if offset is not None:
+            body["offset"] = offset
+        r = session.post(f"{qdrant_url}/collections/{collection}/points/scroll", json=body)
+        r.raise_for_status()
+        result = r.json()["result"]
+        points = result["points"]
+        if points:
+            # В гибридной коллекции векторы именованные | Vectors are named in a hybrid collection
+            vectors = [p["vector"][vector_name] if vector_name else p["vector"] for p in points]
+            writer.add([str(p["id"]) for p in points], vectors, [p.get("payload") or {} for p in points])
+        offset = result.get("next_page_offset")
+        if offset is None:
+            return writer.commit()
+
+
+def build_from_records(records, index_dir: str = LOCAL_INDEX_DIR, dtype: str = LOCAL_INDEX_DTYPE,
+                       batch_size: int = EXPORT_BATCH_SIZE, session=None):
+    """
+    Строит снимок прямо из записей (result.jsonl) через сервис эмбеддингов, без Qdrant.
+    Записи с одинаковым id схлопываются (побеждает последняя), как при upsert в Qdrant;
+    в памяти держатся только записи, эмбеддинги считаются батчами. |
+    Builds a snapshot straight from records (result.jsonl) via the embedding service,
+    without Qdrant. Records sharing an id collapse (last one wins), as Qdrant upserts do;
+    only the records stay in memory, embeddings are computed in batches.
+    """
+    from itertools import islice
+
+    import requests
+    from load_to_qdrant import point_id
+
+    session = session or requests
+    writer = SnapshotWriter(index_dir, dtype)
+    unique = {}
+    for m in records:
+        unique[point_id(m.question, m.skr, m.skr_2)] = m
+    items = iter(unique.items())
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            return writer.commit()
+        r = session.post(FASTAPI_EMBED_URL, headers=ENCODE_HEADERS,
+                         data=encode_payload([m.question for _, m in batch]))
+        r.raise_for_status()
+        writer.add(
+            [pid for pid, _ in batch],
+            decode_embeddings(r.content, r.headers),
+            [{"question": m.question, "answer": m.answer, "skr": m.skr, "skr_2": m.skr_2, "pages": m.all_pages()}
+             for _, m in batch],
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Снимок локального векторного индекса | Local vector index snapshot")
+    parser.add_argument("source", choices=["qdrant", "jsonl"], help="Откуда строить снимок | Where to build the snapshot from")
+    parser.add_argument("--input", default="./result.jsonl", help="Для jsonl: файл из get_pkl.py | For jsonl: file from get_pkl.py")
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL", "http://localhost:6333"))
+    parser.add_argument("--collection", default="Client_bd")
+    parser.add_argument("--vector-name", help="Имя плотного вектора гибридной коллекции (dense) | Dense vector name of a hybrid collection (dense)")
+    parser.add_argument("--index-dir", default=LOCAL_INDEX_DIR)
+    parser.add_argument("--dtype", choices=DTYPES, default=LOCAL_INDEX_DTYPE)
+    args = parser.parse_args()
+
+    if args.source == "qdrant":
+        manifest = export_collection(args.qdrant_url, args.collection, args.index_dir, args.dtype, args.vector_name)
+    else:
+        from qa_records import read_jsonl
+
+        manifest = build_from_records(read_jsonl(args.input), args.index_dir, args.dtype)
+    print(f"Снимок {manifest['snapshot']}: {manifest['count']} векторов | Snapshot {manifest['snapshot']}: {manifest['count']} vectors")
@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", "./page_cache")  # Каталог кэша скриншотов | Page screenshot cache directory
+PAGE_DPI = int(os.getenv("PAGE_DPI", "110"))  # Разрешение рендеринга | Rendering resolution
+PAGE_JPEG_QUALITY = int(os.getenv("PAGE_JPEG_QUALITY", "80"))  # Качество JPEG | JPEG quality
+RENDER_WORKERS = int(os.getenv("PAGE_RENDER_WORKERS", "2"))  # Процессов для рендеринга | Rendering processes
+
+
+def pdf_signature(pdf_path: str) -> str:
+    """
+    Короткий хэш содержимого PDF: при замене файла кэш автоматически становится новым. |
+    Short content hash of the PDF: replacing the file automatically starts a new cache.
+    """
+    digest = hashlib.sha1()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def cache_dir_for(pdf_path: str, dpi: int = PAGE_DPI, cache_root: str = PAGE_CACHE_DIR) -> str:
+    return os.path.join(cache_root, f"{pdf_signature(pdf_path)}_{dpi}dpi")
+
+
+def page_image_path(cache_dir: str, page: int) -> str:
+    return os.path.join(cache_dir, f"page_{page:04d}.jpg")
+
+
+def render_page(pdf_path: str, page: int, cache_dir: str, dpi: int = PAGE_DPI, quality: int = PAGE_JPEG_QUALITY):
+    """
+    Рендерит одну страницу PDF в JPEG в каталоге кэша (файл появляется атомарно).
+    Возвращает путь к файлу или None, если страницу извлечь не удалось.
+    Функция верхнего уровня, чтобы её можно было выполнять в пуле процессов.
+
+    |
+
+    Renders one PDF page to a JPEG in the cache directory (the file appears atomically).
+    Returns the file path, or None if the page could not be extracted.
+    A top-level function so it can run in a process pool.
+    """
+    path = page_image_path(cache_dir, page)
+    if os.path.exists(path):
+        return path
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=page, last_page=page)
+    if not images:
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    images[0].save(tmp_path, format="JPEG", quality=quality, optimize=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def referenced_pages(records):
+    """
+    Номера страниц, на которые ссылаются записи; records – списки страниц записей
+    (QARecord.all_pages). |
+    Page numbers referenced by records; records are the records' page lists
+    (QARecord.all_pages).
+    """
+    pages = set()
+    for record_pages in records:
+        for value in record_pages:
+            if value and str(value).strip().isdigit():
+                pages.add(int(value))
+    return sorted(pages)
+
+
+def prerender_pages(pdf_path: str, pages=None, dpi: int = PAGE_DPI, quality: int = PAGE_JPEG_QUALITY,
+                    cache_root: str = PAGE_CACHE_DIR, workers: int = RENDER_WORKERS):
+    """
+    Заранее рендерит страницы (по умолчанию все) в пуле процессов. Уже готовые пропускаются. |
+    Pre-renders pages (all by default) in a process pool. Existing ones are skipped.
+
+    Возвращает (каталог кэша, число отрендеренных страниц). | Returns (cache directory, pages rendered).
+    """
+    cache_dir = cache_dir_for(pdf_path, dpi, cache_root)
+    if pages is None:
+        pages = range(1, pdfinfo_from_path(pdf_path)["Pages"] + 1)
+    todo = [p for p in pages if not os.path.exists(page_image_path(cache_dir, p))]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(render_page, [pdf_path] * len(todo), todo, [cache_dir] * len(todo),
+                      [dpi] * len(todo), [quality] * len(todo)))
+    return cache_dir, len(todo)
+
+
+class PageImageCache:
+    """
+    Кэш скриншотов страниц для бота:
+      1. file_id Telegram, полученный после первой отправки, – повторная отправка без загрузки файла;
+      2. JPEG на диске, отрендеренный заранее (prerender_pages) или ранее;
+      3. рендеринг в пуле процессов, не блокирующий event loop.
+    file_id сохраняются в file_ids.json и переживают перезапуск.
+
+    |
+
+    Page screenshot cache for the bot:
+      1. the Telegram file_id returned by the first upload – repeat sends upload nothing;
+      2. a JPEG on disk, rendered ahead of time (prerender_pages) or earlier;
+      3. rendering in a process pool that does not block the event loop.
+    file_ids are stored in file_ids.json and survive restarts.
+    """
+
+    def __init__(self, pdf_path: str, dpi: int = PAGE_DPI, quality: int = PAGE_JPEG_QUALITY,
+                 cache_root: str = PAGE_CACHE_DIR, workers: int = RENDER_WORKERS):
+        self.pdf_path = pdf_path
+        self.dpi = dpi
+        self.quality = quality
+        self.workers = workers
+        self.cache_root = cache_root
+        self.cache_dir = None
+        self._file_ids_path = None
+        self._file_ids = {}
+        self._pool = None
+        self._rendering = {}  # страница -> future рендеринга | page -> rendering future
+
+    def _open(self):
+        # Каталог кэша определяется по содержимому PDF при первом обращении |
+        # The cache directory is resolved from the PDF contents on first use
+        if self.cache_dir is not None:
+            return
+        self.cache_dir = cache_dir_for(self.pdf_path, self.dpi, self.cache_root)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._file_ids_path = os.path.join(self.cache_dir, "file_ids.json")
+        if os.path.exists(self._file_ids_path):
+            with open(self._file_ids_path, "r", encoding="utf-8") as f:
+                self._file_ids = json.load(f)
+
+    async def open(self):
+        # sha1 многомегабайтного PDF считается в потоке, а не в event loop | The sha1 of a multi-megabyte PDF is computed in a thread, not in the event loop
+        if self.cache_dir is None:
+            await asyncio.to_thread(self._open)
+
+    async def _render(self, page: int):
+        # Одна и та же страница рендерится один раз, даже при одновременных запросах |
+        # The same page is rendered once even under concurrent requests
+        future = self._rendering.get(page)
+        if future is None:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._pool, render_page, self.pdf_path, page, self.cache_dir, self.dpi, self.quality)
+            self._rendering[page] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if future.done():
+                self._rendering.pop(page, None)
+
+    async def get_photo(self, page: int):
+        """
+        Возвращает file_id (строка) или FSInputFile для отправки, либо None, если страницы нет. |
+        Returns a file_id (string) or an FSInputFile to send, or None if the page does not exist.
+        """
+        from aiogram.types.input_file import FSInputFile  # Импорт здесь: загрузчику данных aiogram не нужен | Imported here: the ingestion script does not need aiogram
+
+        await self.open()
+        file_id = self._file_ids.get(str(page))
+        if file_id:
+            return file_id
+        path = page_image_path(self.cache_dir, page)
+        if not os.path.exists(path):
+            path = await self._render(page)
+            if path is None:
+                return None
+        return FSInputFile(path)
+
+    def remember(self, page: int, sent_message):
+        """
+        Запоминает file_id отправленной фотографии. | Remembers the file_id of a sent photo.
+        """
+        if not sent_message or not sent_message.photo or str(page) in self._file_ids:
+            return
+        self._file_ids[str(page)] = sent_message.photo[-1].file_id
+        tmp_path = self._file_ids_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._file_ids, f)
+        os.replace(tmp_path, self._file_ids_path)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Предварительный рендеринг страниц PDF | Pre-render PDF pages")
+    parser.add_argument("--pdf", default="./file.pdf")
+    parser.add_argument("--dpi", type=int, default=PAGE_DPI)
+    parser.add_argument("--quality", type=int, default=PAGE_JPEG_QUALITY)
+    parser.add_argument("--workers", type=int, default=RENDER_WORKERS)
+    args = parser.parse_args()
+
+    out_dir, rendered = prerender_pages(os.path.abspath(args.pdf), dpi=args.dpi, quality=args.quality, workers=args.workers)
+    print(f"Отрендерено страниц: {rendered}, каталог: {out_dir} | Pages rendered: {rendered}, directory: {out_dir}")
@@ -0,0 +1,179 @@
+import os
+import re
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))  # Максимум токенов промпта | Max prompt tokens
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "600"))  # Из них на историю диалога | Of which for the conversation history
+HISTORY_TURN_TOKENS = int(os.getenv("HISTORY_TURN_TOKENS", "200"))  # Длина сохранённого ответа в истории | Stored answer length in the history
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "cl100k_base")  # Кодировка tiktoken | tiktoken encoding
+MIN_CONTEXT_TOKENS = 64  # Меньший остаток бюджета не тратим на обрезанный ответ | A smaller leftover budget is not spent on a truncated answer
+DEDUP_THRESHOLD = 0.8  # Доля общих слов, при которой ответы считаются повтором | Shared word ratio at which answers are duplicates
+CHARS_PER_TOKEN = 3  # Оценка без токенизатора (русский текст) | Estimate without a tokenizer (Russian text)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """
+    Локальный токенизатор tiktoken, если установлен; иначе None и оценка по символам.
+    Загружается при первом подсчёте, а не при импорте: без кэша (TIKTOKEN_CACHE_DIR)
+    tiktoken скачивает словарь из сети. Токенизатор DeepSeek отличается, но для
+    бюджета достаточно близкой оценки. |
+    The local tiktoken tokenizer when installed; otherwise None and a per-character
+    estimate. Loaded on the first count rather than at import: without a cache
+    (TIKTOKEN_CACHE_DIR) tiktoken downloads the vocabulary. The DeepSeek tokenizer
+    differs, but a close estimate is enough for a budget.
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding(PROMPT_TOKENIZER)
+        except Exception:
+            _encoding = None
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    Обрезает текст до max_tokens, по возможности по границе строки или предложения. |
+    Truncates text to max_tokens, at a line or sentence boundary when possible.
+    """
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    else:
+        cut = text[:max_tokens * CHARS_PER_TOKEN]
+    boundary = max(cut.rfind("\n"), cut.rfind(". "))
+    if boundary > len(cut) // 2:
+        cut = cut[:boundary + 1]
+    return cut.rstrip() + " …"
+
+
+def _words(text: str):
+    return set(_WORD_RE.findall(text.lower()))
+
+
+def deduplicate(contexts, threshold: float = DEDUP_THRESHOLD):
+    """
+    Убирает ответы, почти совпадающие с более релевантными: вложенные целиком или
+    с долей общих слов не меньше threshold. contexts – [(оценка, текст, ...)],
+    остальные поля кортежа сохраняются. |
+    Drops answers that nearly repeat more relevant ones: fully contained or sharing
+    at least threshold of their words. contexts is [(score, text, ...)], the other
+    tuple fields are kept.
+    """
+    kept = []
+    for context in sorted(contexts, key=lambda c: c[0], reverse=True):
+        text = context[1]
+        words = _words(text)
+        duplicate = False
+        for kept_context, kept_words in kept:
+            kept_text = kept_context[1]
+            if text.strip() in kept_text:
+                duplicate = True
+                break
+            smaller = min(len(words), len(kept_words))
+            if smaller and len(words & kept_words) / smaller >= threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append((context, words))
+    return [context for context, _ in kept]
+
+
+def compress_turn(question: str, answer: str, max_tokens: int = HISTORY_TURN_TOKENS):
+    """
+    Сжатая запись истории: полный вопрос и ответ, обрезанный до max_tokens.
+    Хранится в состоянии чата, поэтому сжимается один раз. |
+    A compressed history entry: the full question and the answer truncated to max_tokens.
+    It is stored in the chat state, so it is compressed once.
+    """
+    return {"user": question, "bot": truncate_tokens(answer, max_tokens)}
+
+
+def _pack_history(history, budget: int):
+    # Самые свежие ходы важнее; не влезающий ход сокращается до вопроса |
+    # Recent turns matter most; a turn that does not fit is reduced to its question
+    lines = []
+    used = 0
+    for pair in reversed(history):
+        full = f"Вопрос: {pair['user']}\nОтвет: {truncate_tokens(pair['bot'], HISTORY_TURN_TOKENS)}\n"
+        question_only = f"Вопрос: {pair['user']}\n"
+        for text in (full, question_only):
+            tokens = count_tokens(text)
+            if used + tokens <= budget:
+                lines.append(text)
+                used += tokens
+                break
+        else:
+            break
+    return "".join(reversed(lines)), used
+
+
+def pack_prompt(question: str, contexts, history, render, budget: int = PROMPT_TOKEN_BUDGET,
+                history_budget: int = HISTORY_TOKEN_BUDGET):
+    """
+    Собирает промпт в пределах бюджета токенов:
+      - история – самые свежие ходы в пределах history_budget;
+      - контекст – ответы без повторов по убыванию релевантности, пока есть бюджет
+        (последний по возможности обрезается).
+    contexts – [(оценка, текст, ...)], render(question, context, history) – шаблон промпта.
+    Возвращает (промпт, статистика, попавшие в промпт контексты).
+
+    |
+
+    Builds the prompt within a token budget:
+      - history – the most recent turns within history_budget;
+      - context – deduplicated answers in decreasing relevance while the budget lasts
+        (the last one is truncated when possible).
+    contexts is [(score, text, ...)], render(question, context, history) is the prompt template.
+    Returns (prompt, stats, contexts that made it into the prompt).
+    """
+    base_tokens = count_tokens(render(question, "", ""))
+    history_text, history_tokens = _pack_history(history, min(history_budget, max(budget - base_tokens, 0)))
+
+    remaining = budget - base_tokens - history_tokens
+    unique = deduplicate(contexts)
+    parts = []
+    used = []
+    for context in unique:
+        text = context[1]
+        tokens = count_tokens(text) + 1  # + перевод строки | + newline
+        if tokens <= remaining:
+            parts.append(text)
+            used.append(context)
+            remaining -= tokens
+        else:
+            if remaining >= MIN_CONTEXT_TOKENS:
+                parts.append(truncate_tokens(text, remaining - 1))
+                used.append(context)
+            break
+
+    prompt = render(question, "\n".join(parts), history_text)
+    return prompt, {
+        "prompt_tokens": count_tokens(prompt),
+        "history_tokens": history_tokens,
+        "contexts": len(contexts),
+        "contexts_used": len(parts),
+        "duplicates": len(contexts) - len(unique),
+        "tokenizer": PROMPT_TOKENIZER if _get_encoding() is not None else "estimate",
+    }, used
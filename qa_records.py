@@ -0,0 +1,93 @@
+import json
+
+# Схема строки result.jsonl: обязательные и необязательные поля |
+# result.jsonl line schema: required and optional fields
+REQUIRED_FIELDS = ("question", "answer")
+PAGE_FIELDS = ("skr", "skr_2", "skr_3")  # Страницы скриншотов | Screenshot pages
+# pages – все страницы, если их больше трёх (записи, слитые dedup_qa.py) | pages – all pages when there are more than three (records merged by dedup_qa.py)
+OPTIONAL_FIELDS = PAGE_FIELDS + ("pages",)
+FIELDS = REQUIRED_FIELDS + OPTIONAL_FIELDS
+
+
+class QARecord:
+    """
+    Пара вопрос-ответ со страницами скриншотов. Поля фиксированы (__slots__),
+    поэтому запись компактна в памяти и не зависит от порядка ключей. |
+    A question-answer pair with screenshot pages. Fields are fixed (__slots__),
+    so a record is compact in memory and does not depend on key order.
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(self, question: str, answer: str, skr: str = None, skr_2: str = None, skr_3: str = None,
+                 pages: list = None):
+        self.question = question
+        self.answer = answer
+        self.skr = skr
+        self.skr_2 = skr_2
+        self.skr_3 = skr_3
+        self.pages = pages
+
+    def all_pages(self):
+        """
+        Все страницы скриншотов без повторов: skr, skr_2, skr_3, затем pages. |
+        All screenshot pages without repeats: skr, skr_2, skr_3, then pages.
+        """
+        pages = []
+        for page in [getattr(self, name) for name in PAGE_FIELDS] + list(self.pages or []):
+            if page and page not in pages:
+                pages.append(page)
+        return pages
+
+    def to_dict(self):
+        # Пустые страницы не пишем | Empty pages are omitted
+        return {name: getattr(self, name) for name in FIELDS if getattr(self, name) is not None}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        unknown = set(data) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Неизвестные поля записи | Unknown record fields: {sorted(unknown)}")
+        missing = [name for name in REQUIRED_FIELDS if not isinstance(data.get(name), str)]
+        if missing:
+            raise ValueError(f"Нет обязательных полей записи | Missing required record fields: {missing}")
+        return cls(**data)
+
+    def __eq__(self, other):
+        if not isinstance(other, QARecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in FIELDS)
+
+    def __repr__(self):
+        return f"QARecord({self.to_dict()!r})"
+
+
+def write_jsonl(records, path: str, append: bool = False) -> int:
+    """
+    Пишет записи построчно (одна JSON-строка на запись) и возвращает их число.
+    С append=True дописывает в конец существующего файла. |
+    Writes records line by line (one JSON line per record) and returns their count.
+    With append=True appends to the end of an existing file.
+    """
+    count = 0
+    with open(path, "a" if append else "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record.to_dict(), ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def read_jsonl(path: str):
+    """
+    Лениво читает записи из JSONL-файла: в памяти одна строка за раз. |
+    Lazily reads records from a JSONL file: one line in memory at a time.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield QARecord.from_dict(json.loads(line))
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: {e}") from e
@@ -0,0 +1,218 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+import tracing
+
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))  # Одновременных запросов к LLM на весь бот | Concurrent LLM requests for the whole bot
+QUEUE_MAX_PENDING = int(os.getenv("QUEUE_MAX_PENDING", "200"))  # Ожидающих сообщений на все чаты | Pending messages across all chats
+QUEUE_MAX_PER_CHAT = int(os.getenv("QUEUE_MAX_PER_CHAT", "5"))  # Ожидающих сообщений в одном чате | Pending messages in one chat
+COALESCE_MS = float(os.getenv("QUEUE_COALESCE_MS", "300"))  # Окно склейки быстрых сообщений, мс (0 – только накопленные) | Window for merging quick messages, ms (0 – backlog only)
+COALESCE_MAX_MESSAGES = 5  # Максимум сообщений в одном склеенном запросе | Max messages in one merged request
+
+BUSY_TEXT = "Сейчас слишком много запросов, попробуйте через минуту."  # Ответ при переполненной очереди | Reply when the queue is full
+
+# Метрики создаются только при METRICS_ENABLED | Metrics are created only with METRICS_ENABLED
+_queue_wait_seconds = None
+_llm_wait_seconds = None
+_events_total = None
+
+
+def _init_metrics(scheduler, llm_in_flight):
+    global _queue_wait_seconds, _llm_wait_seconds, _events_total
+    from prometheus_client import Counter, Gauge, Histogram
+
+    _queue_wait_seconds = Histogram("bot_queue_wait_seconds", "Time a message waits in its chat queue",
+                                    buckets=tracing.LATENCY_BUCKETS)
+    _llm_wait_seconds = Histogram("bot_llm_wait_seconds", "Time a request waits for an LLM slot",
+                                  buckets=tracing.LATENCY_BUCKETS)
+    _events_total = Counter("bot_queue_events_total", "Scheduler events", ["event"])
+    # Значения считываются при сборе метрик | Values are read at scrape time
+    Gauge("bot_queue_depth", "Pending messages across all chats").set_function(lambda: scheduler.pending)
+    Gauge("bot_active_chats", "Chats with queued or running requests").set_function(lambda: len(scheduler.chats))
+    Gauge("bot_llm_in_flight", "LLM requests in flight").set_function(llm_in_flight)
+
+
+def _count(event: str, amount: int = 1):
+    if _events_total is not None:
+        _events_total.labels(event).inc(amount)
+
+
+class LLMSlots:
+    """
+    Глобальный лимит одновременных запросов к LLM (общий для всех чатов). |
+    Global limit of concurrent LLM requests (shared by all chats).
+
+        async with llm_slots:
+            ...
+    """
+
+    def __init__(self, limit: int = LLM_MAX_IN_FLIGHT):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __aenter__(self):
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        wait = time.perf_counter() - started
+        tracing.observe("llm_wait", wait)
+        if _llm_wait_seconds is not None:
+            _llm_wait_seconds.observe(wait)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        self._semaphore.release()
+        return False
+
+
+class _ChatQueue:
+    __slots__ = ("items", "last_arrival", "worker")
+
+    def __init__(self):
+        self.items = deque()  # (сообщение, состояние, время постановки) | (message, state, enqueue time)
+        self.last_arrival = 0.0
+        self.worker = None
+
+
+def _queue_key(message):
+    # В группе у каждого участника своё состояние FSM: очередь – на пару (чат, отправитель) |
+    # In a group every member has their own FSM state: one queue per (chat, sender) pair
+    return message.chat.id, message.from_user.id if message.from_user else None
+
+
+class ChatScheduler:
+    """
+    Очередь сообщений по чатам (и отправителям в группах) перед обработчиком запроса:
+      - сообщения одного отправителя в чате обрабатываются строго по очереди;
+      - сообщения, присланные подряд (в пределах coalesce_ms) или накопившиеся,
+        пока чат был занят, склеиваются в один запрос;
+      - очередь ограничена (на чат и всего), при переполнении пользователь сразу
+        получает ответ «занято», а не ждёт таймаута.
+
+    |
+
+    Per-chat (and per-sender in groups) message queue in front of the query handler:
+      - messages of one sender in a chat are processed strictly in order;
+      - messages sent in quick succession (within coalesce_ms) or piled up while
+        the chat was busy are merged into one request;
+      - the queue is bounded (per chat and in total); when it is full the user gets
+        an immediate "busy" reply instead of waiting for a timeout.
+
+    handler(message, state, text) – корутина обработки (склеенного) запроса. |
+    handler(message, state, text) – coroutine that processes a (merged) request.
+    """
+
+    def __init__(self, handler, max_pending: int = QUEUE_MAX_PENDING, max_per_chat: int = QUEUE_MAX_PER_CHAT,
+                 coalesce_ms: float = COALESCE_MS, coalesce_max: int = COALESCE_MAX_MESSAGES):
+        self.handler = handler
+        self.max_pending = max_pending
+        self.max_per_chat = max_per_chat
+        self.coalesce = coalesce_ms / 1000.0
+        self.coalesce_max = coalesce_max
+        self.chats = {}
+        self.pending = 0
+
+        # Счётчики | Counters
+        self.accepted = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.processed = 0
+        self.queue_wait_sum = 0.0
+        self.queue_wait_max = 0.0
+
+    async def submit(self, message, state):
+        """
+        Ставит сообщение в очередь его чата; при переполнении отвечает BUSY_TEXT и возвращает False. |
+        Enqueues a message into its chat queue; when full, replies with BUSY_TEXT and returns False.
+        """
+        key = _queue_key(message)
+        chat = self.chats.get(key)
+        if self.pending >= self.max_pending or (chat is not None and len(chat.items) >= self.max_per_chat):
+            self.rejected += 1
+            _count("rejected")
+            await message.answer(BUSY_TEXT)
+            return False
+
+        if chat is None:
+            chat = self.chats[key] = _ChatQueue()
+        now = time.perf_counter()
+        chat.items.append((message, state, now))
+        chat.last_arrival = now
+        self.pending += 1
+        self.accepted += 1
+        _count("accepted")
+        if chat.worker is None:
+            chat.worker = asyncio.create_task(self._run_chat(key, chat))
+        return True
+
+    async def _run_chat(self, key, chat: _ChatQueue):
+        try:
+            while chat.items:
+                # Ждём, пока пользователь закончит серию сообщений | Wait until the user finishes a burst of messages
+                while self.coalesce > 0:
+                    quiet = chat.last_arrival + self.coalesce - time.perf_counter()
+                    if quiet <= 0 or len(chat.items) >= self.coalesce_max:
+                        break
+                    await asyncio.sleep(quiet)
+
+                batch = [chat.items.popleft() for _ in range(min(self.coalesce_max, len(chat.items)))]
+                self.pending -= len(batch)
+                started = time.perf_counter()
+                for _, _, enqueued_at in batch:
+                    wait = started - enqueued_at
+                    self.queue_wait_sum += wait
+                    self.queue_wait_max = max(self.queue_wait_max, wait)
+                    if _queue_wait_seconds is not None:
+                        _queue_wait_seconds.observe(wait)
+                if len(batch) > 1:
+                    self.coalesced += len(batch) - 1
+                    _count("coalesced", len(batch) - 1)
+
+                # Отвечаем на последнее сообщение серии, текст – все сообщения по порядку |
+                # Reply to the last message of the burst, the text is all messages in order
+                message, state, _ = batch[-1]
+                text = "\n".join(m.text for m, _, _ in batch if m.text)
+                try:
+                    await self.handler(message, state, text)
+                except Exception as e:
+                    print(f"Ошибка обработки запроса чата {key[0]} | Request error in chat {key[0]}: {e}")
+                self.processed += 1
+        finally:
+            self.pending -= len(chat.items)
+            chat.items.clear()
+            if self.chats.get(key) is chat:
+                del self.chats[key]
+
+    async def close(self):
+        workers = [chat.worker for chat in self.chats.values() if chat.worker is not None]
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    def stats(self):
+        waited = self.accepted - self.pending
+        return {
+            "pending": self.pending,
+            "active_chats": len(self.chats),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "coalesced": self.coalesced,
+            "processed": self.processed,
+            "avg_queue_wait_ms": 1000.0 * self.queue_wait_sum / waited if waited else 0.0,
+            "max_queue_wait_ms": 1000.0 * self.queue_wait_max,
+        }
+
+
+def init_metrics(scheduler: ChatScheduler, llm_in_flight):
+    # llm_in_flight – функция: LLMSlots создаётся позже, при старте бота | llm_in_flight is a callable: LLMSlots is created later, at bot startup
+    if tracing.METRICS_ENABLED:
+        _init_metrics(scheduler, llm_in_flight)
@@ -0,0 +1,118 @@
+import re
+import zlib
+
+import snowballstemmer
+
+DENSE_VECTOR_NAME = "dense"  # Имя плотного вектора в гибридной коллекции | Dense vector name in a hybrid collection
+SPARSE_VECTOR_NAME = "sparse"  # Имя разреженного (BM25) вектора | Sparse (BM25) vector name
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # Константа reciprocal rank fusion | Reciprocal rank fusion constant
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_CYRILLIC_RE = re.compile(r"[а-я]")
+
+# Частые служебные слова, не несущие смысла для поиска | Frequent function words with no search value
+STOP_WORDS = frozenset("""
+и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне было вот от меня
+еще нет о из ему теперь когда даже ну вдруг ли если уже или ни быть был него до вас нибудь опять уж вам ведь там
+потом себя ничего ей может они тут где есть надо ней для мы тебя их чем была сам чтоб без будто чего раз тоже себе
+под будет ж тогда кто этот того потому этого какой совсем ним здесь этом один почти мой тем чтобы нее сейчас были куда
+зачем всех никогда можно при наконец два об другой хоть после над больше тот через эти нас про всего них какая много
+разве три эту моя впрочем хорошо свою этой перед иногда лучше чуть том нельзя такой им более всегда конечно всю между
+the a an of to in on for is are and or
+""".split())
+
+_russian = snowballstemmer.stemmer("russian")
+_english = snowballstemmer.stemmer("english")
+
+
+def tokenize(text: str):
+    """
+    Разбивает текст на слова, приводит к нижнему регистру, убирает стоп-слова и
+    стеммит (русский стеммер Snowball для кириллицы, английский – для латиницы).
+    Числа и коды ошибок сохраняются как есть.
+
+    |
+
+    Splits text into words, lowercases, drops stop words and stems them
+    (Snowball Russian stemmer for Cyrillic, English for Latin).
+    Numbers and error codes are kept as is.
+    """
+    tokens = []
+    for word in _TOKEN_RE.findall(text.lower().replace("ё", "е")):
+        if word in STOP_WORDS:
+            continue
+        if word.isdigit() or any(c.isdigit() for c in word):
+            tokens.append(word)
+        elif _CYRILLIC_RE.search(word):
+            tokens.append(_russian.stemWord(word))
+        else:
+            tokens.append(_english.stemWord(word))
+    return tokens
+
+
+def token_index(token: str) -> int:
+    # Стабильный индекс термина без словаря | Stable term index without a vocabulary
+    return zlib.crc32(token.encode("utf-8")) & 0x7FFFFFFF
+
+
+def _term_counts(tokens):
+    counts = {}
+    for token in tokens:
+        index = token_index(token)
+        counts[index] = counts.get(index, 0) + 1
+    return counts
+
+
+def average_length(texts) -> float:
+    # Один проход по итератору без списка длин | A single pass over the iterator without a list of lengths
+    total = count = 0
+    for text in texts:
+        total += len(tokenize(text))
+        count += 1
+    return total / count if count else 1.0
+
+
+def document_vector(text: str, avg_length: float):
+    """
+    Разреженный вектор документа: насыщенная BM25-частота термина. IDF применяет
+    сам Qdrant (modifier "idf" у разреженного вектора коллекции).
+
+    |
+
+    Sparse document vector: saturated BM25 term frequency. IDF is applied by Qdrant
+    itself (the "idf" modifier of the collection's sparse vector).
+    """
+    tokens = tokenize(text)
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) / (avg_length or 1.0))
+    counts = _term_counts(tokens)
+    indices = sorted(counts)
+    values = [counts[i] * (BM25_K1 + 1) / (counts[i] + norm) for i in indices]
+    return {"indices": indices, "values": values}
+
+
+def query_vector(text: str):
+    """
+    Разреженный вектор запроса: каждый уникальный термин с весом 1. |
+    Sparse query vector: each unique term with weight 1.
+    """
+    indices = sorted(_term_counts(tokenize(text)))
+    return {"indices": indices, "values": [1.0] * len(indices)}
+
+
+def reciprocal_rank_fusion(result_lists, limit: int, k: int = RRF_K):
+    """
+    Объединяет ранжированные списки точек Qdrant: score = sum(1 / (k + ранг)).
+    У возвращённых точек score заменён на слитый, иначе косинус и BM25 несравнимы. |
+    Fuses ranked lists of Qdrant points: score = sum(1 / (k + rank)).
+    Returned points carry the fused score, since cosine and BM25 scores are not comparable.
+    """
+    scores = {}
+    points = {}
+    for results in result_lists:
+        for rank, point in enumerate(results, start=1):
+            scores[point.id] = scores.get(point.id, 0.0) + 1.0 / (k + rank)
+            points.setdefault(point.id, point)
+    best = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [points[point_id].model_copy(update={"score": scores[point_id]}) for point_id in best]
@@ -1,115 +1,354 @@
 import httpx
 import asyncio
-import json
-from qdrant_client import QdrantClient
+import time
+from qdrant_client import AsyncQdrantClient, models
 from aiogram import Bot, Dispatcher, types, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 from aiogram.types.input_file import FSInputFile
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from dotenv import load_dotenv
 import os
 from openai import AsyncOpenAI
 
-# Импорт для конвертации страницы PDF в изображение | Import for converting PDF pages to images
-from pdf2image import convert_from_path
-import tempfile
+from embed_client import FASTAPI_EMBED_URL, ENCODE_HEADERS, encode_payload, decode_embeddings
+
+# Кэш скриншотов страниц PDF | PDF page screenshot cache
+from page_cache import PageImageCache
+# Семантический кэш готовых ответов | Semantic cache of final answers
+from answer_cache import SemanticAnswerCache, INGEST_STAMP_COLLECTION, STAMP_CHECK_INTERVAL, stamp_point_id
+# Разреженные BM25-векторы для гибридного поиска | Sparse BM25 vectors for hybrid search
+import sparse_encoder
+# Трассировка этапов запроса и метрики Prometheus | Query stage tracing and Prometheus metrics
+import tracing
+# Очередь сообщений по чатам и лимит запросов к LLM | Per-chat message queue and LLM request limit
+from scheduler import ChatScheduler, LLMSlots, init_metrics as init_scheduler_metrics
+# Локальный mmap-индекс вместо Qdrant для небольших корпусов | Local mmap index instead of Qdrant for small corpora
+from local_index import LocalIndex
+# Сборка промпта в пределах бюджета токенов | Prompt assembly within a token budget
+from prompt_builder import pack_prompt, compress_turn
+# Общее хранилище состояния чатов (memory | sqlite | redis) | Shared chat state storage (memory | sqlite | redis)
+from fsm_storage import make_storage
 
 load_dotenv()
 BOT_TOKEN = os.getenv("CLS_BOT_TOKEN")  # Токен Telegram-бота | Telegram bot token
 HYP_HB_API = os.getenv("HYP_HB_API")  # API-ключ Hyperbolic | Hyperbolic API key
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.hyperbolic.xyz/v1/")  # OpenAI-совместимый API | OpenAI-compatible API
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # Свой Bot API сервер (по умолчанию api.telegram.org) | Custom Bot API server (api.telegram.org by default)
 
 client = AsyncOpenAI(
-    base_url="https://api.hyperbolic.xyz/v1/",
+    base_url=LLM_BASE_URL,
     api_key=HYP_HB_API
 )
 # MODEL = 'Qwen/Qwen2.5-72B-Instruct'  # Альтернативная модель | Alternative model
 MODEL = 'deepseek-ai/DeepSeek-V3'  # Используемая модель | Selected model
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "0") == "1"  # Показывать ответ по мере генерации | Show the answer while it is generated
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))  # Минимальный интервал между правками сообщения, с | Min interval between message edits, s
+TELEGRAM_MESSAGE_LIMIT = 4096  # Максимальная длина сообщения Telegram | Telegram message length limit
+FINAL_EDIT_ATTEMPTS = 5  # Попыток показать итоговый ответ при flood wait | Attempts to show the final answer on flood wait
 
 # Путь к PDF файлу  # Path to PDF file
 PDF_FILE_PATH = os.path.abspath("./file.pdf")
+page_cache = PageImageCache(PDF_FILE_PATH)
 
 # Создаем экземпляр бота и диспетчера | Create bot and dispatcher instances
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+bot_session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=BOT_TOKEN, session=bot_session)
+# История диалога хранится в FSM_STORAGE, чтобы её видели все воркеры webhook.py
+# (хранилище закрывает сам Dispatcher при остановке) |
+# Conversation history lives in FSM_STORAGE so every webhook.py worker sees it
+# (the Dispatcher itself closes the storage on shutdown)
+dp = Dispatcher(storage=make_storage())
 
-FASTAPI_EMBED_URL = "http://127.0.0.1:8080/encode"  # URL для генерации эмбеддингов | Embedding generation endpoint
 COLLECTION_NAME = "Client_bd"  # Название коллекции в Qdrant | Qdrant collection name
-QDRANT_URL = "http://localhost:6333"  # URL Qdrant сервера | Qdrant server URL
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")  # URL Qdrant сервера | Qdrant server URL
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "0") == "1"  # Использовать gRPC (порт 6334) | Use gRPC (port 6334)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "0") == "1"  # Плотный + BM25 поиск (коллекция загружена с --hybrid) | Dense + BM25 search (collection loaded with --hybrid)
+HYBRID_PREFETCH_LIMIT = 20  # Кандидатов из каждого поиска для слияния | Candidates per search for fusion
+SEARCH_LIMIT = 3  # Сколько ответов передаём в контекст LLM | How many answers go into the LLM context
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "qdrant")  # qdrant | local (снимок local_index.py) | local (local_index.py snapshot)
+SEARCH_HNSW_EF = int(os.getenv("SEARCH_HNSW_EF", "0"))  # ef при поиске по HNSW (0 – по умолчанию сервера) | HNSW search ef (0 – server default)
+SEARCH_EXACT = os.getenv("SEARCH_EXACT", "0") == "1"  # Точный перебор без индекса | Exact brute-force search without the index
+SEARCH_RESCORE = os.getenv("SEARCH_RESCORE", "1") == "1"  # Пересчёт кандидатов по исходным векторам при квантовании | Rescore candidates with original vectors under quantization
+SEARCH_OVERSAMPLING = float(os.getenv("SEARCH_OVERSAMPLING", "2.0"))  # Запас кандидатов для пересчёта | Candidate oversampling for rescoring
+
+def make_search_params(hnsw_ef: int = SEARCH_HNSW_EF, exact: bool = SEARCH_EXACT,
+                       rescore: bool = SEARCH_RESCORE, oversampling: float = SEARCH_OVERSAMPLING):
+    """
+    Параметры поиска Qdrant: ef для HNSW, точный перебор и пересчёт по исходным
+    векторам для квантованной коллекции (без квантования Qdrant их игнорирует). |
+    Qdrant search params: HNSW ef, exact search and rescoring with original vectors
+    for a quantized collection (Qdrant ignores them without quantization).
+    """
+    return models.SearchParams(
+        hnsw_ef=hnsw_ef or None,
+        exact=exact,
+        quantization=models.QuantizationSearchParams(rescore=rescore, oversampling=oversampling),
+    )
+
+SEARCH_PARAMS = make_search_params()
 
-qdrant_client = QdrantClient(url=QDRANT_URL)
+# Таймауты и лимиты пула HTTP-соединений к сервису эмбеддингов | Timeouts and pool limits for the embedding service
+HTTP_TIMEOUT = httpx.Timeout(10.0, connect=2.0)
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
 
-async def rag(question: str):
+# Долгоживущие клиенты создаются при старте и закрываются при остановке бота |
+# Long-lived clients are created at startup and closed at shutdown
+http_client: httpx.AsyncClient = None
+qdrant_client: AsyncQdrantClient = None
+dense_vector_name: str = None  # "dense" у гибридной коллекции, определяется при старте | "dense" for a hybrid collection, detected at startup
+
+answer_cache = SemanticAnswerCache()
+local_index = LocalIndex() if RETRIEVAL_BACKEND == "local" else None
+stamp_task: asyncio.Task = None  # Слежение за отметкой загрузки для кэша ответов | Ingestion stamp watcher for the answer cache
+llm_slots: LLMSlots = None  # Общий лимит одновременных запросов к LLM, создаётся в event loop бота | Shared limit of concurrent LLM requests, created in the bot's event loop
+ANSWER_CACHE_REPORT_EVERY = 100  # Как часто печатать статистику кэша ответов (в запросах) | How often to print answer cache stats (in lookups)
+
+async def init_clients():
     """
-    Функция отправляет запрос на сервер для получения эмбеддингов,
-    выполняет поиск в Qdrant и возвращает объединённый результат из 3 наиболее релевантных ответов.
-    Также собирает номера страниц для возможных скриншотов.
-    
-    The function sends a request to the server to get embeddings,
-    performs a Qdrant search, and returns a combined result from 3 most relevant answers.
-    Also collects page numbers for potential screenshots.
+    Создаёт общий пул HTTP-соединений, асинхронный клиент Qdrant и лимит запросов к LLM. |
+    Creates the shared HTTP connection pool, the async Qdrant client and the LLM request limit.
+    """
+    global http_client, qdrant_client, llm_slots, stamp_task
+    llm_slots = LLMSlots()
+    http_client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+    qdrant_client = AsyncQdrantClient(url=QDRANT_URL, prefer_grpc=QDRANT_PREFER_GRPC, timeout=10)
+    if local_index is None:
+        await check_collection()
+    elif local_index.manifest is None:
+        # Без снимка бот отвечал бы «не найдено» на любой вопрос | Without a snapshot the bot would answer "not found" to every question
+        raise RuntimeError(f"RETRIEVAL_BACKEND=local, но снимка нет в {local_index.index_dir}: соберите его local_index.py | "
+                           f"RETRIEVAL_BACKEND=local, but there is no snapshot in {local_index.index_dir}: build one with local_index.py")
+    if answer_cache.max_items > 0:
+        stamp_task = asyncio.create_task(watch_ingest_stamp())
+
+async def read_ingest_stamp():
+    """
+    Текущая отметка загрузки: имя снимка локального индекса или точка, которую
+    load_to_qdrant.py пишет в INGEST_STAMP_COLLECTION. |
+    The current ingestion stamp: the local index snapshot name or the point that
+    load_to_qdrant.py writes into INGEST_STAMP_COLLECTION.
+    """
+    if local_index is not None:
+        local_index.maybe_reload()
+        return local_index.manifest["snapshot"] if local_index.manifest else None
+    if not await qdrant_client.collection_exists(INGEST_STAMP_COLLECTION):
+        return None
+    points = await qdrant_client.retrieve(INGEST_STAMP_COLLECTION, ids=[stamp_point_id(COLLECTION_NAME)], with_payload=True)
+    return points[0].payload.get("updated_at") if points else None
+
+async def watch_ingest_stamp():
+    # Кэш ответов очищается после новой загрузки данных | The answer cache is cleared after a new data ingestion
+    while True:
+        try:
+            answer_cache.set_stamp(await read_ingest_stamp())
+        except Exception as e:
+            print(f"Не удалось прочитать отметку загрузки | Failed to read the ingestion stamp: {e}")
+        await asyncio.sleep(STAMP_CHECK_INTERVAL)
+
+async def check_collection():
+    """
+    Читает конфигурацию векторов коллекции: у гибридной (load_to_qdrant.py --hybrid)
+    векторы именованные, и плотный поиск идёт по "dense". HYBRID_SEARCH=1 без
+    разреженного вектора в коллекции – ошибка запуска. |
+    Reads the collection's vector config: a hybrid one (load_to_qdrant.py --hybrid)
+    has named vectors, and the dense search uses "dense". HYBRID_SEARCH=1 without a
+    sparse vector in the collection is a startup error.
+    """
+    global dense_vector_name
+    try:
+        info = await qdrant_client.get_collection(COLLECTION_NAME)
+    except Exception as e:
+        raise RuntimeError(f"Коллекция {COLLECTION_NAME} недоступна | Collection {COLLECTION_NAME} is unavailable: {e}") from e
+    vectors = info.config.params.vectors
+    sparse_vectors = info.config.params.sparse_vectors or {}
+    named = isinstance(vectors, dict)
+    if named and sparse_encoder.DENSE_VECTOR_NAME not in vectors:
+        raise RuntimeError(f"В коллекции {COLLECTION_NAME} нет вектора {sparse_encoder.DENSE_VECTOR_NAME!r} | "
+                           f"Collection {COLLECTION_NAME} has no {sparse_encoder.DENSE_VECTOR_NAME!r} vector")
+    if HYBRID_SEARCH and sparse_encoder.SPARSE_VECTOR_NAME not in sparse_vectors:
+        raise RuntimeError(f"HYBRID_SEARCH=1, но коллекция {COLLECTION_NAME} загружена без --hybrid | "
+                           f"HYBRID_SEARCH=1, but collection {COLLECTION_NAME} was loaded without --hybrid")
+    dense_vector_name = sparse_encoder.DENSE_VECTOR_NAME if named else None
+
+async def close_clients():
+    global http_client, qdrant_client, stamp_task
+    if stamp_task is not None:
+        stamp_task.cancel()
+        stamp_task = None
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+    if qdrant_client is not None:
+        await qdrant_client.close()
+        qdrant_client = None
+
+async def embed_query(question: str):
     """
-    payload = {"sentences": [question]}
-    async with httpx.AsyncClient() as client_http:
-        response = await client_http.post(
+    Получает эмбеддинг вопроса от сервиса эмбеддингов. |
+    Gets the question embedding from the embedding service.
+    """
+    with tracing.span("embed"):
+        response = await http_client.post(
             FASTAPI_EMBED_URL,
-            headers={"Content-Type": "application/json"},
-            data=json.dumps(payload)
+            headers=ENCODE_HEADERS,
+            content=encode_payload([question])
         )
 
-    if response.status_code != 200:
-        raise Exception(f"Failed to get prediction: {response.status_code} {response.text}")
+        if response.status_code != 200:
+            raise Exception(f"Failed to get prediction: {response.status_code} {response.text}")
 
-    embedding = json.loads(response.text)
+        return decode_embeddings(response.content, response.headers)[0]
 
-    # Поиск по вектору: возвращаем 3 наиболее релевантных результата | Vector search: return 3 most relevant results
-    search_result = qdrant_client.search(
-        collection_name=COLLECTION_NAME,
-        query_vector=embedding['embeddings'][0],
-        limit=3,
-        with_payload=True,
-    )
+async def hybrid_search(question: str, query_vector, limit: int):
+    """
+    Плотный и разреженный (BM25) поиск одним батч-запросом к Qdrant, результаты
+    объединяются reciprocal rank fusion. Разреженный поиск находит точные термины
+    (названия, коды ошибок, пункты меню), которые плохо ловит плотная модель.
+
+    Dense and sparse (BM25) searches in one batched Qdrant request, fused with
+    reciprocal rank fusion. The sparse search catches exact terms (names, error
+    codes, menu labels) that the dense model misses.
+    """
+    requests = [
+        models.QueryRequest(
+            query=query_vector.tolist(),
+            using=sparse_encoder.DENSE_VECTOR_NAME,
+            limit=HYBRID_PREFETCH_LIMIT,
+            params=SEARCH_PARAMS,
+            with_payload=True,
+        )
+    ]
+    sparse = sparse_encoder.query_vector(question)
+    if sparse["indices"]:
+        requests.append(
+            models.QueryRequest(
+                query=models.SparseVector(**sparse),
+                using=sparse_encoder.SPARSE_VECTOR_NAME,
+                limit=HYBRID_PREFETCH_LIMIT,
+                with_payload=True,
+            )
+        )
+    responses = await qdrant_client.query_batch_points(collection_name=COLLECTION_NAME, requests=requests)
+    return sparse_encoder.reciprocal_rank_fusion([response.points for response in responses], limit)
+
+def hit_pages(payload: dict):
+    # Поле pages – все страницы записи; у точек, загруженных раньше, только skr и skr_2 |
+    # The pages field holds all of the record's pages; points loaded earlier have only skr and skr_2
+    pages = payload.get("pages") or [payload.get(key) for key in ("skr", "skr_2")]
+    return [int(page) for page in pages if page]
+
+async def rag(question: str, query_vector=None):
+    """
+    Функция отправляет запрос на сервер для получения эмбеддингов (если вектор не передан),
+    выполняет поиск в Qdrant (или в локальном индексе) и возвращает 3 наиболее релевантных ответа
+    {"contexts": [(оценка, ответ, страницы для скриншотов)]} по убыванию релевантности.
+    
+    The function sends a request to the server to get embeddings (unless a vector is given),
+    performs a Qdrant (or local index) search, and returns the 3 most relevant answers
+    {"contexts": [(score, answer, pages for screenshots)]} in decreasing relevance.
+    """
+    if query_vector is None:
+        query_vector = await embed_query(question)
+
+    if local_index is not None:
+        # Поиск в памяти процесса занимает доли миллисекунды | An in-process search takes a fraction of a millisecond
+        with tracing.span("local_index"):
+            search_result = local_index.search(query_vector, SEARCH_LIMIT)
+    elif HYBRID_SEARCH:
+        with tracing.span("qdrant"):
+            search_result = await hybrid_search(question, query_vector, SEARCH_LIMIT)
+    else:
+        # Поиск по вектору: возвращаем 3 наиболее релевантных результата | Vector search: return 3 most relevant results
+        with tracing.span("qdrant"):
+            response = await qdrant_client.query_points(
+                collection_name=COLLECTION_NAME,
+                query=query_vector.tolist(),
+                using=dense_vector_name,
+                limit=SEARCH_LIMIT,
+                search_params=SEARCH_PARAMS,
+                with_payload=True,
+            )
+            search_result = response.points
 
     if not search_result:
         return None
 
-    # Объединяем ответы в один текст | Combine answers into single text
-    combined_answer = "\n".join([res.payload.get("answer", "") for res in search_result])
-    # Собираем номера страниц из полей 'str' и 'str_2' | Collect page numbers from 'str' and 'str_2' fields
-    pages_list = []
-    for res in search_result:
-        if res.payload.get("skr"):
-            pages_list.append(int(res.payload.get("skr")))
-        if res.payload.get("skr_2"):
-            pages_list.append(int(res.payload.get("skr_2")))
-    return {"answer": combined_answer, "pages": pages_list}
+    # Ответы с оценками релевантности и страницами для сборки промпта | Answers with relevance scores and pages for prompt packing
+    contexts = [(res.score, res.payload.get("answer", ""), hit_pages(res.payload)) for res in search_result]
+    return {"contexts": contexts}
+
+def build_prompt(question: str, answer_context: str, conversation_history: str):
+    """
+    Промпт для модели: вопрос, контекст из Qdrant и история переписки.
+    Prompt for the model: question, Qdrant context and conversation history.
+    """
+    return (f"Вопрос: {question}\n"
+            f"Контекст: {answer_context}\n"
+            f"История предыдущих вопросов и ответов:\n{conversation_history}\n"
+            f"Пожалуйста, дай детальный ответ на вопрос, опираясь на контекст. "
+            f"Возвращай только красиво оформленный ответ, используя пункты (1, 2, ...). "
+            f"Ответ должен иметь вид 'Ответ:\nответ' без лишних заключительных фраз.")
 
-async def get_model_answer(question: str, answer_context: str, conversation_history: str):
+async def get_model_answer(prompt: str):
     """
     Функция отправляет запрос к нейросетевой модели для получения полного ответа
-    на основе вопроса, объединённого контекста из Qdrant и истории предыдущей переписки.
+    на промпт из вопроса, контекста из Qdrant и истории переписки (см. pack_prompt).
     
     The function sends a request to the neural network model to get a complete answer
-    based on the question, combined context from Qdrant, and conversation history.
-    """
-    prompt = (f"Вопрос: {question}\n"
-              f"Контекст: {answer_context}\n"
-              f"История предыдущих вопросов и ответов:\n{conversation_history}\n"
-              f"Пожалуйста, дай детальный ответ на вопрос, опираясь на контекст. "
-              f"Возвращай только красиво оформленный ответ, используя пункты (1, 2, ...). "
-              f"Ответ должен иметь вид 'Ответ:\nответ' без лишних заключительных фраз.")
+    to the prompt built from the question, Qdrant context and conversation history (see pack_prompt).
+    """
     try:
-        response = await client.completions.create(
-            model=MODEL,
-            prompt=prompt,
-            temperature=0.0,
-            stream=False  # Отключаем стриминг – получаем ответ целиком | Disable streaming - get full response
-        )
+        async with llm_slots:
+            with tracing.span("llm"):
+                response = await client.completions.create(
+                    model=MODEL,
+                    prompt=prompt,
+                    temperature=0.0,
+                    stream=False  # Отключаем стриминг – получаем ответ целиком | Disable streaming - get full response
+                )
         result_text = response.choices[0].text.strip()
         return result_text
     except Exception as e:
         raise Exception(f"Ошибка при получении ответа от нейросети: {e}")  # Error getting neural network response
 
+async def stream_model_answer(prompt: str, on_text):
+    """
+    Потоковый вариант get_model_answer: токены читаются по мере генерации,
+    после каждого фрагмента вызывается on_text(накопленный текст).
+    Возвращает полный ответ.
+
+    Streaming variant of get_model_answer: tokens are consumed as they arrive
+    and on_text(accumulated text) is called after each fragment.
+    Returns the full answer.
+    """
+    try:
+        # Слот занят, пока читается поток | The slot is held while the stream is read
+        async with llm_slots, tracing.span("llm"):
+            started = time.perf_counter()
+            stream = await client.completions.create(
+                model=MODEL,
+                prompt=prompt,
+                temperature=0.0,
+                stream=True
+            )
+            parts = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].text
+                if text:
+                    if not parts:
+                        tracing.observe("llm_first_token", time.perf_counter() - started)
+                    parts.append(text)
+                    await on_text("".join(parts))
+        return "".join(parts).strip()
+    except Exception as e:
+        raise Exception(f"Ошибка при получении ответа от нейросети: {e}")  # Error getting neural network response
+
 def split_message(text: str, max_length: int = 4096):
     """
     Разбивает длинный текст на части не длиннее max_length символов.
@@ -117,6 +356,82 @@ def split_message(text: str, max_length: int = 4096):
     """
     return [text[i:i+max_length] for i in range(0, len(text), max_length)]
 
+class ProgressiveMessage:
+    """
+    Показывает растущий текст ответа, редактируя сообщения Telegram не чаще
+    одного раза в min_interval секунд (ограничения Telegram на правки).
+    Текст длиннее 4096 символов переносится в новое сообщение по тем же
+    границам, что и split_message.
+
+    Shows a growing answer by editing Telegram messages at most once every
+    min_interval seconds (Telegram edit rate limits). Text longer than 4096
+    characters rolls over into a new message at the same boundaries as split_message.
+
+    Промежуточные правки идут в фоне: чтение потока LLM (и занятый слот LLM) не
+    ждёт Telegram. finish() дожидается их и показывает итоговый текст, повторяя
+    при flood wait. |
+    Intermediate edits run in the background: reading the LLM stream (and the held
+    LLM slot) does not wait for Telegram. finish() waits for them and shows the final
+    text, retrying on flood wait.
+    """
+
+    def __init__(self, message: types.Message, min_interval: float = STREAM_EDIT_INTERVAL,
+                 max_length: int = TELEGRAM_MESSAGE_LIMIT):
+        self.message = message
+        self.min_interval = min_interval
+        self.max_length = max_length
+        self.sent = []  # (сообщение, показанный текст) | (message, displayed text)
+        self.first_visible_at = None
+        self._next_edit = 0.0
+        self._edit_task = None
+
+    async def update(self, text: str):
+        # Пропускаем, пока идёт прошлая правка или не вышел интервал | Skip while the previous edit runs or the interval has not passed
+        if self._edit_task is not None and not self._edit_task.done():
+            return
+        if time.monotonic() < self._next_edit:
+            return
+        self._next_edit = time.monotonic() + self.min_interval
+        self._edit_task = asyncio.create_task(self._edit(text.strip()))
+
+    async def _edit(self, text: str):
+        try:
+            await self._render(text)
+        except TelegramRetryAfter as e:
+            # Telegram просит подождать – откладываем следующую правку | Telegram asks to wait – postpone the next edit
+            self._next_edit = time.monotonic() + e.retry_after
+        except Exception as e:
+            # Итоговый текст всё равно покажет finish() | finish() shows the final text anyway
+            print(f"Не удалось обновить сообщение | Failed to update the message: {e}")
+
+    async def _render(self, text: str):
+        for i, chunk in enumerate(split_message(text, self.max_length)):
+            if i < len(self.sent):
+                sent, shown = self.sent[i]
+                if shown != chunk:
+                    try:
+                        await sent.edit_text(chunk)
+                    except TelegramBadRequest as e:
+                        if "message is not modified" not in str(e):
+                            raise
+                    self.sent[i] = (sent, chunk)
+            else:
+                self.sent.append((await self.message.answer(chunk), chunk))
+                if self.first_visible_at is None:
+                    self.first_visible_at = time.perf_counter()
+
+    async def finish(self, text: str):
+        if self._edit_task is not None:
+            await self._edit_task
+        for attempt in range(FINAL_EDIT_ATTEMPTS):
+            try:
+                await self._render(text.strip())
+                return
+            except TelegramRetryAfter as e:
+                if attempt == FINAL_EDIT_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(e.retry_after)
+
 async def send_typing_action(chat_id: int, interval: int = 7):
     """
     Фоновая функция, которая периодически отправляет состояние "печатает" пользователю.
@@ -151,61 +466,147 @@ async def cmd_start(message: types.Message):
 async def cmd_menu(message: types.Message):
     await message.answer("Меню:", reply_markup=menu_keyboard)
 
-# Обработчик текстовых сообщений, отличных от кнопки "Получить pdf инструкцию" | Text message handler excluding PDF button
-@dp.message(lambda message: message.text != "Получить pdf инструкцию")
-async def handle_query(message: types.Message, state: FSMContext):
-    user_query = message.text
-    try:
-        rag_result = await rag(user_query)
-        if rag_result is None:
-            await message.answer("Не найден релевантный ответ.")  # No relevant answer found
-            return
+async def send_page_screenshots(message: types.Message, pages_list):
+    """
+    Отправляет скриншоты страниц PDF (повторяющиеся страницы – один раз). |
+    Sends PDF page screenshots (repeated pages once).
+    """
+    for page in dict.fromkeys(pages_list):
+        try:
+            with tracing.span("page_render"):
+                photo = await page_cache.get_photo(page)
+            if photo is not None:
+                with tracing.span("telegram_upload"):
+                    sent = await message.answer_photo(photo=photo, caption=f"Страница {page}")
+                page_cache.remember(page, sent)
+            else:
+                await message.answer(f"Не удалось извлечь страницу {page} из PDF файла.")  # Failed to extract page
+        except Exception as e:
+            await message.answer(f"Ошибка при извлечении страницы {page}: {e}")  # Page extraction error
+
+def report_answer_cache():
+    stats = answer_cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    if lookups and lookups % ANSWER_CACHE_REPORT_EVERY == 0:
+        print(f"Кэш ответов | Answer cache: {stats}")
 
-        # Извлекаем объединённый контекст из Qdrant | Extract combined context from Qdrant
-        qdrant_answer = rag_result.get("answer", "")
-        pages_list = rag_result.get("pages", [])
+async def handle_query(message: types.Message, state: FSMContext, user_query: str = None):
+    """
+    Обработка вопроса: кэш ответов, поиск в Qdrant, LLM, отправка ответа и скриншотов.
+    user_query – текст запроса (несколько склеенных сообщений), по умолчанию message.text.
 
+    Handles a question: answer cache, Qdrant search, LLM, sending the answer and screenshots.
+    user_query is the request text (several merged messages), message.text by default.
+    """
+    user_query = user_query or message.text
+    trace = tracing.start_trace("query", chat_id=message.chat.id, question_chars=len(user_query))
+    outcome = "ok"
+    try:
         # Получаем историю переписки из состояния (если есть) | Get conversation history from state
         data = await state.get_data()
         history = data.get("history", [])
-        history_text = ""
-        for pair in history:
-            history_text += f"Вопрос: {pair['user']}\nОтвет: {pair['bot']}\n"
+
+        # Без истории ответ зависит только от вопроса – проверяем семантический кэш |
+        # Without history the answer depends only on the question – check the semantic cache
+        query_vector = None
+        if not history:
+            query_vector = await embed_query(user_query)
+            cached = answer_cache.lookup(query_vector)
+            report_answer_cache()
+            if cached is not None:
+                outcome = "cache_hit"
+                nn_response, pages_list = cached
+                with tracing.span("telegram_send"):
+                    for chunk in split_message(nn_response):
+                        await message.answer(chunk)
+                with tracing.span("screenshots"):
+                    await send_page_screenshots(message, pages_list)
+                await state.update_data(history=[compress_turn(user_query, nn_response)])
+                return
+
+        rag_result = await rag(user_query, query_vector)
+        if rag_result is None:
+            outcome = "not_found"
+            await message.answer("Не найден релевантный ответ.")  # No relevant answer found
+            return
+
+        # Контекст из Qdrant и история в пределах бюджета токенов | Qdrant context and history within the token budget
+        prompt, prompt_stats, used_contexts = pack_prompt(user_query, rag_result.get("contexts", []), history, build_prompt)
+        # Скриншоты только страниц ответов, попавших в промпт | Screenshots only of pages of answers that made it into the prompt
+        pages_list = [page for _, _, pages in used_contexts for page in pages]
 
         # Запускаем фоновую задачу для отправки состояния "печатает" | Start background typing indicator task
         typing_task = asyncio.create_task(send_typing_action(message.chat.id))
-        # Получаем полный ответ от нейросети с учетом контекста и истории | Get full neural network response
-        nn_response = await get_model_answer(user_query, qdrant_answer, history_text)
-        # Останавливаем отправку состояния "печатает" | Stop typing indicator
-        typing_task.cancel()
+        llm_started = time.perf_counter()
+        if STREAM_RESPONSES:
+            # Показываем ответ по мере генерации | Show the answer while it is generated
+            progressive = ProgressiveMessage(message)
 
-        # Если ответ длиннее лимита, разбиваем его на части | Split long responses into chunks
-        for chunk in split_message(nn_response):
-            await message.answer(chunk)
+            async def on_text(text):
+                if not typing_task.done() and text.strip():
+                    typing_task.cancel()
+                await progressive.update(text)
 
-        # Выводим скриншоты страниц из PDF | Send PDF page screenshots
-        for page in pages_list:
             try:
-                images = convert_from_path(PDF_FILE_PATH, first_page=page, last_page=page)
-                if images:
-                    with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
-                        images[0].save(tmp, format='JPEG')
-                        tmp_path = tmp.name
-                    await message.answer_photo(photo=FSInputFile(tmp_path), caption=f"Страница {page}")
-                    os.remove(tmp_path)
-                else:
-                    await message.answer(f"Не удалось извлечь страницу {page} из PDF файла.")  # Failed to extract page
-            except Exception as e:
-                await message.answer(f"Ошибка при извлечении страницы {page}: {e}")  # Page extraction error
-
-        # Обновляем историю переписки | Update conversation history
-        history.append({"user": user_query, "bot": nn_response})
+                nn_response = await stream_model_answer(prompt, on_text)
+            finally:
+                typing_task.cancel()
+            await progressive.finish(nn_response)
+            first_visible_at = progressive.first_visible_at
+        else:
+            try:
+                # Получаем полный ответ от нейросети с учетом контекста и истории | Get full neural network response
+                nn_response = await get_model_answer(prompt)
+            finally:
+                # Останавливаем отправку состояния "печатает" | Stop typing indicator
+                typing_task.cancel()
+            # Если ответ длиннее лимита, разбиваем его на части | Split long responses into chunks
+            first_visible_at = None
+            with tracing.span("telegram_send"):
+                for chunk in split_message(nn_response):
+                    await message.answer(chunk)
+                    if first_visible_at is None:
+                        first_visible_at = time.perf_counter()
+
+        # Размер промпта и время ответа LLM | Prompt size and LLM answer time
+        print(f"Промпт | Prompt: {prompt_stats['prompt_tokens']} ток. | tokens "
+              f"(контекст | context {prompt_stats['contexts_used']}/{prompt_stats['contexts']}, "
+              f"повторы | duplicates {prompt_stats['duplicates']}, история | history {prompt_stats['history_tokens']}), "
+              f"LLM: {time.perf_counter() - llm_started:.2f} s")
+        # Время до первого видимого текста: сравнение потокового и блокирующего режимов |
+        # Time to first visible text: compares streaming and blocking modes
+        if first_visible_at is not None:
+            mode = "stream" if STREAM_RESPONSES else "blocking"
+            tracing.observe("ttft", first_visible_at - llm_started)
+            print(f"TTFT ({mode}): {first_visible_at - llm_started:.2f} s, всего | total: {time.perf_counter() - llm_started:.2f} s")
+
+        if query_vector is not None and nn_response:
+            answer_cache.put(query_vector, nn_response, pages_list)
+
+        with tracing.span("screenshots"):
+            await send_page_screenshots(message, pages_list)
+
+        # Обновляем историю переписки; ответ хранится сжатым | Update conversation history; the answer is stored compressed
+        history.append(compress_turn(user_query, nn_response))
         if len(history) > 3:
             history = history[-3:]
         await state.update_data(history=history)
 
     except Exception as e:
+        outcome = "error"
         await message.answer(f"Произошла ошибка при выполнении запроса: {e}")  # Request execution error
+    finally:
+        tracing.finish_trace(trace, outcome)
+
+query_scheduler = ChatScheduler(handle_query)
+init_scheduler_metrics(query_scheduler, lambda: llm_slots.in_flight if llm_slots is not None else 0)
+
+# Обработчик текстовых сообщений, отличных от кнопки "Получить pdf инструкцию"; стикеры и фото без текста не обрабатываются |
+# Text message handler excluding PDF button; stickers and photos without text are not handled
+@dp.message(F.text, F.text != "Получить pdf инструкцию")
+async def enqueue_query(message: types.Message, state: FSMContext):
+    # Сообщение ставится в очередь чата, обработчик сразу освобождается | The message is queued per chat, the handler returns at once
+    await query_scheduler.submit(message, state)
 
 # Обработчик кнопки "Получить pdf инструкцию" | PDF button handler
 @dp.message(F.text == "Получить pdf инструкцию")
@@ -216,8 +617,19 @@ async def send_pdf(message: types.Message):
     except Exception as e:
         await message.answer(f"Не удалось отправить PDF файл: {e}")  # Failed to send PDF
 
+# Клиенты живут столько же, сколько поллинг | Clients live as long as polling
+dp.startup.register(init_clients)
+dp.shutdown.register(query_scheduler.close)
+dp.shutdown.register(close_clients)
+# Сервер /metrics поднимается только при METRICS_ENABLED=1 | The /metrics server starts only with METRICS_ENABLED=1
+dp.startup.register(tracing.start_metrics_server)
+dp.shutdown.register(tracing.stop_metrics_server)
+
 async def main():
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        page_cache.close()
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"  # Трассировка этапов и /metrics | Stage tracing and /metrics
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9101"))  # Порт HTTP-сервера /metrics | /metrics HTTP server port
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "10000"))  # Порог записи в журнал медленных запросов, мс | Slow query log threshold, ms
+
+# Границы гистограмм, с: от быстрых вызовов Qdrant до долгих ответов LLM |
+# Histogram buckets, s: from fast Qdrant calls to long LLM answers
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+
+slow_query_log = logging.getLogger("slow_query")
+
+_current_trace = ContextVar("current_trace", default=None)
+_NO_SPAN = nullcontext()
+
+# Метрики создаются только при включённой трассировке | Metrics are created only when tracing is enabled
+_stage_seconds = None
+_request_seconds = None
+_requests_total = None
+_metrics_runner = None
+
+
+def _init_metrics():
+    global _stage_seconds, _request_seconds, _requests_total
+    from prometheus_client import Counter, Histogram
+
+    _stage_seconds = Histogram("bot_stage_seconds", "Duration of a query stage", ["stage"], buckets=LATENCY_BUCKETS)
+    _request_seconds = Histogram("bot_request_seconds", "End-to-end request duration", ["kind"], buckets=LATENCY_BUCKETS)
+    _requests_total = Counter("bot_requests_total", "Handled requests by outcome", ["kind", "outcome"])
+
+
+if METRICS_ENABLED:
+    _init_metrics()
+
+
+class _Span:
+    __slots__ = ("trace", "stage", "started")
+
+    def __init__(self, trace, stage):
+        self.trace = trace
+        self.stage = stage
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.trace.record(self.stage, self.started, time.perf_counter() - self.started, error=exc_type is not None)
+        return False
+
+
+class Trace:
+    """
+    Трассировка одного запроса: список этапов (начало относительно запроса,
+    длительность). Каждый этап сразу попадает в гистограмму bot_stage_seconds. |
+    Trace of one request: a list of stages (start relative to the request,
+    duration). Every stage is also observed in the bot_stage_seconds histogram.
+    """
+
+    __slots__ = ("kind", "attrs", "started", "spans")
+
+    def __init__(self, kind: str, attrs: dict):
+        self.kind = kind
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def span(self, stage: str):
+        return _Span(self, stage)
+
+    def record(self, stage: str, started: float, seconds: float, error: bool = False):
+        self.spans.append((stage, started - self.started, seconds, error))
+        _stage_seconds.labels(stage).observe(seconds)
+
+
+def start_trace(kind: str, **attrs):
+    """
+    Начинает трассировку запроса в текущей задаче asyncio; без METRICS_ENABLED возвращает None. |
+    Starts a request trace in the current asyncio task; returns None without METRICS_ENABLED.
+    """
+    if not METRICS_ENABLED:
+        return None
+    trace = Trace(kind, attrs)
+    _current_trace.set(trace)
+    return trace
+
+
+def span(stage: str):
+    """
+    Контекстный менеджер этапа текущего запроса; вне трассировки ничего не делает. |
+    Stage context manager for the current request; does nothing outside a trace.
+
+        with tracing.span("qdrant"):
+            ...
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NO_SPAN
+    return trace.span(stage)
+
+
+def observe(stage: str, seconds: float):
+    """
+    Записывает уже измеренную длительность (например, до первого токена). |
+    Records an already measured duration (e.g. time to first token).
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(stage, time.perf_counter() - seconds, seconds)
+
+
+def finish_trace(trace, outcome: str = "ok"):
+    """
+    Завершает трассировку: итоговая гистограмма, счётчик исходов и запись в журнал
+    медленных запросов (JSON), если запрос дольше SLOW_QUERY_MS. |
+    Finishes a trace: the total histogram, the outcome counter and a slow query
+    log record (JSON) if the request took longer than SLOW_QUERY_MS.
+    """
+    if trace is None:
+        return
+    total = time.perf_counter() - trace.started
+    _request_seconds.labels(trace.kind).observe(total)
+    _requests_total.labels(trace.kind, outcome).inc()
+    _current_trace.set(None)
+    if total * 1000.0 >= SLOW_QUERY_MS:
+        slow_query_log.warning(json.dumps({
+            "kind": trace.kind,
+            "outcome": outcome,
+            "total_ms": round(total * 1000.0, 1),
+            "spans": [
+                {"stage": stage, "start_ms": round(start * 1000.0, 1), "ms": round(seconds * 1000.0, 1), "error": error}
+                for stage, start, seconds, error in trace.spans
+            ],
+            **trace.attrs,
+        }, ensure_ascii=False))
+
+
+async def metrics_handler(request):
+    from aiohttp import web
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+
+    return web.Response(body=generate_latest(REGISTRY), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """
+    Поднимает HTTP-сервер с /metrics в event loop бота (только при METRICS_ENABLED). |
+    Starts an HTTP server with /metrics in the bot's event loop (only with METRICS_ENABLED).
+    """
+    global _metrics_runner
+    if not METRICS_ENABLED or _metrics_runner is not None:
+        return
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    _metrics_runner = web.AppRunner(app, access_log=None)
+    await _metrics_runner.setup()
+    await web.TCPSite(_metrics_runner, host, port).start()
+
+
+async def stop_metrics_server():
+    global _metrics_runner
+    if _metrics_runner is not None:
+        await _metrics_runner.cleanup()
+        _metrics_runner = None
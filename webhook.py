@@ -0,0 +1,294 @@
+"""
+Режим webhook: несколько процессов-воркеров бота за маршрутизатором обновлений.
+
+Маршрутизатор принимает обновления Telegram и пересылает их воркеру по chat_id
+(chat_id % число воркеров), поэтому все сообщения одного чата попадают в один
+процесс и его ChatScheduler. Обновления одного чата пересылаются строго по очереди;
+при ошибке воркера Telegram получает 502 на это обновление и на следующие за ним
+в очереди чата и повторит их доставку по порядку. История диалога
+хранится в общем FSM_STORAGE (sqlite на одном сервере, redis на нескольких).
+
+|
+
+Webhook mode: several bot worker processes behind an update router.
+
+The router accepts Telegram updates and forwards each one to a worker chosen by
+chat_id (chat_id % worker count), so all messages of a chat reach the same process
+and its ChatScheduler. Updates of one chat are forwarded strictly in order; when a
+worker fails, Telegram gets 502 for that update and for the ones queued after it in
+the chat, and redelivers them in order. Conversation history lives in the
+shared FSM_STORAGE (sqlite on one node, redis across nodes).
+
+    # Маршрутизатор и 4 воркера на одном сервере | Router and 4 workers on one node
+    FSM_STORAGE=sqlite python webhook.py --workers 4 --port 8443
+
+    # Воркеры на разных серверах | Workers on different nodes
+    FSM_STORAGE=redis python webhook.py --role worker --port 9200
+    python webhook.py --role router --port 8443 --worker-url http://10.0.0.2:9200/webhook --worker-url http://10.0.0.3:9200/webhook
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector, web
+from dotenv import load_dotenv
+from yarl import URL
+
+load_dotenv()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Публичный URL для setWebhook (без него webhook не регистрируется) | Public URL for setWebhook (not registered without it)
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")  # Путь приёма обновлений | Update endpoint path
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Проверка заголовка X-Telegram-Bot-Api-Secret-Token | X-Telegram-Bot-Api-Secret-Token check
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # Параллельных доставок от Telegram | Concurrent deliveries from Telegram
+WEBHOOK_WORKER_PORT = int(os.getenv("WEBHOOK_WORKER_PORT", "9200"))  # Порт первого локального воркера | First local worker port
+FORWARD_TIMEOUT = 30  # Таймаут пересылки воркеру, с | Forwarding timeout, s
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def split_llm_limit(total: int, workers: int):
+    """
+    Делит общий лимит LLM_MAX_IN_FLIGHT между воркерами, чтобы N процессов вместе
+    не превышали его (каждому минимум 1). |
+    Splits the total LLM_MAX_IN_FLIGHT limit across workers so N processes together
+    do not exceed it (at least 1 each).
+    """
+    return [max(1, total // workers + (1 if i < total % workers else 0)) for i in range(workers)]
+
+
+def update_chat_id(update: dict):
+    """
+    Чат обновления: message/edited_message/channel_post/... – chat.id, callback_query –
+    чат исходного сообщения, остальные – id пользователя. None, если чата нет. |
+    The update's chat: message/edited_message/channel_post/... – chat.id, callback_query –
+    the chat of the original message, others – the user id. None if there is no chat.
+    """
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        if "chat" in value:
+            return value["chat"]["id"]
+        if isinstance(value.get("message"), dict) and "chat" in value["message"]:
+            return value["message"]["chat"]["id"]
+        if "from" in value:
+            return value["from"]["id"]
+    return None
+
+
+class UpdateRouter:
+    """
+    Пересылает обновления воркерам с привязкой чата к воркеру и сохранением порядка
+    внутри чата: пересылка следующего обновления чата ждёт предыдущую, а если та не
+    удалась – тоже не выполняется, чтобы не обогнать повторную доставку. |
+    Forwards updates to workers with chat-to-worker affinity and in-chat ordering:
+    forwarding the next update of a chat waits for the previous one and is skipped if
+    that one failed, so it does not overtake the redelivery.
+    """
+
+    def __init__(self, worker_urls, secret: str = WEBHOOK_SECRET):
+        self.worker_urls = list(worker_urls)
+        self.secret = secret
+        self.session = None
+        self.tails = {}  # chat_id -> последняя пересылка чата | the chat's last forwarding task
+        self.forwarded = [0] * len(self.worker_urls)
+        self.failed = 0
+
+    async def start(self, app):
+        self.session = ClientSession(timeout=ClientTimeout(total=FORWARD_TIMEOUT), connector=TCPConnector(limit=0))
+
+    async def close(self, app):
+        if self.tails:
+            await asyncio.wait(list(self.tails.values()))
+        await self.session.close()
+
+    def worker_for(self, chat_id: int) -> int:
+        return chat_id % len(self.worker_urls)
+
+    async def handle(self, request: web.Request):
+        if self.secret and request.headers.get(SECRET_HEADER) != self.secret:
+            return web.Response(status=401)
+        body = await request.read()
+        try:
+            update = json.loads(body)
+        except ValueError:
+            return web.Response(status=400, text="invalid JSON")
+        if not isinstance(update, dict):
+            return web.Response(status=400, text="update must be an object")
+        chat_id = update_chat_id(update)
+        # Без чата порядок не важен, воркер выбирается по update_id | Without a chat order does not matter, the worker is picked by update_id
+        worker = self.worker_for(chat_id if chat_id is not None else update.get("update_id", 0))
+
+        previous = self.tails.get(chat_id) if chat_id is not None else None
+        task = asyncio.create_task(self._forward(previous, worker, body))
+        if chat_id is not None:
+            self.tails[chat_id] = task
+            task.add_done_callback(lambda done, chat=chat_id: self._release(chat, done))
+        # shield: обрыв соединения с Telegram не должен рвать цепочку чата |
+        # shield: a dropped Telegram connection must not break the chat's chain
+        ok = await asyncio.shield(task)
+        return web.Response(status=200 if ok else 502)
+
+    def _release(self, chat_id, task):
+        if self.tails.get(chat_id) is task:
+            del self.tails[chat_id]
+
+    async def _forward(self, previous, worker: int, body: bytes) -> bool:
+        if previous is not None:
+            await asyncio.wait([previous])
+            if previous.cancelled() or previous.exception() is not None or not previous.result():
+                # Предыдущее обновление чата будет доставлено повторно – это тоже | The chat's previous update will be redelivered – so will this one
+                self.failed += 1
+                return False
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            headers[SECRET_HEADER] = self.secret
+        try:
+            async with self.session.post(self.worker_urls[worker], data=body, headers=headers) as response:
+                await response.read()
+                ok = response.status == 200
+        except (ClientError, asyncio.TimeoutError) as e:
+            print(f"Воркер {worker} недоступен | Worker {worker} is unavailable: {e}")
+            ok = False
+        if ok:
+            self.forwarded[worker] += 1
+        else:
+            self.failed += 1
+        return ok
+
+    async def healthz(self, request: web.Request):
+        # Готов, когда отвечают все воркеры | Ready when every worker responds
+        for url in self.worker_urls:
+            try:
+                async with self.session.get(URL(url).with_path("/healthz")) as response:
+                    if response.status != 200:
+                        return web.Response(status=503, text=f"{url}: {response.status}")
+            except (ClientError, asyncio.TimeoutError) as e:
+                return web.Response(status=503, text=f"{url}: {e}")
+        return web.Response(text="ok")
+
+    async def stats(self, request: web.Request):
+        return web.json_response({
+            "workers": len(self.worker_urls),
+            "forwarded": self.forwarded,
+            "failed": self.failed,
+            "chats_in_flight": len(self.tails),
+        })
+
+
+async def set_webhook(app):
+    """
+    Регистрирует WEBHOOK_URL в Telegram (если задан). |
+    Registers WEBHOOK_URL with Telegram (if set).
+    """
+    if not WEBHOOK_URL:
+        return
+    api = os.getenv("TELEGRAM_API_URL") or "https://api.telegram.org"
+    payload = {"url": WEBHOOK_URL, "max_connections": WEBHOOK_MAX_CONNECTIONS}
+    if WEBHOOK_SECRET:
+        payload["secret_token"] = WEBHOOK_SECRET
+    async with ClientSession() as session:
+        async with session.post(f"{api}/bot{os.getenv('CLS_BOT_TOKEN')}/setWebhook", json=payload) as response:
+            print(f"setWebhook: {await response.text()}")
+
+
+def router_app(worker_urls) -> web.Application:
+    router = UpdateRouter(worker_urls)
+    app = web.Application()
+    app["router"] = router
+    app.on_startup.append(router.start)
+    app.on_startup.append(set_webhook)
+    app.on_shutdown.append(router.close)
+    app.router.add_post(WEBHOOK_PATH, router.handle)
+    app.router.add_get("/healthz", router.healthz)
+    app.router.add_get("/stats", router.stats)
+    return app
+
+
+def run_worker(host: str, port: int, index: int = 0, llm_in_flight: int = None):
+    """
+    Один процесс бота, принимающий обновления по HTTP. Обработчик ставит сообщение
+    в очередь чата и сразу отвечает, поэтому обновления обрабатываются без фоновых
+    задач aiogram и в порядке поступления. |
+    One bot process receiving updates over HTTP. The handler queues the message per
+    chat and returns at once, so updates are processed without aiogram background
+    tasks and in arrival order.
+
+    llm_in_flight – доля общего лимита LLM для этого процесса (см. split_llm_limit). |
+    llm_in_flight is this process's share of the total LLM limit (see split_llm_limit).
+    """
+    # У каждого воркера свой порт /metrics | Every worker gets its own /metrics port
+    os.environ["METRICS_PORT"] = str(int(os.getenv("METRICS_PORT", "9101")) + index)
+    # Читается scheduler при импорте tg_bot | Read by scheduler when tg_bot is imported
+    if llm_in_flight is not None:
+        os.environ["LLM_MAX_IN_FLIGHT"] = str(llm_in_flight)
+
+    # Импорт в процессе воркера: клиенты и очереди создаются после fork |
+    # Imported in the worker process: clients and queues are created after fork
+    import tg_bot
+    from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+    async def healthz(request: web.Request):
+        return web.Response(text="ok")
+
+    async def close_page_cache(app):
+        tg_bot.page_cache.close()
+
+    app = web.Application()
+    # Сначала остановка диспетчера, потом закрытие сессии бота | Dispatcher shutdown first, then the bot session
+    setup_application(app, tg_bot.dp, bot=tg_bot.bot)
+    SimpleRequestHandler(
+        dispatcher=tg_bot.dp,
+        bot=tg_bot.bot,
+        secret_token=WEBHOOK_SECRET or None,
+        handle_in_background=False,
+    ).register(app, path=WEBHOOK_PATH)
+    app.router.add_get("/healthz", healthz)
+    app.on_cleanup.append(close_page_cache)
+    web.run_app(app, host=host, port=port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бот в режиме webhook | Bot in webhook mode")
+    parser.add_argument("--role", choices=["all", "router", "worker"], default="all",
+                        help="all – маршрутизатор и локальные воркеры | all – router and local workers")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--workers", type=int, default=2, help="Локальных воркеров (--role all) | Local workers (--role all)")
+    parser.add_argument("--worker-port", type=int, default=WEBHOOK_WORKER_PORT)
+    parser.add_argument("--worker-url", action="append", default=[],
+                        help="Адрес удалённого воркера (--role router), можно несколько | Remote worker URL (--role router), repeatable")
+    parser.add_argument("--llm-in-flight", type=int,
+                        help="--role worker: доля общего лимита LLM у этого воркера (по умолчанию LLM_MAX_IN_FLIGHT) | "
+                             "--role worker: this worker's share of the total LLM limit (LLM_MAX_IN_FLIGHT by default)")
+    args = parser.parse_args()
+
+    if args.role == "worker":
+        run_worker(args.host, args.port, llm_in_flight=args.llm_in_flight)
+    elif args.role == "router":
+        if not args.worker_url:
+            parser.error("--role router требует --worker-url | --role router requires --worker-url")
+        web.run_app(router_app(args.worker_url), host=args.host, port=args.port, access_log=None)
+    else:
+        # Воркеры слушают только localhost, снаружи доступен маршрутизатор |
+        # Workers listen on localhost only, the router is the public endpoint
+        # LLM_MAX_IN_FLIGHT остаётся общим лимитом на весь бот | LLM_MAX_IN_FLIGHT stays the limit for the whole bot
+        total_llm = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+        if total_llm < args.workers:
+            print(f"LLM_MAX_IN_FLIGHT={total_llm} меньше числа воркеров, каждому дан 1 слот | "
+                  f"LLM_MAX_IN_FLIGHT={total_llm} is below the worker count, each worker gets 1 slot")
+        context = multiprocessing.get_context("fork")
+        processes = [
+            context.Process(target=run_worker, args=("127.0.0.1", args.worker_port + i, i, limit))
+            for i, limit in enumerate(split_llm_limit(total_llm, args.workers))
+        ]
+        for process in processes:
+            process.start()
+        urls = [f"http://127.0.0.1:{args.worker_port + i}{WEBHOOK_PATH}" for i in range(args.workers)]
+        try:
+            web.run_app(router_app(urls), host=args.host, port=args.port, access_log=None)
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()